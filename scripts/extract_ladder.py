@@ -2,36 +2,109 @@ from __future__ import annotations
 
 import argparse
 import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import pdfplumber
 
+from digital_twin.geometry import PageGeometry, page_columns, page_record, write_page_npz
+from digital_twin.spatial_index import SpatialIndex, index_path
 
-def extract_pdf(src: Path, out_dir: Path, limit: int | None = None) -> dict:
+FORMATS = ("json", "npz")
+
+
+def parse_pages(spec: str) -> list[int]:
+    """Parse a page spec such as ``"1-5,8,10-12"`` into sorted 1-based page numbers."""
+    pages: set[int] = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(v) for v in part.split("-", 1))
+            pages.update(range(start, end + 1))
+        else:
+            pages.add(int(part))
+    if any(p < 1 for p in pages):
+        raise ValueError(f"Page numbers are 1-based: {spec!r}")
+    return sorted(pages)
+
+
+def extract_page(page, page_number: int, out_dir: Path, fmt: str = "json", index: bool = False) -> dict:
+    page_rec = page_record(page, page_number)
+    words, lines, rects = page_rec["words"], page_rec["lines"], page_rec["rects"]
+    page_path = out_dir / f"page_{page_number:03}.{fmt}"
+    if fmt == "npz":
+        write_page_npz(page_path, page_rec)
+    else:
+        page_path.write_text(json.dumps(page_rec, indent=2), encoding="utf-8")
+    if index:
+        SpatialIndex.build(PageGeometry(page_columns(page_rec))).save(index_path(page_path))
+    return {"page": page_number, "word_count": len(words), "line_count": len(lines), "rect_count": len(rects)}
+
+
+_worker_pdf = None
+
+
+def _open_worker_pdf(src: Path) -> None:
+    # Pool initializer: each worker process opens the PDF once and reuses it for every shard.
+    global _worker_pdf
+    _worker_pdf = pdfplumber.open(src)
+
+
+def extract_pages(pdf, out_dir: Path, pages: list[int], fmt: str = "json", index: bool = False) -> list[dict]:
+    results = []
+    for number in pages:
+        page = pdf.pages[number - 1]
+        results.append(extract_page(page, number, out_dir, fmt, index))
+        # Drop the parsed layout so long shards don't accumulate memory.
+        page.close()
+    return results
+
+
+def _extract_shard(out_dir: Path, pages: list[int], fmt: str, index: bool) -> list[dict]:
+    return extract_pages(_worker_pdf, out_dir, pages, fmt, index)
+
+
+def shard(pages: list[int], workers: int) -> list[list[int]]:
+    # Several contiguous chunks per worker keeps the pool busy when page cost varies.
+    size = max(1, -(-len(pages) // (workers * 4)))
+    return [pages[i:i + size] for i in range(0, len(pages), size)]
+
+
+def extract_pdf(src: Path,
+                out_dir: Path,
+                limit: int | None = None,
+                pages: list[int] | None = None,
+                workers: int = 1,
+                fmt: str = "json",
+                index: bool = False) -> dict:
     out_dir.mkdir(parents=True, exist_ok=True)
+    with pdfplumber.open(src) as pdf:
+        num_pages = len(pdf.pages)
+    if pages is None:
+        pages = list(range(1, num_pages + 1))
+    pages = [p for p in pages if p <= num_pages]
+    if limit:
+        pages = pages[:limit]
+
+    if workers <= 1 or len(pages) <= 1:
+        with pdfplumber.open(src) as pdf:
+            page_summaries = extract_pages(pdf, out_dir, pages, fmt, index)
+    else:
+        page_summaries = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_open_worker_pdf, initargs=(src,)) as pool:
+            futures = [pool.submit(_extract_shard, out_dir, chunk, fmt, index) for chunk in shard(pages, workers)]
+            for future in as_completed(futures):
+                page_summaries.extend(future.result())
+        page_summaries.sort(key=lambda rec: rec["page"])
+
     summary = {
         "source": str(src),
-        "pages": [],
+        "pages": page_summaries,
+        "num_pages": num_pages,
+        "format": fmt,
     }
-    with pdfplumber.open(src) as pdf:
-        num_pages = len(pdf.pages)
-        summary["num_pages"] = num_pages
-        for i, page in enumerate(pdf.pages, start=1):
-            if limit and i > limit:
-                break
-            words = page.extract_words(keep_blank_chars=False, use_text_flow=True)
-            lines = page.lines
-            rects = page.rects
-            page_rec = {
-                "page": i,
-                "width": page.width,
-                "height": page.height,
-                "words": words,
-                "lines": lines,
-                "rects": rects,
-            }
-            (out_dir / f"page_{i:03}.json").write_text(json.dumps(page_rec, indent=2), encoding="utf-8")
-            summary["pages"].append({"page": i, "word_count": len(words), "line_count": len(lines), "rect_count": len(rects)})
     (out_dir / "summary.json").write_text(json.dumps(summary, indent=2), encoding="utf-8")
     return summary
 
@@ -41,9 +114,13 @@ def main() -> None:
     parser.add_argument("pdf", type=Path, nargs="?", default=Path(__file__).resolve().parent.parent / "src/data/raw/1650/20251212T144026Z_01_SCHEMATIC_DIAGRAM_151-E8810-202-0.pdf")
     parser.add_argument("--out", type=Path, default=Path(__file__).resolve().parent.parent / "src/data/processed/1650")
     parser.add_argument("--limit", type=int, default=None, help="Optional page limit for sampling")
+    parser.add_argument("--pages", type=parse_pages, default=None, help="Pages to extract, e.g. 1-5,8,10-12 (default: all)")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes (default 1 = serial)")
+    parser.add_argument("--format", choices=FORMATS, default="json", help="Per-page output: indented JSON or columnar .npz")
+    parser.add_argument("--index", action="store_true", help="Also write a spatial index (page_NNN.sidx.npz) per page")
     args = parser.parse_args()
 
-    summary = extract_pdf(args.pdf, args.out, args.limit)
+    summary = extract_pdf(args.pdf, args.out, args.limit, pages=args.pages, workers=args.workers, fmt=args.format, index=args.index)
     print(json.dumps(summary, indent=2))
 
 
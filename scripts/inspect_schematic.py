@@ -2,58 +2,62 @@
 """
 Inspect electrical schematic pages - convert to images and analyze structure.
 This helps us understand what components/symbols we're dealing with.
+
+Pages are rasterized once into the shared tile cache (keyed by the PDF's
+SHA-256, page and DPI); later runs reuse the cached tiles.
 """
+import argparse
 from pathlib import Path
 import sys
 
-from pdf2image import convert_from_path
-from PIL import Image
+from digital_twin.blob_store import sha256_file
+from digital_twin.render_cache import RenderCache
 
-def extract_page_image(pdf_path: Path, page_num: int, output_dir: Path, dpi: int = 200):
-    """Convert a single PDF page to high-res image."""
-    output_dir.mkdir(parents=True, exist_ok=True)
-    
-    print(f"Converting page {page_num} at {dpi} DPI...")
-    images = convert_from_path(
-        pdf_path,
-        dpi=dpi,
-        first_page=page_num,
-        last_page=page_num,
-        fmt='png'
-    )
-    
-    if not images:
-        print(f"Failed to convert page {page_num}")
+
+def extract_page_image(cache: RenderCache, pdf_path: Path, doc_sha256: str, page_num: int,
+                       output_dir: Path | None = None, dpi: int = 200):
+    """Render a single PDF page into the cache; optionally export it as one PNG."""
+    meta = cache.ensure(pdf_path, doc_sha256, page_num, dpi)
+    full = meta["levels"][0]
+    print(f"Page {page_num} at {dpi} DPI: {full['width']}x{full['height']}, "
+          f"{len(meta['levels'])} levels, tiles in {cache.page_dir(doc_sha256, page_num, dpi)}")
+    if output_dir is None:
         return None
-    
-    img = images[0]
+
+    output_dir.mkdir(parents=True, exist_ok=True)
     output_path = output_dir / f"page_{page_num:03d}_dpi{dpi}.png"
-    img.save(output_path, 'PNG')
-    print(f"Saved: {output_path} ({img.width}x{img.height})")
+    cache.page_image(pdf_path, doc_sha256, page_num, dpi).save(output_path, 'PNG')
+    print(f"Saved: {output_path}")
     return output_path
 
 
 def main():
     workspace = Path(__file__).resolve().parent.parent
-    pdf_path = workspace / "src/data/raw/1650/20251212T144026Z_01_SCHEMATIC_DIAGRAM_151-E8810-202-0.pdf"
-    output_dir = workspace / "src/data/inspection"
-    
-    if not pdf_path.exists():
-        print(f"PDF not found: {pdf_path}")
+    parser = argparse.ArgumentParser(description="Rasterize sample schematic pages into the tile cache")
+    parser.add_argument("pdf", type=Path, nargs="?", default=workspace / "src/data/raw/1650/20251212T144026Z_01_SCHEMATIC_DIAGRAM_151-E8810-202-0.pdf")
+    # Page 1 is usually title/cover, so look at pages with actual ladder content.
+    parser.add_argument("--pages", type=int, nargs="+", default=[4, 10, 20])
+    parser.add_argument("--dpi", type=int, default=200)
+    parser.add_argument("--cache", type=Path, default=workspace / "src/data/cache/renders")
+    parser.add_argument("--export", type=Path, default=None, help="Also write whole-page PNGs to this directory")
+    parser.add_argument("--workers", type=int, default=1, help="Render processes for pages not yet cached")
+    args = parser.parse_args()
+
+    if not args.pdf.exists():
+        print(f"PDF not found: {args.pdf}")
         sys.exit(1)
-    
-    # Extract a few sample pages - let's look at pages with actual ladder content
-    # Page 1 is usually title/cover, so try 4, 10, 20
-    sample_pages = [4, 10, 20]
-    
-    print(f"Source PDF: {pdf_path}")
-    print(f"Output dir: {output_dir}\n")
-    
-    for page_num in sample_pages:
-        extract_page_image(pdf_path, page_num, output_dir, dpi=200)
-        print()
-    
-    print("Done! Check the images to identify:")
+
+    cache = RenderCache(args.cache, workers=args.workers)
+    doc_sha256 = sha256_file(args.pdf)
+    print(f"Source PDF: {args.pdf}")
+    print(f"Render cache: {args.cache}\n")
+
+    summary = cache.render_pages(args.pdf, doc_sha256, args.pages, args.dpi)
+    print(f"Rendered {summary['rendered']} page(s), {summary['cached']} already cached\n")
+    for page_num in args.pages:
+        extract_page_image(cache, args.pdf, doc_sha256, page_num, args.export, dpi=args.dpi)
+
+    print("\nDone! Check the images to identify:")
     print("  - Component symbols (relays, contactors, switches, motors)")
     print("  - Wire numbering scheme")
     print("  - Component designators (K1, S1, M1, F1, etc.)")
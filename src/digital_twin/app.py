@@ -1,56 +1,122 @@
 from __future__ import annotations
 
-import hashlib
+import asyncio
+import io
 import json
+import os
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 from uuid import uuid4
 
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
-from fastapi.responses import HTMLResponse, StreamingResponse
-
-from .config import get_gemini_api_key
+import anyio
+from fastapi import FastAPI, File, Form, Header, HTTPException, Query, UploadFile
+from fastapi.responses import FileResponse, HTMLResponse, Response, StreamingResponse
+from pydantic import BaseModel
+
+from .blob_store import BlobStore
+from .component_index import ComponentIndex
+from .crop_planner import plan_crops, region_candidates, render_crops
+from .config import (
+    get_gemini_api_key,
+    get_ingest_workers,
+    get_job_workers,
+    get_max_extraction_workers,
+    get_render_workers,
+    get_usage_budget,
+)
+from .extraction_cache import ExtractionCache
+from .geometry import PageGeometry, StaleGeometryError
+from .jobs import JobContext, JobManager
+from .netlist import EDGE_KINDS, NetlistGraph, build_netlist, iter_page_results, source_version
+from .page_slicer import PageSlicer
+from .pipeline import (
+    CANDIDATES_STAGE,
+    GEOMETRY_STAGE,
+    WIRES_STAGE,
+    Pipeline,
+    PipelineDocument,
+    PipelineManifest,
+    Stage,
+    StageContext,
+)
+from .record_store import RecordStore
+from .render_cache import DEFAULT_DPI, RenderCache
+from .search_index import SearchIndex
+from .text_extraction import candidates_from_pdf, extract_candidates, prompt_hint
+from .trace import TraceCache, start_nodes, trace
+from .usage_ledger import GROUP_COLUMNS, BudgetGuard, UsageBudget, UsageLedger
+from .wires import page_geometry_from_pdf, reconstruct_wires, validate_wires
 
 app = FastAPI(title="Digital Twin Document Intake", version="0.1.0")
 
 DATA_ROOT = Path(__file__).resolve().parent.parent / "data"
+# Legacy whole-file metadata; imported into the JSONL log on first start.
 METADATA_PATH = DATA_ROOT / "metadata.json"
-metadata_lock = threading.Lock()
+METADATA_LOG_PATH = DATA_ROOT / "metadata.jsonl"
+metadata_store = RecordStore(
+    METADATA_LOG_PATH,
+    index_fields=("machine_id", "sha256", "doc_category"),
+    legacy_json_path=METADATA_PATH,
+)
+blob_store = BlobStore(DATA_ROOT / "blobs")
+# CPU-heavy ingest work runs here so it can't exhaust the request threadpool.
+ingest_executor = ThreadPoolExecutor(max_workers=get_ingest_workers(), thread_name_prefix="ingest")
+extraction_cache = ExtractionCache(DATA_ROOT / "cache" / "extractions")
+page_slicer = PageSlicer(DATA_ROOT / "cache" / "pages")
+render_cache = RenderCache(DATA_ROOT / "cache" / "renders", workers=get_render_workers())
+search_index = SearchIndex(DATA_ROOT / "search" / "search.db")
+usage_ledger = UsageLedger(DATA_ROOT / "usage" / "usage.db")
+# Designator typeahead across every machine; filled on startup, updated per extracted page.
+component_index = ComponentIndex()
 
 
 def ensure_storage() -> None:
-    """Create storage directories and metadata file if missing."""
+    """Create storage directories if missing."""
     DATA_ROOT.mkdir(parents=True, exist_ok=True)
-    if not METADATA_PATH.exists():
-        METADATA_PATH.write_text("[]", encoding="utf-8")
 
 
-def load_metadata() -> List[dict]:
-    if not METADATA_PATH.exists():
-        return []
-    try:
-        with METADATA_PATH.open("r", encoding="utf-8") as fh:
-            return json.load(fh)
-    except json.JSONDecodeError as exc:
-        raise HTTPException(status_code=500, detail="Metadata file is not valid JSON.") from exc
+async def persist_upload(upload: UploadFile, machine_id: str, raw_dir: Path, timestamp: str) -> dict:
+    """Store an upload content-addressed and link it into the machine's raw_data.
 
+    If this machine already holds the same bytes under the same name, nothing
+    is written and the existing metadata record is returned as ``existing``.
+    Store lookups and linking (which may fall back to a full copy) run in a
+    worker thread so they never block the event loop.
+    """
+    safe_name = Path(upload.filename).name
+    sha256, size_bytes, blob_path, _ = await blob_store.ingest_async(upload)
+
+    def place() -> tuple[Path, Optional[dict]]:
+        existing = next(
+            (rec for rec in metadata_store.find(machine_id=machine_id, sha256=sha256)
+             if rec.get("original_name") == safe_name),
+            None,
+        )
+        if existing is not None:
+            dest_path = DATA_ROOT.parent / existing["stored_path"]
+            if not dest_path.exists():
+                blob_store.link(sha256, dest_path)
+        else:
+            dest_path = raw_dir / f"{timestamp}_{safe_name}"
+            if dest_path.exists() and not os.path.samefile(dest_path, blob_path):
+                dest_path = raw_dir / f"{timestamp}_{sha256[:12]}_{safe_name}"
+            blob_store.link(sha256, dest_path)
+        return dest_path, existing
 
-def save_metadata(records: List[dict]) -> None:
-    METADATA_PATH.write_text(json.dumps(records, indent=2), encoding="utf-8")
-
+    dest_path, existing = await anyio.to_thread.run_sync(place)
 
-def persist_upload(upload: UploadFile, dest_path: Path) -> tuple[str, int]:
-    """Stream upload to disk while computing SHA-256."""
-    hasher = hashlib.sha256()
-    bytes_written = 0
-    with dest_path.open("wb") as out:
-        for chunk in iter(lambda: upload.file.read(1024 * 1024), b""):
-            hasher.update(chunk)
-            out.write(chunk)
-            bytes_written += len(chunk)
-    return hasher.hexdigest(), bytes_written
+    return {
+        "safe_name": safe_name,
+        "dest_path": dest_path,
+        "blob_path": blob_path,
+        "sha256": sha256,
+        "size_bytes": size_bytes,
+        "existing": existing,
+    }
 
 
 def sse_event(event: str, data: dict) -> str:
@@ -148,6 +214,21 @@ def try_parse_contents_pdf(pdf_path: Path) -> Optional[dict]:
         return None
 
 
+def schedule_search_indexing(records: List[dict]) -> None:
+    """Index new documents' page text in the background; known SHA-256s are skipped."""
+    for record in records:
+        pdf_path = DATA_ROOT.parent / record["stored_path"]
+        if record.get("sha256") and pdf_path.suffix.lower() == ".pdf":
+            ingest_executor.submit(search_index.index_pdf, record["sha256"], pdf_path)
+
+
+async def parse_contents_pdf_async(pdf_path: Optional[Path]) -> Optional[dict]:
+    if pdf_path is None:
+        return None
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(ingest_executor, try_parse_contents_pdf, pdf_path)
+
+
 def detect_doc_category(filename: str, contents_map: Optional[dict]) -> str:
     name = (filename or "").upper()
     if "CONTENTS" in name or "MANUAL CONTENT" in name or "目次" in filename or "目 次" in filename:
@@ -191,6 +272,11 @@ def _startup() -> None:
     ensure_storage()
 
 
+@app.on_event("shutdown")
+def _shutdown_render_pool() -> None:
+    render_cache.close()
+
+
 @app.get("/health")
 def healthcheck() -> dict:
     return {"status": "ok"}
@@ -513,7 +599,7 @@ def root() -> HTMLResponse:
 
 
 @app.post("/upload")
-def upload_documents(
+async def upload_documents(
     files: List[UploadFile] = File(...),
     machine_label: str = Form(...),
 ) -> dict:
@@ -534,61 +620,58 @@ def upload_documents(
         if not file.filename:
             raise HTTPException(status_code=400, detail="Each upload must include a filename.")
 
-        safe_name = Path(file.filename).name
-        dest_path = raw_dir / f"{timestamp}_{safe_name}"
-        sha256, size_bytes = persist_upload(file, dest_path)
-        saved.append(
-            {
-                "safe_name": safe_name,
-                "dest_path": dest_path,
-                "sha256": sha256,
-                "size_bytes": size_bytes,
-            }
-        )
+        item = await persist_upload(file, machine_id, raw_dir, timestamp)
+        saved.append(item)
+        safe_name = item["safe_name"]
+        dest_path = item["dest_path"]
         upper = safe_name.upper()
         if contents_path is None and dest_path.suffix.lower() == ".pdf" and (
             "CONTENTS" in upper or "MANUAL CONTENT" in upper or "目次" in safe_name or "目 次" in safe_name
         ):
             contents_path = dest_path
 
-    contents_map = try_parse_contents_pdf(contents_path) if contents_path else None
+    contents_map = await parse_contents_pdf_async(contents_path)
 
     uploaded_records: List[dict] = []
-    with metadata_lock:
-        existing = load_metadata()
-
-        for item in saved:
-            safe_name = item["safe_name"]
-            dest_path: Path = item["dest_path"]
-            sha256 = item["sha256"]
-            size_bytes = item["size_bytes"]
-            doc_category = detect_doc_category(safe_name, contents_map)
-
-            record = {
-                "id": str(uuid4()),
-                "machine_id": machine_id,
-                "machine_label": machine_label,
-                "doc_category": doc_category,
-                "original_name": safe_name,
-                "stored_path": str(dest_path.relative_to(DATA_ROOT.parent)),
-                "sha256": sha256,
-                "size_bytes": size_bytes,
-                "uploaded_at": datetime.now(timezone.utc).isoformat(),
-                "status": "uploaded_raw",
-                "raw_dir": str(raw_dir.relative_to(DATA_ROOT.parent)),
-                "imported_dir": str(imported_dir.relative_to(DATA_ROOT.parent)),
-            }
+    new_records: List[dict] = []
+    for item in saved:
+        if item["existing"] is not None:
+            uploaded_records.append({**item["existing"], "duplicate": True})
+            continue
+
+        safe_name = item["safe_name"]
+        dest_path: Path = item["dest_path"]
+        sha256 = item["sha256"]
+        size_bytes = item["size_bytes"]
+        doc_category = detect_doc_category(safe_name, contents_map)
+
+        record = {
+            "id": str(uuid4()),
+            "machine_id": machine_id,
+            "machine_label": machine_label,
+            "doc_category": doc_category,
+            "original_name": safe_name,
+            "stored_path": str(dest_path.relative_to(DATA_ROOT.parent)),
+            "blob_path": str(item["blob_path"].relative_to(DATA_ROOT.parent)),
+            "sha256": sha256,
+            "size_bytes": size_bytes,
+            "uploaded_at": datetime.now(timezone.utc).isoformat(),
+            "status": "uploaded_raw",
+            "raw_dir": str(raw_dir.relative_to(DATA_ROOT.parent)),
+            "imported_dir": str(imported_dir.relative_to(DATA_ROOT.parent)),
+        }
 
-            existing.append(record)
-            uploaded_records.append(record)
+        new_records.append(record)
+        uploaded_records.append(record)
 
-        save_metadata(existing)
+    await anyio.to_thread.run_sync(metadata_store.put_many, new_records)
+    schedule_search_indexing(new_records)
 
     return {"uploaded": len(uploaded_records), "records": uploaded_records}
 
 
 @app.post("/upload/stream")
-def upload_documents_stream(
+async def upload_documents_stream(
     files: List[UploadFile] = File(...),
     machine_label: str = Form(...),
 ) -> StreamingResponse:
@@ -600,7 +683,7 @@ def upload_documents_stream(
     machine_id = normalize_machine_id(machine_label)
     raw_dir, imported_dir = get_machine_dirs(machine_id)
 
-    def event_stream():
+    async def event_stream():
         uploaded_count = 0
         timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
 
@@ -630,16 +713,9 @@ def upload_documents_stream(
             )
 
             try:
-                dest_path = raw_dir / f"{timestamp}_{safe_name}"
-                sha256, size_bytes = persist_upload(file, dest_path)
-                saved.append(
-                    {
-                        "safe_name": safe_name,
-                        "dest_path": dest_path,
-                        "sha256": sha256,
-                        "size_bytes": size_bytes,
-                    }
-                )
+                item = await persist_upload(file, machine_id, raw_dir, timestamp)
+                saved.append(item)
+                dest_path = item["dest_path"]
                 upper = safe_name.upper()
                 if contents_path is None and dest_path.suffix.lower() == ".pdf" and (
                     "CONTENTS" in upper or "MANUAL CONTENT" in upper or "目次" in safe_name or "目 次" in safe_name
@@ -655,10 +731,15 @@ def upload_documents_stream(
                     },
                 )
 
-        contents_map = try_parse_contents_pdf(contents_path) if contents_path else None
+        contents_map = await parse_contents_pdf_async(contents_path)
 
         # Second pass: append metadata and emit completion per file.
         for item in saved:
+            if item["existing"] is not None:
+                uploaded_count += 1
+                yield sse_event("file_completed", {**item["existing"], "duplicate": True})
+                continue
+
             safe_name = item["safe_name"]
             dest_path: Path = item["dest_path"]
             sha256 = item["sha256"]
@@ -672,6 +753,7 @@ def upload_documents_stream(
                 "doc_category": doc_category,
                 "original_name": safe_name,
                 "stored_path": str(dest_path.relative_to(DATA_ROOT.parent)),
+                "blob_path": str(item["blob_path"].relative_to(DATA_ROOT.parent)),
                 "sha256": sha256,
                 "size_bytes": size_bytes,
                 "uploaded_at": datetime.now(timezone.utc).isoformat(),
@@ -680,10 +762,8 @@ def upload_documents_stream(
                 "imported_dir": str(imported_dir.relative_to(DATA_ROOT.parent)),
             }
 
-            with metadata_lock:
-                existing = load_metadata()
-                existing.append(record)
-                save_metadata(existing)
+            await anyio.to_thread.run_sync(metadata_store.put, record)
+            schedule_search_indexing([record])
 
             uploaded_count += 1
             yield sse_event("file_completed", record)
@@ -698,12 +778,16 @@ def upload_documents_stream(
 
 
 @app.get("/files")
-def list_files(machine_id: Optional[str] = None) -> List[dict]:
+def list_files(
+    machine_id: Optional[str] = None,
+    doc_category: Optional[str] = None,
+    sha256: Optional[str] = None,
+) -> List[dict]:
     ensure_storage()
-    records = load_metadata()
-    if machine_id:
-        records = [rec for rec in records if rec.get("machine_id") == machine_id]
-    return records
+    try:
+        return metadata_store.find(machine_id=machine_id, doc_category=doc_category, sha256=sha256)
+    except ValueError as exc:
+        raise HTTPException(status_code=500, detail="Metadata file is not valid JSON.") from exc
 
 
 # ============================================================================
@@ -1121,21 +1205,30 @@ def gemini_status() -> dict:
     }
 
 
+def reference_paths() -> tuple[Path, Path, Path]:
+    """Legend image, reading instructions image and system instructions text."""
+    inspection = DATA_ROOT / "inspection"
+    return (
+        inspection / "legend.png",
+        inspection / "reading_instructions.png",
+        inspection / "system_instructions.txt",
+    )
+
+
 @app.post("/gemini/extract-sample")
 def extract_sample() -> dict:
     """Run a sample extraction on 2 random pages."""
     from .gemini_service import GeminiExtractor, StepLogger
     
     logger = StepLogger()
-    extractor = GeminiExtractor(logger=logger)
+    extractor = GeminiExtractor(logger=logger, result_cache=extraction_cache, page_slicer=page_slicer,
+                                usage_ledger=usage_ledger)
     
     # Paths to required files
     legacy_schematic_path = DATA_ROOT / "raw" / "1650" / "20251212T144026Z_01_SCHEMATIC_DIAGRAM_151-E8810-202-0.pdf"
     new_schematic_path = DATA_ROOT / "1650" / "raw_data" / "20251212T144026Z_01_SCHEMATIC_DIAGRAM_151-E8810-202-0.pdf"
     schematic_path = legacy_schematic_path if legacy_schematic_path.exists() else new_schematic_path
-    legend_path = DATA_ROOT / "inspection" / "legend.png"
-    reading_path = DATA_ROOT / "inspection" / "reading_instructions.png"
-    system_path = DATA_ROOT / "inspection" / "system_instructions.txt"
+    legend_path, reading_path, system_path = reference_paths()
     
     # Verify files exist
     missing = []
@@ -1165,3 +1258,741 @@ def extract_sample() -> dict:
     )
     
     return result
+
+
+@app.get("/documents/{doc_id}/pages/{page}/candidates")
+def page_candidates(doc_id: str, page: int) -> dict:
+    """Components, wire numbers and cross references read from the page's text layer."""
+    record = metadata_store.get(doc_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    stored = DATA_ROOT.parent / record["imported_dir"] / "candidates" / record["sha256"] / f"page_{page:03}.json"
+    if stored.exists():
+        return json.loads(stored.read_text(encoding="utf-8"))
+    pdf_path = DATA_ROOT.parent / record["stored_path"]
+    if not pdf_path.exists():
+        raise HTTPException(status_code=409, detail="Document file is missing from storage.")
+    try:
+        return candidates_from_pdf(pdf_path, page, record["sha256"])
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+
+
+@app.get("/documents/{doc_id}/pages/{page}/wires")
+def page_wires(doc_id: str, page: int) -> dict:
+    """Wire nets rebuilt from the page's line work, checked against any stored extraction."""
+    record = metadata_store.get(doc_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    stored = DATA_ROOT.parent / record["imported_dir"] / "wires" / record["sha256"] / f"page_{page:03}.json"
+    if stored.exists():
+        result = json.loads(stored.read_text(encoding="utf-8"))
+    else:
+        pdf_path = DATA_ROOT.parent / record["stored_path"]
+        if not pdf_path.exists():
+            raise HTTPException(status_code=409, detail="Document file is missing from storage.")
+        try:
+            geometry = page_geometry_from_pdf(pdf_path, page)
+        except ValueError as exc:
+            raise HTTPException(status_code=404, detail=str(exc)) from exc
+        result = reconstruct_wires(geometry, document=record["sha256"]).to_dict()
+    extraction_path = extraction_output_dir(record) / f"page_{page:03}.json"
+    if extraction_path.exists():
+        extracted = json.loads(extraction_path.read_text(encoding="utf-8"))
+        result["validation"] = validate_wires(result["wires"], extracted.get("parsed"))
+    return result
+
+
+# ============================================================================
+# BACKGROUND EXTRACTION JOBS
+# ============================================================================
+
+JOBS_ROOT = DATA_ROOT / "jobs"
+job_manager = JobManager(
+    RecordStore(JOBS_ROOT / "jobs.jsonl", index_fields=("status", "machine_id", "doc_id")),
+    events_dir=JOBS_ROOT / "events",
+    max_workers=get_job_workers(),
+)
+
+
+class ExtractionJobRequest(BaseModel):
+    doc_id: str
+    pages: Optional[List[int]] = None
+    max_workers: int = 4
+    text_prepass: bool = True
+    # Run even if the estimate exceeds today's budget, stopping once it is reached.
+    allow_partial: bool = False
+
+
+def extraction_output_dir(record: dict) -> Path:
+    """Where per-page extraction results for a stored document are kept."""
+    return DATA_ROOT.parent / record["imported_dir"] / "extractions" / record["sha256"]
+
+
+def run_extraction_job(ctx: JobContext,
+                       record: dict,
+                       pages: Optional[List[int]],
+                       max_workers: int,
+                       text_prepass: bool = True) -> dict:
+    from .gemini_service import GeminiExtractor, StepLogger, step_to_dict
+
+    logger = StepLogger(callback=lambda step: ctx.emit("step", step_to_dict(step)))
+    extractor = GeminiExtractor(logger=logger, result_cache=extraction_cache,
+                                page_slicer=page_slicer, text_prepass=text_prepass,
+                                usage_ledger=usage_ledger,
+                                usage_context={"machine_id": record["machine_id"], "doc_id": record["id"],
+                                               "job_id": ctx.job_id},
+                                on_record=lambda page, field, item, attempt: ctx.emit(
+                                    "record", {"page": page, "field": field, "item": item, "attempt": attempt}),
+                                on_reset=lambda page, attempt: ctx.emit(
+                                    "page_reset", {"page": page, "attempt": attempt}),
+                                work_dir=DATA_ROOT.parent / record["imported_dir"])
+    ctx.check_cancelled()
+    guard = budget_guard(record["machine_id"])
+    legend_path, reading_path, system_path = reference_paths()
+    out_dir = extraction_output_dir(record)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    completed = failed = 0
+    for result in extractor.run_batch_extraction(
+        schematic_path=DATA_ROOT.parent / record["stored_path"],
+        legend_path=legend_path,
+        reading_instructions_path=reading_path,
+        system_instructions_path=system_path,
+        pages=pages,
+        max_workers=max_workers,
+        doc_sha256=record["sha256"],
+        cancel_event=ctx.cancel_event,
+        budget=guard if guard.budget.limited else None,
+    ):
+        if "error" in result:
+            failed += 1
+        else:
+            completed += 1
+        if "error" not in result or result.get("parsed") is not None:
+            page_path = out_dir / f"page_{result['page']:03}.json"
+            page_path.write_text(json.dumps(result, ensure_ascii=False), encoding="utf-8")
+            component_index.update_page(record["machine_id"], record["id"], result["page"], result.get("parsed"))
+        ctx.update(progress={"completed": completed, "failed": failed})
+        ctx.emit("page", result)
+        # Pages already written stay on disk.
+        ctx.check_cancelled()
+
+    return {
+        "pages_completed": completed,
+        "pages_failed": failed,
+        "budget_stopped": extractor.budget_stopped,
+        "output_dir": str(out_dir.relative_to(DATA_ROOT.parent)),
+    }
+
+
+def extraction_budget_check(record: dict, pages: Optional[List[int]], text_prepass: bool) -> dict:
+    """Today's budget status for the machine with the job's uncached pages as planned spend."""
+    from .gemini_service import CACHE_MODEL, GeminiExtractor
+
+    pdf_path = DATA_ROOT.parent / record["stored_path"]
+    pages = list(pages) if pages is not None else list(range(1, render_cache.page_count(pdf_path, record["sha256"]) + 1))
+    hits = {}
+    _, _, system_path = reference_paths()
+    if system_path.exists():
+        extractor = GeminiExtractor(result_cache=extraction_cache, page_slicer=page_slicer,
+                                    text_prepass=text_prepass)
+        hits, _ = extractor.lookup_cached_pages(pdf_path, system_path, pages, record["sha256"])
+    uncached = len(pages) - len(hits)
+    per_page = usage_ledger.typical_call(record["machine_id"], "page", CACHE_MODEL)
+    status = usage_ledger.budget_status(record["machine_id"], usage_budget(),
+                                        planned_tokens=uncached * per_page["tokens"],
+                                        planned_cost_usd=uncached * per_page["cost_usd"])
+    return {**status, "pages": len(pages), "uncached_pages": uncached, "per_page": per_page}
+
+
+@app.post("/jobs")
+def create_job(request: ExtractionJobRequest) -> dict:
+    """Queue a background extraction of a stored document."""
+    record = metadata_store.get(request.doc_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    if not (DATA_ROOT.parent / record["stored_path"]).exists():
+        raise HTTPException(status_code=409, detail="Document file is missing from storage.")
+    estimate = None
+    if usage_budget().limited:
+        estimate = extraction_budget_check(record, request.pages, request.text_prepass)
+        if estimate["exhausted"] or (estimate["would_exceed"] and not request.allow_partial):
+            planned, remaining = estimate["planned"], estimate["remaining"]
+            left = ", ".join(part for part in (
+                f"{remaining['tokens']} tokens" if remaining["tokens"] is not None else "",
+                f"${remaining['cost_usd']:.4f}" if remaining["cost_usd"] is not None else "",
+            ) if part)
+            raise HTTPException(
+                status_code=429,
+                detail=(f"Machine {record['machine_id']} has {left} of today's usage budget left; "
+                        f"{estimate['uncached_pages']} uncached pages need about {planned['tokens']} tokens "
+                        f"(${planned['cost_usd']:.4f}). Pass allow_partial to run until the budget is reached."),
+            )
+    # Each job's page workers are threads of their own; keep one request from
+    # multiplying past what JOB_WORKERS is meant to bound.
+    max_workers = min(max(1, request.max_workers), get_max_extraction_workers())
+    return job_manager.submit(
+        "extraction",
+        lambda ctx: run_extraction_job(ctx, record, request.pages, max_workers, request.text_prepass),
+        machine_id=record["machine_id"],
+        doc_id=record["id"],
+        params={"pages": request.pages, "max_workers": max_workers,
+                "text_prepass": request.text_prepass, "allow_partial": request.allow_partial},
+        budget_estimate=estimate,
+        progress={"completed": 0, "failed": 0},
+    )
+
+
+@app.get("/jobs")
+def list_jobs(machine_id: Optional[str] = None, status: Optional[str] = None) -> List[dict]:
+    return job_manager.list(machine_id=machine_id, status=status)
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str) -> dict:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(
+    job_id: str,
+    after: int = 0,
+    last_event_id: Optional[str] = Header(default=None),
+) -> StreamingResponse:
+    """Stream a job's events (SSE); reconnecting clients resume via Last-Event-ID."""
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    if last_event_id and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+
+    async def event_stream():
+        seq = after
+        while True:
+            # Terminal events are emitted before the status flips, so reading
+            # the status first guarantees the final drain sees them.
+            active = job_manager.is_active(job_id)
+            events = job_manager.events_since(job_id, seq)
+            for entry in events:
+                seq = entry["seq"]
+                yield f"id: {seq}\n" + sse_event(entry["event"], entry["data"])
+            if not active:
+                break
+            if not events:
+                await asyncio.sleep(0.5)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/jobs/{job_id}/cancel")
+def cancel_job(job_id: str) -> dict:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return {"id": job_id, "cancelling": job_manager.cancel(job_id)}
+
+
+# ============================================================================
+# PAGE RENDERS
+# ============================================================================
+
+def stored_pdf(doc_id: str) -> tuple[dict, Path]:
+    record = metadata_store.get(doc_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Document not found.")
+    pdf_path = DATA_ROOT.parent / record["stored_path"]
+    if not pdf_path.exists():
+        raise HTTPException(status_code=409, detail="Document file is missing from storage.")
+    return record, pdf_path
+
+
+def check_render_dpi(dpi: int) -> None:
+    try:
+        render_cache.check_dpi(dpi)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+
+
+@app.get("/documents/{doc_id}/pages/{page}/tiles")
+def page_tiles(doc_id: str, page: int, dpi: int = DEFAULT_DPI) -> dict:
+    """Tile pyramid of the page; renders it on first request."""
+    check_render_dpi(dpi)
+    record, pdf_path = stored_pdf(doc_id)
+    try:
+        meta = render_cache.ensure(pdf_path, record["sha256"], page, dpi)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    return {**meta, "tile_url": f"/documents/{doc_id}/pages/{page}/tiles/{{level}}/{{column}}/{{row}}.png?dpi={dpi}"}
+
+
+@app.get("/documents/{doc_id}/pages/{page}/tiles/{level}/{column}/{row}.png")
+def page_tile(doc_id: str, page: int, level: int, column: int, row: int, dpi: int = DEFAULT_DPI) -> FileResponse:
+    check_render_dpi(dpi)
+    record, pdf_path = stored_pdf(doc_id)
+    try:
+        path = render_cache.tile_path(pdf_path, record["sha256"], page, level, column, row, dpi)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    # Tiles are keyed by content hash, so they never change.
+    return FileResponse(path, media_type="image/png", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
+def load_page_geometry(record: dict, pdf_path: Path, page: int) -> PageGeometry:
+    """Stored pipeline geometry for the page, or a fresh read of the PDF if none is current."""
+    stored = DATA_ROOT.parent / record["imported_dir"] / "geometry" / record["sha256"] / f"page_{page:03}.npz"
+    if stored.exists():
+        try:
+            return PageGeometry.open(stored)
+        except StaleGeometryError:
+            pass  # Rebuilt by the next pipeline run.
+    try:
+        return page_geometry_from_pdf(pdf_path, page)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+
+
+def page_crop_plan(doc_id: str, page: int, components: List[str]):
+    if not components:
+        raise HTTPException(status_code=400, detail="Give at least one component.")
+    record, pdf_path = stored_pdf(doc_id)
+    geometry = load_page_geometry(record, pdf_path, page)
+    candidates = extract_candidates(geometry, document=record["sha256"])
+    return record, pdf_path, candidates, plan_crops(geometry, components, candidates, document=record["sha256"])
+
+
+@app.get("/documents/{doc_id}/pages/{page}/crop-plan")
+def crop_plan(doc_id: str, page: int, component: List[str] = Query(default=[])) -> dict:
+    """Page regions around the components, located from the text layer and their wires."""
+    _, _, _, plan = page_crop_plan(doc_id, page, component)
+    return plan.to_dict()
+
+
+@app.get("/documents/{doc_id}/pages/{page}/crops/{index}.png")
+def crop_image(doc_id: str, page: int, index: int,
+               component: List[str] = Query(default=[]), dpi: int = DEFAULT_DPI) -> Response:
+    check_render_dpi(dpi)
+    record, pdf_path, _, plan = page_crop_plan(doc_id, page, component)
+    if not 0 <= index < len(plan.regions):
+        raise HTTPException(status_code=404, detail="No such crop.")
+    image = render_cache.crop(pdf_path, record["sha256"], page, plan.regions[index], dpi)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return Response(buffer.getvalue(), media_type="image/png")
+
+
+class RegionQuestion(BaseModel):
+    components: List[str]
+    question: Optional[str] = None
+    dpi: int = DEFAULT_DPI
+
+
+@app.post("/documents/{doc_id}/pages/{page}/ask")
+def ask_about_components(doc_id: str, page: int, request: RegionQuestion) -> dict:
+    """Send only crops around the components to the model, with the question."""
+    from .gemini_service import GeminiExtractor, StepLogger, region_prompt
+
+    check_render_dpi(request.dpi)
+    record, pdf_path, candidates, plan = page_crop_plan(doc_id, page, request.components)
+    if not plan.regions:
+        raise HTTPException(status_code=404, detail=f"Not on page {page}: {', '.join(plan.missing)}.")
+    images = render_crops(render_cache, pdf_path, record["sha256"], plan, request.dpi)
+    described = plan.to_dict()
+    prompt = region_prompt(page, described["regions"], request.question)
+    prompt += prompt_hint(region_candidates(candidates, plan))
+
+    logger = StepLogger()
+    extractor = GeminiExtractor(logger=logger, result_cache=extraction_cache, page_slicer=page_slicer,
+                                usage_ledger=usage_ledger,
+                                usage_context={"machine_id": record["machine_id"], "doc_id": record["id"]})
+    guard = budget_guard(record["machine_id"])
+    legend_path, reading_path, system_path = reference_paths()
+    result = extractor.extract_regions(
+        pdf_path, legend_path, reading_path, system_path, page, images, prompt, doc_sha256=record["sha256"],
+        budget=guard if guard.budget.limited else None,
+    )
+    if result.get("budget_exceeded"):
+        raise HTTPException(status_code=429, detail=result["error"])
+    return {
+        "plan": described,
+        "image_bytes": sum(len(image) for image in images),
+        "result": result,
+        "steps": logger.get_all_steps(),
+    }
+
+
+class RenderJobRequest(BaseModel):
+    pages: Optional[List[int]] = None
+    dpi: int = DEFAULT_DPI
+
+
+@app.post("/documents/{doc_id}/renders")
+def render_document(doc_id: str, request: RenderJobRequest) -> dict:
+    """Queue rasterizing the document's pages (default: all) into the tile cache."""
+    check_render_dpi(request.dpi)
+    record, pdf_path = stored_pdf(doc_id)
+
+    def run(ctx: JobContext) -> dict:
+        done = []
+
+        def on_page(page: int) -> None:
+            done.append(page)
+            ctx.update(progress={"rendered": len(done)})
+            ctx.emit("page", {"page": page})
+            # Raising here makes render_pages cancel the pages still queued.
+            ctx.check_cancelled()
+
+        return render_cache.render_pages(pdf_path, record["sha256"], request.pages, request.dpi, on_page=on_page)
+
+    return job_manager.submit(
+        "render",
+        run,
+        machine_id=record["machine_id"],
+        doc_id=record["id"],
+        params={"pages": request.pages, "dpi": request.dpi},
+        progress={"rendered": 0},
+    )
+
+
+# ============================================================================
+# NETLIST
+# ============================================================================
+
+# machine_id -> graph, loaded from disk on startup and replaced on rebuild.
+netlists: Dict[str, NetlistGraph] = {}
+
+
+def netlist_path(machine_id: str) -> Path:
+    return DATA_ROOT / machine_id / "netlist" / "netlist.npz"
+
+
+def netlist_sources(machine_id: str) -> List[tuple[str, Path]]:
+    """``(sha256, extraction dir)`` for each of the machine's documents with stored results."""
+    sources = {}
+    for record in metadata_store.find(machine_id=machine_id):
+        if record.get("sha256") in sources:
+            continue
+        directory = extraction_output_dir(record)
+        if directory.is_dir():
+            sources[record["sha256"]] = directory
+    return sorted(sources.items())
+
+
+def get_netlist(machine_id: str) -> Optional[NetlistGraph]:
+    graph = netlists.get(machine_id)
+    if graph is None and netlist_path(machine_id).exists():
+        graph = netlists[machine_id] = NetlistGraph.load(netlist_path(machine_id))
+    return graph
+
+
+@app.on_event("startup")
+def _load_netlists() -> None:
+    for path in DATA_ROOT.glob("*/netlist/netlist.npz"):
+        try:
+            netlists[path.parent.parent.name] = NetlistGraph.load(path)
+        except (OSError, ValueError, KeyError):
+            continue
+
+
+@app.post("/machines/{machine_id}/netlist")
+def rebuild_netlist(machine_id: str) -> dict:
+    """Merge every stored page extraction of the machine into one netlist."""
+    sources = netlist_sources(machine_id)
+    if not sources:
+        raise HTTPException(status_code=404, detail="No extraction results for this machine.")
+    graph = build_netlist(sources)
+    # Release the mapped graph first: Windows cannot replace a mapped file.
+    netlists.pop(machine_id, None)
+    graph.save(netlist_path(machine_id))
+    netlists[machine_id] = NetlistGraph.load(netlist_path(machine_id))
+    return graph.stats()
+
+
+@app.get("/machines/{machine_id}/netlist")
+def netlist_stats(machine_id: str) -> dict:
+    graph = get_netlist(machine_id)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="No netlist built for this machine.")
+    return graph.stats()
+
+
+trace_cache = TraceCache()
+
+
+@app.get("/machines/{machine_id}/trace")
+def trace_circuit(
+    machine_id: str,
+    component: List[str] = Query(default=[]),
+    wire: List[str] = Query(default=[]),
+    depth: int = Query(default=3, ge=1, le=12),
+    via: Optional[str] = Query(default=None, description="Comma-separated edge kinds: wire,located,xref"),
+    max_nodes: int = Query(default=500, ge=1, le=20000),
+) -> dict:
+    """Trace outward from components and/or wire numbers through the machine's netlist."""
+    if not component and not wire:
+        raise HTTPException(status_code=400, detail="Give at least one component or wire.")
+    graph = get_netlist(machine_id)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="No netlist built for this machine.")
+    edge_kinds = tuple(sorted(k.strip() for k in via.split(",") if k.strip())) if via else None
+    if edge_kinds and not set(edge_kinds) <= set(EDGE_KINDS):
+        raise HTTPException(status_code=400, detail=f"Unknown edge kind; expected {', '.join(EDGE_KINDS)}.")
+    nodes, missing = start_nodes(graph, component, wire)
+    if not nodes:
+        raise HTTPException(status_code=404, detail=f"Not in netlist: {', '.join(missing)}.")
+
+    started = time.perf_counter()
+    key = (machine_id, graph.version, tuple(nodes), depth, edge_kinds, max_nodes)
+    result = trace_cache.get(key)
+    cached = result is not None
+    if result is None:
+        result = trace(graph, nodes, max_depth=depth, edge_kinds=edge_kinds, max_nodes=max_nodes)
+        trace_cache.put(key, result)
+    return {
+        **result,
+        "missing": missing,
+        "cached": cached,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
+# ============================================================================
+# COMPONENT INDEX
+# ============================================================================
+
+@app.on_event("startup")
+def _load_component_index() -> None:
+    for record in metadata_store.all():
+        if not record.get("sha256") or not record.get("imported_dir"):
+            continue
+        directory = extraction_output_dir(record)
+        if directory.is_dir():
+            for page, parsed in iter_page_results(directory):
+                component_index.update_page(record["machine_id"], record["id"], page, parsed)
+
+
+@app.get("/components/search")
+def search_components(
+    q: str = Query(..., min_length=1),
+    machine_id: Optional[str] = None,
+    limit: int = Query(default=20, ge=1, le=200),
+) -> dict:
+    """Typeahead over designators: prefix matches first, then fuzzy matches."""
+    return {"query": q, "results": component_index.search(q, limit=limit, machine_id=machine_id)}
+
+
+@app.get("/components/{designator}")
+def get_component(designator: str, machine_id: Optional[str] = None) -> dict:
+    result = component_index.lookup(designator, machine_id=machine_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Component not found.")
+    return result
+
+
+# ============================================================================
+# FULL-TEXT SEARCH
+# ============================================================================
+
+@app.on_event("startup")
+def _index_unsearched_documents() -> None:
+    # Catch up on uploads from before the index existed; runs in the background.
+    schedule_search_indexing(metadata_store.all())
+
+
+@app.get("/search")
+def search_documents(
+    q: str = Query(..., min_length=1),
+    machine_id: Optional[str] = None,
+    limit: int = Query(default=20, ge=1, le=100),
+) -> dict:
+    """Rank manual pages by BM25 and return a highlighted snippet for each hit."""
+    records = metadata_store.find(machine_id=machine_id) if machine_id else metadata_store.all()
+    by_sha: Dict[str, List[dict]] = {}
+    for record in records:
+        if record.get("sha256"):
+            by_sha.setdefault(record["sha256"], []).append(record)
+    hits = search_index.search(q, limit=limit, sha256s=list(by_sha) if machine_id else None)
+    results = []
+    for hit in hits:
+        documents = [
+            {"doc_id": r["id"], "machine_id": r["machine_id"], "original_name": r["original_name"],
+             "doc_category": r.get("doc_category")}
+            for r in by_sha.get(hit["sha256"], [])
+        ]
+        results.append({**hit, "documents": documents})
+    return {"query": q, "results": results}
+
+
+# ============================================================================
+# PROCESSING PIPELINE
+# ============================================================================
+
+def run_search_stage(ctx: StageContext) -> List[Path]:
+    # Uploads index new documents right away; only a version bump re-indexes.
+    search_index.index_pdf(ctx.document.sha256, ctx.document.pdf_path, replace=ctx.previous is not None)
+    return []
+
+
+def netlist_fingerprint(ctx: StageContext) -> str:
+    return source_version(d.stage_dir("extractions") for d in ctx.documents if d.stage_dir("extractions").is_dir())
+
+
+def run_netlist_stage(ctx: StageContext) -> List[Path]:
+    sources = [(d.sha256, d.stage_dir("extractions")) for d in ctx.documents if d.stage_dir("extractions").is_dir()]
+    if not sources:
+        return []
+    graph = build_netlist(sources)
+    netlists.pop(ctx.machine_id, None)
+    path = graph.save(netlist_path(ctx.machine_id))
+    netlists[ctx.machine_id] = NetlistGraph.load(path)
+    return [path]
+
+
+# Bump a stage's version when its output would change; only it and its dependents re-run.
+pipeline = Pipeline(
+    [
+        GEOMETRY_STAGE,
+        CANDIDATES_STAGE,
+        WIRES_STAGE,
+        # Search 2 also indexes single CJK characters.
+        Stage("search", version=2, run=run_search_stage),
+        # Built from Gemini extraction results, which jobs write outside the pipeline.
+        # Netlist 2 links page anchors to their line anchors.
+        Stage("netlist", version=2, run=run_netlist_stage, scope="machine", fingerprint=netlist_fingerprint),
+    ],
+    root=DATA_ROOT.parent,
+)
+
+
+def pipeline_manifest(machine_id: str) -> PipelineManifest:
+    return PipelineManifest(DATA_ROOT / machine_id / "pipeline" / "manifest.json")
+
+
+def pipeline_documents(machine_id: str) -> List[PipelineDocument]:
+    """One entry per distinct PDF of the machine; duplicate uploads share their outputs."""
+    documents: Dict[str, PipelineDocument] = {}
+    for record in metadata_store.find(machine_id=machine_id):
+        pdf_path = DATA_ROOT.parent / record["stored_path"]
+        if record.get("sha256") in documents or pdf_path.suffix.lower() != ".pdf" or not pdf_path.exists():
+            continue
+        documents[record["sha256"]] = PipelineDocument(
+            sha256=record["sha256"],
+            pdf_path=pdf_path,
+            work_dir=DATA_ROOT.parent / record["imported_dir"],
+        )
+    return [documents[sha] for sha in sorted(documents)]
+
+
+class PipelineRequest(BaseModel):
+    stages: Optional[List[str]] = None
+
+
+def check_stage_names(stages: Optional[List[str]]) -> None:
+    known = [stage.name for stage in pipeline.stages]
+    unknown = [name for name in stages or [] if name not in known]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown stage {', '.join(unknown)}; expected {', '.join(known)}.")
+
+
+@app.get("/machines/{machine_id}/pipeline")
+def pipeline_status(machine_id: str, stages: Optional[str] = None) -> dict:
+    """The machine's manifest and which stages a pipeline run would recompute."""
+    names = [name.strip() for name in stages.split(",") if name.strip()] if stages else None
+    check_stage_names(names)
+    manifest = pipeline_manifest(machine_id)
+    units = pipeline.plan(manifest, machine_id, DATA_ROOT / machine_id, pipeline_documents(machine_id), names)
+    plan = pipeline.describe(units)
+    return {
+        "machine_id": machine_id,
+        "stale": sum(1 for unit in plan if unit["status"] == "stale"),
+        "plan": plan,
+        "manifest": manifest.data,
+    }
+
+
+def run_pipeline_job(ctx: JobContext, machine_id: str, stages: Optional[List[str]]) -> dict:
+    def on_event(event: dict) -> None:
+        ctx.emit("stage", event)
+        ctx.check_cancelled()
+
+    return pipeline.run(pipeline_manifest(machine_id), machine_id, DATA_ROOT / machine_id,
+                        pipeline_documents(machine_id), stages, on_event=on_event)
+
+
+@app.post("/machines/{machine_id}/pipeline")
+def run_pipeline(machine_id: str, request: PipelineRequest) -> dict:
+    """Queue a pipeline run that recomputes only stale stages."""
+    check_stage_names(request.stages)
+    if not pipeline_documents(machine_id):
+        raise HTTPException(status_code=404, detail="No documents for this machine.")
+    if any(job["kind"] == "pipeline" for status in ("queued", "running")
+           for job in job_manager.list(machine_id=machine_id, status=status)):
+        raise HTTPException(status_code=409, detail="A pipeline run for this machine is already in progress.")
+    return job_manager.submit(
+        "pipeline",
+        lambda ctx: run_pipeline_job(ctx, machine_id, request.stages),
+        machine_id=machine_id,
+        params={"stages": request.stages},
+    )
+
+
+# ============================================================================
+# MODEL USAGE AND BUDGETS
+# ============================================================================
+
+def usage_budget() -> UsageBudget:
+    daily_tokens, daily_cost_usd = get_usage_budget()
+    return UsageBudget(daily_tokens=daily_tokens, daily_cost_usd=daily_cost_usd)
+
+
+budget_guards: Dict[str, BudgetGuard] = {}
+budget_guards_lock = threading.Lock()
+
+
+def budget_guard(machine_id: str) -> BudgetGuard:
+    """The machine's process-wide guard, so every job and request shares its reservations."""
+    with budget_guards_lock:
+        guard = budget_guards.get(machine_id)
+        if guard is None:
+            guard = budget_guards[machine_id] = BudgetGuard(usage_ledger, machine_id, usage_budget())
+        # Limits come from the environment and may change between calls.
+        guard.budget = usage_budget()
+        return guard
+
+
+@app.get("/usage")
+def usage_summary(
+    group_by: str = "machine,day,model",
+    machine_id: Optional[str] = None,
+    since: Optional[str] = Query(default=None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    until: Optional[str] = Query(default=None, pattern=r"^\d{4}-\d{2}-\d{2}$"),
+    model: Optional[str] = None,
+) -> dict:
+    """Token, cost and latency totals from the usage ledger, grouped by comma-separated keys."""
+    groups = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in groups if name not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown group(s): {', '.join(unknown)}. Use {', '.join(GROUP_COLUMNS)}.")
+    filters = {"machine_id": machine_id, "since": since, "until": until, "model": model}
+    totals = usage_ledger.summary((), **filters)
+    return {
+        "group_by": groups,
+        "rows": usage_ledger.summary(groups, **filters),
+        "totals": totals[0] if totals else None,
+    }
+
+
+@app.get("/machines/{machine_id}/usage/budget")
+def machine_budget(machine_id: str) -> dict:
+    """Today's spend against the configured daily budget (UTC day)."""
+    from .gemini_service import CACHE_MODEL
+
+    status = usage_ledger.budget_status(machine_id, usage_budget())
+    return {**status, "per_page": usage_ledger.typical_call(machine_id, "page", CACHE_MODEL)}
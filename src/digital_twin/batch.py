@@ -0,0 +1,130 @@
+"""Concurrency helpers for batch model calls: rate limiting, retry and fan-out."""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+RETRYABLE_STATUS = {408, 429}
+_SENTINEL = object()
+
+
+class RateLimiter:
+    """Token bucket shared by every thread calling the same model."""
+
+    def __init__(self, requests_per_minute: float, burst: Optional[int] = None):
+        self.burst = burst
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst or max(1, int(requests_per_minute // 10)))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, requests_per_minute: float) -> None:
+        """Change the refill rate in place; tokens already in the bucket are kept."""
+        with self._lock:
+            self.rate = requests_per_minute / 60.0
+            self.capacity = float(self.burst or max(1, int(requests_per_minute // 10)))
+            self.tokens = min(self.tokens, self.capacity)
+
+    def acquire(self) -> float:
+        """Block until a request may be sent; returns seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(model: str, requests_per_minute: float) -> RateLimiter:
+    """Process-wide limiter per model, so concurrent batches share one budget.
+
+    A different ``requests_per_minute`` updates the existing limiter rather
+    than replacing it, so callers already holding it stay in the same bucket.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(model)
+        if limiter is None:
+            limiter = _limiters[model] = RateLimiter(requests_per_minute)
+        elif limiter.rate != requests_per_minute / 60.0:
+            limiter.set_rate(requests_per_minute)
+        return limiter
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """429s, 5xx and transport timeouts are worth another attempt."""
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS or 500 <= code < 600
+    return isinstance(exc, (TimeoutError, ConnectionError))
+
+
+def call_with_retry(
+    fn: Callable[[], R],
+    max_attempts: int = 5,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0,
+    on_retry: Optional[Callable[[int, BaseException, float], None]] = None,
+) -> R:
+    """Call ``fn`` until it succeeds, backing off with full jitter between tries."""
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return fn()
+        except Exception as exc:
+            if attempt >= max_attempts or not is_retryable(exc):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            if on_retry:
+                on_retry(attempt, exc, delay)
+            time.sleep(delay)
+
+
+def run_bounded(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_workers: int = 4,
+) -> Iterator[Tuple[T, Optional[R], Optional[BaseException]]]:
+    """Run ``fn`` over ``items`` on at most ``max_workers`` threads.
+
+    Yields ``(item, result, error)`` as each call finishes rather than in
+    input order. Only ``max_workers`` calls are in flight at once, so closing
+    the generator early leaves no queued work behind.
+    """
+    pending: Dict[Future, T] = {}
+    iterator = iter(items)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="batch") as pool:
+        try:
+            for item in iterator:
+                pending[pool.submit(fn, item)] = item
+                if len(pending) >= max_workers:
+                    break
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    error = future.exception()
+                    yield item, (None if error else future.result()), error
+                    next_item = next(iterator, _SENTINEL)
+                    if next_item is not _SENTINEL:
+                        pending[pool.submit(fn, next_item)] = next_item
+        finally:
+            for future in pending:
+                future.cancel()
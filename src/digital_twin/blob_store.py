@@ -0,0 +1,142 @@
+"""Content-addressed storage for uploaded raw documents."""
+from __future__ import annotations
+
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from typing import BinaryIO, Protocol
+from uuid import uuid4
+
+import anyio
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def sha256_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class AsyncReadable(Protocol):
+    """The subset of ``fastapi.UploadFile`` used for async ingest."""
+
+    async def read(self, size: int = -1) -> bytes: ...
+
+    async def seek(self, offset: int) -> None: ...
+
+
+class BlobStore:
+    """Store each distinct file once, under ``<root>/<sha[:2]>/<sha>``.
+
+    Per-machine ``raw_data`` entries are hard links (or symlinks/copies where
+    links are unavailable) to the shared blob, so re-importing a manual set
+    costs a hash pass and a directory entry instead of another full copy.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.tmp_dir = root / "tmp"
+
+    def blob_path(self, sha256: str) -> Path:
+        return self.root / sha256[:2] / sha256
+
+    def has(self, sha256: str) -> bool:
+        return self.blob_path(sha256).exists()
+
+    def staging_path(self) -> Path:
+        """A fresh temp path on the same filesystem as the blobs."""
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        return self.tmp_dir / uuid4().hex
+
+    def commit(self, staging: Path, sha256: str) -> tuple[Path, bool]:
+        """Move a fully written staging file into place.
+
+        Returns the blob path and whether the blob was newly created; if an
+        identical blob landed concurrently the staging file is discarded.
+        """
+        target = self.blob_path(sha256)
+        if target.exists():
+            staging.unlink(missing_ok=True)
+            return target, False
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staging, target)
+        return target, True
+
+    def ingest(self, source: BinaryIO) -> tuple[str, int, Path, bool]:
+        """Hash a seekable stream and store it unless the blob already exists.
+
+        The hash is computed before anything is written, so a duplicate upload
+        never touches the disk. Returns ``(sha256, size, blob_path, created)``.
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+            size += len(chunk)
+        sha256 = hasher.hexdigest()
+        if self.has(sha256):
+            return sha256, size, self.blob_path(sha256), False
+
+        source.seek(0)
+        staging = self.staging_path()
+        try:
+            with staging.open("wb") as out:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    out.write(chunk)
+        except BaseException:
+            staging.unlink(missing_ok=True)
+            raise
+        blob, created = self.commit(staging, sha256)
+        return sha256, size, blob, created
+
+    async def ingest_async(self, source: AsyncReadable) -> tuple[str, int, Path, bool]:
+        """Async counterpart of :meth:`ingest` for request bodies.
+
+        Chunks are hashed as they arrive and written with ``anyio`` file I/O,
+        so a slow disk never blocks the event loop.
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        while chunk := await source.read(CHUNK_SIZE):
+            hasher.update(chunk)
+            size += len(chunk)
+        sha256 = hasher.hexdigest()
+        if self.has(sha256):
+            return sha256, size, self.blob_path(sha256), False
+
+        await source.seek(0)
+        staging = self.staging_path()
+        try:
+            async with await anyio.open_file(staging, "wb") as out:
+                while chunk := await source.read(CHUNK_SIZE):
+                    await out.write(chunk)
+        except BaseException:
+            staging.unlink(missing_ok=True)
+            raise
+        blob, created = self.commit(staging, sha256)
+        return sha256, size, blob, created
+
+    def link(self, sha256: str, dest_path: Path) -> Path:
+        """Expose a blob under a per-machine name.
+
+        Falls back from hard link to symlink to a plain copy, so the name is
+        always a readable file even on filesystems without link support.
+        """
+        blob = self.blob_path(sha256)
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        if dest_path.exists():
+            if os.path.samefile(dest_path, blob):
+                return dest_path
+            raise FileExistsError(f"{dest_path} already holds different content.")
+        try:
+            os.link(blob, dest_path)
+        except OSError:
+            try:
+                dest_path.symlink_to(blob.resolve())
+            except OSError:
+                shutil.copyfile(blob, dest_path)
+        return dest_path
@@ -0,0 +1,170 @@
+"""In-memory designator index with prefix and trigram fuzzy search."""
+from __future__ import annotations
+
+import bisect
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from .netlist import normalize_designator
+from .text_extraction import COMPONENT_TYPES, COMPONENT_RE
+
+SourceKey = Tuple[str, str, int]  # (machine_id, doc_id, page)
+
+
+def search_key(text: str) -> str:
+    """Fold a query or designator for matching: NFKC, upper case, no spaces or hyphens."""
+    return unicodedata.normalize("NFKC", text or "").upper().replace(" ", "").replace("-", "")
+
+
+def trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ComponentIndex:
+    """Where every designator appears, across machines, documents and pages.
+
+    Designators are kept in a sorted list for prefix lookups and in a trigram
+    posting map for fuzzy lookups. Pages are indexed as units:
+    :meth:`update_page` replaces whatever a page contributed before, so
+    re-extracting a page never leaves stale references behind.
+    """
+
+    def __init__(self):
+        self._refs: Dict[str, Dict[SourceKey, List[dict]]] = {}
+        self._sorted: List[str] = []
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._by_source: Dict[SourceKey, Set[str]] = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._refs)
+
+    def _add_key(self, key: str) -> None:
+        bisect.insort(self._sorted, key)
+        for gram in trigrams(key):
+            self._trigrams[gram].add(key)
+
+    def _drop_key(self, key: str) -> None:
+        del self._refs[key]
+        index = bisect.bisect_left(self._sorted, key)
+        if index < len(self._sorted) and self._sorted[index] == key:
+            del self._sorted[index]
+        for gram in trigrams(key):
+            postings = self._trigrams.get(gram)
+            if postings is not None:
+                postings.discard(key)
+                if not postings:
+                    del self._trigrams[gram]
+
+    def remove_source(self, machine_id: str, doc_id: str, page: int) -> None:
+        source = (machine_id, doc_id, page)
+        with self._lock:
+            for key in self._by_source.pop(source, ()):
+                by_source = self._refs.get(key)
+                if by_source is None:
+                    continue
+                by_source.pop(source, None)
+                if not by_source:
+                    self._drop_key(key)
+
+    def update_page(self, machine_id: str, doc_id: str, page: int, parsed: Optional[dict]) -> int:
+        """Replace the references contributed by one page; returns how many were indexed."""
+        source = (machine_id, doc_id, page)
+        entries: Dict[str, List[dict]] = defaultdict(list)
+        for component in (parsed or {}).get("components") or []:
+            designator = normalize_designator(component.get("id"))
+            if not designator:
+                continue
+            match = COMPONENT_RE.match(designator)
+            prefix = match["prefix"] if match else None
+            entries[search_key(designator)].append({
+                "designator": designator,
+                "type": component.get("type") or COMPONENT_TYPES.get(prefix),
+                "machine_id": machine_id,
+                "doc_id": doc_id,
+                "page": page,
+                "grid_position": component.get("grid_position"),
+            })
+        with self._lock:
+            self.remove_source(machine_id, doc_id, page)
+            for key, refs in entries.items():
+                if key not in self._refs:
+                    self._refs[key] = {}
+                    self._add_key(key)
+                self._refs[key][source] = refs
+            if entries:
+                self._by_source[source] = set(entries)
+        return sum(len(refs) for refs in entries.values())
+
+    def _result(self, key: str, machine_id: Optional[str], score: float, match: str) -> Optional[dict]:
+        refs = [
+            ref
+            for source, source_refs in sorted(self._refs[key].items())
+            if machine_id is None or source[0] == machine_id
+            for ref in source_refs
+        ]
+        if not refs:
+            return None
+        return {
+            "designator": refs[0]["designator"],
+            "type": refs[0]["type"],
+            "match": match,
+            "score": round(score, 3),
+            "occurrences": len(refs),
+            "refs": refs,
+        }
+
+    def lookup(self, designator: str, machine_id: Optional[str] = None) -> Optional[dict]:
+        key = search_key(normalize_designator(designator) or "")
+        with self._lock:
+            if key not in self._refs:
+                return None
+            return self._result(key, machine_id, 1.0, "exact")
+
+    def search(self,
+               query: str,
+               limit: int = 20,
+               machine_id: Optional[str] = None,
+               min_score: float = 0.25) -> List[dict]:
+        """Prefix matches first (shortest designators first), then trigram fuzzy matches."""
+        key = search_key(query)
+        if not key:
+            return []
+        results: List[dict] = []
+        seen: Set[str] = set()
+        with self._lock:
+            start = bisect.bisect_left(self._sorted, key)
+            end = bisect.bisect_left(self._sorted, key + "\uffff")
+            for candidate in sorted(self._sorted[start:end], key=lambda k: (len(k), k)):
+                result = self._result(candidate, machine_id, 1.0 if candidate == key else 0.9, "prefix")
+                seen.add(candidate)
+                if result:
+                    results.append(result)
+                    if len(results) >= limit:
+                        return results
+
+            query_grams = trigrams(key)
+            shared: Dict[str, int] = defaultdict(int)
+            for gram in query_grams:
+                for candidate in self._trigrams.get(gram, ()):
+                    if candidate not in seen:
+                        shared[candidate] += 1
+            scored = []
+            for candidate, overlap in shared.items():
+                score = overlap / (len(query_grams) + len(trigrams(candidate)) - overlap)
+                if score >= min_score:
+                    scored.append((-score, candidate))
+            for negative_score, candidate in sorted(scored):
+                result = self._result(candidate, machine_id, -negative_score, "fuzzy")
+                if result:
+                    results.append(result)
+                    if len(results) >= limit:
+                        break
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"designators": len(self._refs), "pages": len(self._by_source)}
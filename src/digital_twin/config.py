@@ -19,3 +19,57 @@ if ENV_PATH.exists():
 def get_gemini_api_key() -> Optional[str]:
     """Return the Gemini API key from the environment, if set."""
     return os.getenv("GEMINI_API_KEY")
+
+
+def get_gemini_requests_per_minute() -> float:
+    """Per-model request budget shared by all batch extraction workers."""
+    return max(1.0, float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60")))
+
+
+def get_orphan_cache_max_age() -> float:
+    """Seconds since an untracked context cache was created or extended before it may be deleted."""
+    return max(0.0, float(os.getenv("ORPHAN_CACHE_MAX_AGE_HOURS", "6"))) * 3600
+
+
+def get_extraction_cache_limits() -> tuple[int, float]:
+    """(max bytes, max age in seconds) for the on-disk extraction result cache."""
+    max_mb = float(os.getenv("EXTRACTION_CACHE_MAX_MB", "512"))
+    max_age_days = float(os.getenv("EXTRACTION_CACHE_MAX_AGE_DAYS", "90"))
+    return int(max_mb * 1024 * 1024), max_age_days * 86400
+
+
+def get_job_workers() -> int:
+    """Background extraction jobs allowed to run at the same time."""
+    return max(1, int(os.getenv("JOB_WORKERS", "2")))
+
+
+def get_max_extraction_workers() -> int:
+    """Upper bound on the page workers one extraction job may request."""
+    return max(1, int(os.getenv("MAX_EXTRACTION_WORKERS", "8")))
+
+
+def get_ingest_workers() -> int:
+    """Worker threads reserved for CPU-heavy ingest work (PDF parsing)."""
+    return max(1, int(os.getenv("INGEST_WORKERS", "2")))
+
+
+def get_render_workers() -> int:
+    """Processes in the shared pool that rasterizes pages into the tile cache."""
+    return max(1, int(os.getenv("RENDER_WORKERS", "2")))
+
+
+def get_upload_buffer_bytes() -> int:
+    """Upper bound on upload bytes a single request holds in memory at once."""
+    return max(64 * 1024, int(os.getenv("UPLOAD_BUFFER_BYTES", str(1024 * 1024))))
+
+
+def get_max_concurrent_uploads() -> int:
+    """Upload requests allowed to stream to disk at the same time."""
+    return max(1, int(os.getenv("MAX_CONCURRENT_UPLOADS", "4")))
+
+
+def get_usage_budget() -> tuple[Optional[int], Optional[float]]:
+    """(tokens, USD) each machine may spend on model calls per UTC day; unset or 0 is unlimited."""
+    tokens = int(os.getenv("USAGE_DAILY_TOKEN_BUDGET", "0") or 0)
+    cost = float(os.getenv("USAGE_DAILY_COST_BUDGET_USD", "0") or 0)
+    return (tokens if tokens > 0 else None), (cost if cost > 0 else None)
@@ -0,0 +1,167 @@
+"""Plan tight page crops around components for targeted vision-model questions."""
+from __future__ import annotations
+
+import io
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .geometry import PageGeometry
+from .netlist import normalize_designator
+from .text_extraction import extract_candidates
+from .wires import WireGraph, reconstruct_wires
+
+# Context kept around a designator label, in points: enough for its symbol.
+SYMBOL_MARGIN = 36.0
+# How far attached wires may pull a crop beyond the symbol margin.
+WIRE_REACH = 120.0
+# Past this share of the page area, send the whole page instead.
+MAX_COVERAGE = 0.6
+
+
+def _union(a: Sequence[float], b: Sequence[float]) -> List[float]:
+    return [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+
+
+def _overlaps(a: Sequence[float], b: Sequence[float]) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _area(box: Sequence[float]) -> float:
+    return max(0.0, box[2] - box[0]) * max(0.0, box[3] - box[1])
+
+
+@dataclass
+class CropPlan:
+    """Regions of one page (``x0, top, x1, bottom`` in PDF points) covering the targets."""
+    page: int
+    page_size: tuple
+    targets: List[str]
+    regions: List[List[float]] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    # Target designators inside each region.
+    region_targets: List[List[str]] = field(default_factory=list)
+
+    @property
+    def coverage(self) -> float:
+        width, height = self.page_size
+        return sum(_area(r) for r in self.regions) / (width * height) if width and height else 0.0
+
+    @property
+    def whole_page(self) -> bool:
+        return len(self.regions) == 1 and self.regions[0] == [0.0, 0.0, *self.page_size]
+
+    def to_dict(self) -> dict:
+        return {
+            "page": self.page,
+            "page_size": list(self.page_size),
+            "targets": self.targets,
+            "missing": self.missing,
+            "regions": [
+                {"bbox": [round(v, 2) for v in region], "targets": targets}
+                for region, targets in zip(self.regions, self.region_targets)
+            ],
+            "coverage": round(self.coverage, 4),
+            "whole_page": self.whole_page,
+        }
+
+
+def plan_crops(page: PageGeometry,
+               designators: Sequence[str],
+               candidates: Optional[dict] = None,
+               wires: Optional[WireGraph] = None,
+               symbol_margin: float = SYMBOL_MARGIN,
+               wire_reach: float = WIRE_REACH,
+               max_coverage: float = MAX_COVERAGE,
+               document: Optional[str] = None) -> CropPlan:
+    """Crop regions around every text-layer occurrence of ``designators``.
+
+    Each occurrence starts as its label box padded by ``symbol_margin``.
+    Wire runs passing through that box extend it along the wire, up to
+    ``wire_reach`` further, so the crop shows where the component connects.
+    Overlapping regions merge; if they would cover more than
+    ``max_coverage`` of the page the plan falls back to the whole page.
+    """
+    if candidates is None:
+        candidates = extract_candidates(page, document=document)
+    targets = [d for d in (normalize_designator(d) for d in designators) if d]
+    plan = CropPlan(page=page.page, page_size=(page.width, page.height), targets=targets)
+
+    boxes: Dict[str, List[List[float]]] = {}
+    for component in candidates["components"]:
+        designator = normalize_designator(component["id"])
+        if designator in targets:
+            boxes.setdefault(designator, []).append(component["bbox"])
+    plan.missing = [d for d in targets if d not in boxes]
+    if not boxes:
+        return plan
+
+    if wires is None:
+        wires = reconstruct_wires(page, candidates, document=document)
+    segments = wires.segments
+    seg_boxes = np.column_stack([
+        np.minimum(segments[:, 0], segments[:, 2]), np.minimum(segments[:, 1], segments[:, 3]),
+        np.maximum(segments[:, 0], segments[:, 2]), np.maximum(segments[:, 1], segments[:, 3]),
+    ]) if len(segments) else np.empty((0, 4), dtype=np.float32)
+
+    regions: List[tuple] = []
+    for designator, label_boxes in boxes.items():
+        for x0, top, x1, bottom in label_boxes:
+            region = [x0 - symbol_margin, top - symbol_margin, x1 + symbol_margin, bottom + symbol_margin]
+            limit = [region[0] - wire_reach, region[1] - wire_reach, region[2] + wire_reach, region[3] + wire_reach]
+            touching = ((seg_boxes[:, 0] <= region[2]) & (seg_boxes[:, 2] >= region[0])
+                        & (seg_boxes[:, 1] <= region[3]) & (seg_boxes[:, 3] >= region[1]))
+            for sx0, stop, sx1, sbottom in seg_boxes[touching].tolist():
+                region = _union(region, [max(sx0, limit[0]), max(stop, limit[1]),
+                                         min(sx1, limit[2]), min(sbottom, limit[3])])
+            region = [max(0.0, region[0]), max(0.0, region[1]),
+                      min(page.width, region[2]), min(page.height, region[3])]
+            regions.append((region, {designator}))
+
+    # Merge until no two regions overlap; a merge can create new overlaps.
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                if _overlaps(regions[i][0], regions[j][0]):
+                    regions[i] = (_union(regions[i][0], regions[j][0]), regions[i][1] | regions[j][1])
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+
+    regions.sort(key=lambda item: (item[0][1], item[0][0]))
+    plan.regions = [[float(v) for v in region] for region, _ in regions]
+    plan.region_targets = [sorted(found) for _, found in regions]
+    if plan.coverage > max_coverage:
+        plan.regions = [[0.0, 0.0, float(page.width), float(page.height)]]
+        plan.region_targets = [sorted(boxes)]
+    return plan
+
+
+def region_candidates(candidates: dict, plan: CropPlan) -> dict:
+    """``candidates`` limited to items whose box centre falls inside a planned region."""
+    def inside(item: dict) -> bool:
+        x0, top, x1, bottom = item["bbox"]
+        cx, cy = (x0 + x1) / 2, (top + bottom) / 2
+        return any(r[0] <= cx <= r[2] and r[1] <= cy <= r[3] for r in plan.regions)
+
+    return {
+        **candidates,
+        "components": [c for c in candidates["components"] if inside(c)],
+        "wires": [w for w in candidates["wires"] if inside(w)],
+        "cross_references": [x for x in candidates["cross_references"] if inside(x)],
+    }
+
+
+def render_crops(render_cache, pdf_path, doc_sha256: str, plan: CropPlan, dpi: int) -> List[bytes]:
+    """PNG bytes for each planned region, cut from the cached page raster."""
+    images = []
+    for region in plan.regions:
+        buffer = io.BytesIO()
+        render_cache.crop(pdf_path, doc_sha256, plan.page, region, dpi).save(buffer, "PNG")
+        images.append(buffer.getvalue())
+    return images
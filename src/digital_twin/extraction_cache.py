@@ -0,0 +1,117 @@
+"""Disk-backed cache of page extraction results."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .config import get_extraction_cache_limits
+
+
+def prompt_fingerprint(prompt_template: str, system_instructions: str) -> str:
+    """Hash of everything in the prompt that is not page-specific."""
+    hasher = hashlib.sha256()
+    hasher.update(prompt_template.encode("utf-8"))
+    hasher.update(b"\0")
+    hasher.update(system_instructions.encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def make_cache_key(doc_sha256: str, page: int, prompt_hash: str, model: str) -> str:
+    return hashlib.sha256(f"{doc_sha256}:{page}:{prompt_hash}:{model}".encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """Extraction results stored as ``<root>/<key[:2]>/<key>.json``.
+
+    Keys cover the document hash, page, prompt fingerprint and model, so a
+    prompt tweak only invalidates the pages it actually changes. Entries older
+    than ``max_age_seconds`` are dropped on read; once the cache exceeds
+    ``max_bytes`` the least recently used entries are evicted.
+    """
+
+    def __init__(self, root: Path, max_bytes: Optional[int] = None, max_age_seconds: Optional[float] = None):
+        default_bytes, default_age = get_extraction_cache_limits()
+        self.root = root
+        self.max_bytes = max_bytes if max_bytes is not None else default_bytes
+        self.max_age_seconds = max_age_seconds if max_age_seconds is not None else default_age
+        self._lock = threading.Lock()
+        # key -> (size, last access); built lazily from the directory.
+        self._entries: Optional[Dict[str, Tuple[int, float]]] = None
+        self._total_bytes = 0
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def _load_entries(self) -> Dict[str, Tuple[int, float]]:
+        if self._entries is None:
+            self._entries = {}
+            self._total_bytes = 0
+            if self.root.exists():
+                for path in self.root.glob("*/*.json"):
+                    stat = path.stat()
+                    self._entries[path.stem] = (stat.st_size, stat.st_mtime)
+                    self._total_bytes += stat.st_size
+        return self._entries
+
+    def _drop(self, key: str) -> None:
+        size, _ = self._entries.pop(key, (0, 0.0))
+        self._total_bytes -= size
+        self._path(key).unlink(missing_ok=True)
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entries = self._load_entries()
+            if key not in entries:
+                return None
+            size, _ = entries[key]
+            path = self._path(key)
+            try:
+                if time.time() - path.stat().st_mtime > self.max_age_seconds:
+                    self._drop(key)
+                    return None
+                result = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                self._drop(key)
+                return None
+            entries[key] = (size, time.time())
+        return result
+
+    def put(self, key: str, result: dict) -> None:
+        payload = json.dumps(result, ensure_ascii=False)
+        path = self._path(key)
+        with self._lock:
+            entries = self._load_entries()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(payload, encoding="utf-8")
+            os.replace(tmp_path, path)
+            size = path.stat().st_size
+            previous, _ = entries.get(key, (0, 0.0))
+            entries[key] = (size, time.time())
+            self._total_bytes += size - previous
+            self._evict()
+
+    def _evict(self) -> None:
+        if self._total_bytes <= self.max_bytes:
+            return
+        now = time.time()
+        by_age = sorted(self._entries.items(), key=lambda item: item[1][1])
+        for key, (_, accessed) in by_age:
+            if self._total_bytes <= self.max_bytes and now - accessed <= self.max_age_seconds:
+                break
+            self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._load_entries()):
+                self._drop(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._load_entries()
+            return {"entries": len(entries), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
@@ -0,0 +1,231 @@
+"""Response schema for page extractions and an incremental parser for streamed answers."""
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Bump when the schema or normalization changes what a stored result means.
+SCHEMA_VERSION = 1
+LIST_FIELDS = ("components", "wires", "cross_references")
+# Parse outcomes; only complete ones are worth caching.
+COMPLETE_STATUSES = ("ok", "repaired")
+STATUS_RANK = {"invalid": 0, "partial": 1, "repaired": 2, "ok": 3}
+
+
+def _text(description: str, nullable: bool = False) -> dict:
+    field = {"type": "STRING", "description": description}
+    if nullable:
+        field["nullable"] = True
+    return field
+
+
+def _object(properties: Dict[str, dict], required: List[str]) -> dict:
+    return {"type": "OBJECT", "properties": properties, "required": required,
+            "property_ordering": list(properties)}
+
+
+GRID_POSITION = _text("Grid cell as col-row, e.g. 3-12", nullable=True)
+COMPONENT_SCHEMA = _object({
+    "id": _text("Designator exactly as printed, e.g. CR200"),
+    "type": _text("Symbol type from the legend", nullable=True),
+    "grid_position": GRID_POSITION,
+}, ["id"])
+WIRE_SCHEMA = _object({
+    "wire_number": _text("Wire number as printed"),
+    "from": _text("Designator at one end", nullable=True),
+    "to": _text("Designator at the other end", nullable=True),
+    "grid_position": GRID_POSITION,
+}, ["wire_number"])
+CROSS_REFERENCE_SCHEMA = _object({
+    "direction": {"type": "STRING", "enum": ["to", "from"]},
+    "page": {"type": "INTEGER", "description": "Referenced page"},
+    "line": {"type": "INTEGER", "description": "Referenced line", "nullable": True},
+    "grid_position": GRID_POSITION,
+}, ["page"])
+# Lists come after the scalars so a streamed answer starts yielding records early.
+EXTRACTION_SCHEMA = _object({
+    "page": {"type": "INTEGER"},
+    "title": _text("Page title if visible", nullable=True),
+    "components": {"type": "ARRAY", "items": COMPONENT_SCHEMA},
+    "wires": {"type": "ARRAY", "items": WIRE_SCHEMA},
+    "cross_references": {"type": "ARRAY", "items": CROSS_REFERENCE_SCHEMA},
+}, ["page", "components", "wires", "cross_references"])
+
+FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+
+
+def _strip_trailing_commas(text: str) -> str:
+    # String-aware, so commas inside quoted values survive.
+    out: List[str] = []
+    in_string = escape = False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+        out.append(ch)
+    return "".join(out)
+
+
+def parse_json(text: Optional[str]) -> Tuple[Any, bool]:
+    """``(value, repaired)``; strips code fences and trailing commas if plain parsing fails.
+
+    Returns ``(None, False)`` when the text cannot be made valid.
+    """
+    if not text:
+        return None, False
+    try:
+        return json.loads(text), False
+    except (json.JSONDecodeError, TypeError):
+        pass
+    try:
+        return json.loads(_strip_trailing_commas(FENCE_RE.sub("", text))), True
+    except json.JSONDecodeError:
+        return None, False
+
+
+def _as_text(value: Any) -> Optional[str]:
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _as_int(value: Any) -> Optional[int]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    match = re.search(r"\d+", str(value)) if value is not None else None
+    return int(match.group()) if match else None
+
+
+def normalize_item(field: str, item: Any) -> Optional[dict]:
+    """Coerce one list item to the schema's types; ``None`` if it lacks its required key."""
+    if not isinstance(item, dict):
+        return None
+    item = dict(item)
+    if "grid_position" in item:
+        item["grid_position"] = _as_text(item["grid_position"])
+    if field == "components":
+        item["id"] = _as_text(item.get("id"))
+        if "type" in item:
+            item["type"] = _as_text(item["type"])
+        return item if item["id"] else None
+    if field == "wires":
+        item["wire_number"] = _as_text(item.get("wire_number"))
+        for end in ("from", "to"):
+            if end in item:
+                item[end] = _as_text(item[end])
+        return item if item["wire_number"] else None
+    item["page"] = _as_int(item.get("page"))
+    if "line" in item:
+        item["line"] = _as_int(item["line"])
+    if isinstance(item.get("direction"), str):
+        item["direction"] = item["direction"].strip().lower()
+    return item if item["page"] is not None else None
+
+
+class ExtractionStream:
+    """Feed streamed response text; complete list items are parsed as soon as they close.
+
+    The scanner tracks only string/escape state and nesting depth, so each
+    chunk costs time proportional to its own length. An item is the
+    object between ``{`` and its matching ``}`` inside one of the top-level
+    ``LIST_FIELDS`` arrays; it is parsed (and repaired if needed) on its own,
+    so one bad item does not spoil the rest of the page.
+    """
+
+    def __init__(self, on_item: Optional[Callable[[str, dict], None]] = None):
+        self.on_item = on_item
+        self.text = ""
+        self.items: Dict[str, List[dict]] = {field: [] for field in LIST_FIELDS}
+        self.invalid: List[dict] = []
+        self.repaired = 0
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._key: Optional[str] = None
+        self._field: Optional[str] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> None:
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._key = text[self._string_start + 1:i]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 2 and ch == "[" and self._key in LIST_FIELDS:
+                    self._field = self._key
+                elif self._depth == 3 and ch == "{" and self._field:
+                    self._item_start = i
+            elif ch in "}]":
+                if self._depth == 3 and ch == "}" and self._item_start is not None:
+                    self._add_item(text[self._item_start:i + 1])
+                    self._item_start = None
+                elif self._depth == 2 and ch == "]":
+                    self._field = None
+                self._depth -= 1
+        self._pos = len(text)
+
+    def _add_item(self, fragment: str) -> None:
+        value, repaired = parse_json(fragment)
+        item = normalize_item(self._field, value)
+        if item is None:
+            self.invalid.append({"field": self._field, "fragment": fragment[:500]})
+            return
+        self.repaired += repaired
+        self.items[self._field].append(item)
+        if self.on_item:
+            self.on_item(self._field, item)
+
+    def finish(self, page_number: int) -> Tuple[Optional[dict], str]:
+        """``(parsed, status)`` for the whole response.
+
+        ``ok``: valid JSON matching the schema. ``repaired``: usable after
+        fixing syntax or dropping items that break the schema. ``partial``:
+        the response as a whole is unusable (e.g. cut off), so ``parsed``
+        holds only the items that streamed in complete. ``invalid``: nothing
+        usable.
+        """
+        value, repaired = parse_json(self.text)
+        if isinstance(value, dict):
+            parsed = dict(value)
+            dropped = 0
+            for field in LIST_FIELDS:
+                raw = parsed.get(field)
+                raw = raw if isinstance(raw, list) else []
+                parsed[field] = [item for item in (normalize_item(field, r) for r in raw) if item is not None]
+                dropped += len(raw) - len(parsed[field])
+            page = _as_int(parsed.get("page"))
+            parsed["page"] = page if page is not None else page_number
+            return parsed, "repaired" if repaired or dropped else "ok"
+        if any(self.items.values()):
+            return {"page": page_number, **{field: list(items) for field, items in self.items.items()}}, "partial"
+        return None, "invalid"
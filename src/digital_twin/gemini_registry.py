@@ -0,0 +1,188 @@
+"""Process-wide registry of Gemini file uploads and context caches."""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from google.genai import types
+
+from .blob_store import sha256_file
+
+# The Files API keeps uploads for 48 hours; stay well inside that.
+FILE_TTL_SECONDS = 46 * 3600
+
+
+def _expiry(value: Optional[datetime], fallback_seconds: float) -> float:
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return time.time() + fallback_seconds
+
+
+@dataclass
+class _FileEntry:
+    file: types.File
+    expires_at: float
+
+
+@dataclass
+class _CacheEntry:
+    cache: types.CachedContent
+    expires_at: float
+
+
+class GeminiResourceRegistry:
+    """Reuse uploaded files and live context caches across extractions.
+
+    Files are keyed by content SHA-256, caches by (model, system instruction
+    hash, uploaded file names). Handles close to expiry are refreshed (caches)
+    or re-uploaded (files) instead of being handed out. One registry serves
+    one API key; the app uses the process-wide instance from
+    :func:`get_registry`.
+    """
+
+    def __init__(self, refresh_margin_seconds: float = 300):
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self._files: Dict[str, _FileEntry] = {}
+        self._caches: Dict[Tuple[str, str, Tuple[str, ...]], _CacheEntry] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[object, threading.Lock] = {}
+        self._last_orphan_check = 0.0
+
+    def _key_lock(self, key: object) -> threading.Lock:
+        # Serialize work per key only, so unrelated uploads proceed in parallel.
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _fresh(self, expires_at: float) -> bool:
+        return expires_at - time.time() > self.refresh_margin_seconds
+
+    def get_file(self, client, file_path: Path, display_name: str) -> Tuple[types.File, bool]:
+        """Return an uploaded handle for ``file_path`` and whether it was reused."""
+        sha256 = sha256_file(file_path)
+        with self._key_lock(("file", sha256)):
+            entry = self._files.get(sha256)
+            if entry is not None and self._fresh(entry.expires_at):
+                return entry.file, True
+            uploaded = client.files.upload(file=str(file_path), config={"display_name": display_name})
+            entry = _FileEntry(
+                file=uploaded,
+                expires_at=_expiry(getattr(uploaded, "expiration_time", None), FILE_TTL_SECONDS),
+            )
+            with self._lock:
+                self._files[sha256] = entry
+            return uploaded, False
+
+    def get_cache(self,
+                  client,
+                  model: str,
+                  display_name: str,
+                  system_instruction: str,
+                  files: Sequence[types.File],
+                  ttl_seconds: int = 3600) -> Tuple[types.CachedContent, bool]:
+        """Return a live cache for this model/instructions/file set and whether it was reused.
+
+        A cached handle nearing expiry has its TTL extended rather than being
+        rebuilt; one that has already expired is replaced.
+        """
+        key = (
+            model,
+            hashlib.sha256(system_instruction.encode("utf-8")).hexdigest(),
+            tuple(f.name for f in files),
+        )
+        with self._key_lock(key):
+            entry = self._caches.get(key)
+            if entry is not None and entry.expires_at > time.time():
+                if not self._fresh(entry.expires_at):
+                    try:
+                        refreshed = client.caches.update(
+                            name=entry.cache.name,
+                            config=types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s"),
+                        )
+                        entry.cache = refreshed or entry.cache
+                        entry.expires_at = _expiry(getattr(refreshed, "expire_time", None), ttl_seconds)
+                    except Exception:
+                        entry = None
+                if entry is not None:
+                    return entry.cache, True
+
+            cache = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    display_name=display_name,
+                    system_instruction=system_instruction,
+                    contents=list(files),
+                    ttl=f"{ttl_seconds}s",
+                ),
+            )
+            entry = _CacheEntry(
+                cache=cache,
+                expires_at=_expiry(getattr(cache, "expire_time", None), ttl_seconds),
+            )
+            with self._lock:
+                self._caches[key] = entry
+            return cache, False
+
+    def purge_expired(self) -> None:
+        """Forget handles the API has already discarded."""
+        now = time.time()
+        with self._lock:
+            for entries in (self._files, self._caches):
+                for key in [k for k, e in entries.items() if e.expires_at <= now]:
+                    del entries[key]
+
+    def cleanup_orphans(self,
+                        client,
+                        display_prefix: str,
+                        max_age_seconds: float,
+                        min_interval_seconds: float = 0) -> List[str]:
+        """Delete stale server-side caches with our prefix that this registry does not track.
+
+        Untracked caches may belong to another worker process mid-batch, so
+        only those already expired or not created or extended within
+        ``max_age_seconds`` are deleted; caches of unknown age are left to
+        their TTL. Calls within ``min_interval_seconds`` of the previous
+        sweep are no-ops.
+        """
+        with self._lock:
+            if time.time() - self._last_orphan_check < min_interval_seconds:
+                return []
+            self._last_orphan_check = time.time()
+        self.purge_expired()
+        with self._lock:
+            tracked = {e.cache.name for e in self._caches.values()}
+        now = time.time()
+        deleted = []
+        for cache in client.caches.list():
+            name = getattr(cache, "name", None)
+            if not name or name in tracked:
+                continue
+            if not (getattr(cache, "display_name", None) or "").startswith(display_prefix):
+                continue
+            expire_time = getattr(cache, "expire_time", None)
+            touched = getattr(cache, "update_time", None) or getattr(cache, "create_time", None)
+            expired = isinstance(expire_time, datetime) and expire_time.timestamp() <= now
+            stale = isinstance(touched, datetime) and now - touched.timestamp() > max_age_seconds
+            if not (expired or stale):
+                continue
+            try:
+                client.caches.delete(name=name)
+                deleted.append(name)
+            except Exception:
+                continue
+        return deleted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"files": len(self._files), "caches": len(self._caches)}
+
+
+_registry = GeminiResourceRegistry()
+
+
+def get_registry() -> GeminiResourceRegistry:
+    return _registry
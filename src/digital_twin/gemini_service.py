@@ -1,18 +1,116 @@
 """Gemini API service for schematic extraction with step-by-step logging."""
 from __future__ import annotations
 
+import hashlib
 import time
 import random
+import threading
 from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Callable
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
 import json
 
 from google import genai
 from google.genai import types
 
-from .config import get_gemini_api_key
+from .batch import call_with_retry, get_rate_limiter, run_bounded
+from .blob_store import sha256_file
+from .config import get_gemini_api_key, get_gemini_requests_per_minute, get_orphan_cache_max_age
+from .extraction_cache import ExtractionCache, make_cache_key, prompt_fingerprint
+from .extraction_schema import (
+    COMPLETE_STATUSES,
+    EXTRACTION_SCHEMA,
+    LIST_FIELDS,
+    SCHEMA_VERSION,
+    STATUS_RANK,
+    ExtractionStream,
+)
+from .gemini_registry import GeminiResourceRegistry, get_registry
+from .page_slicer import PageSlicer
+from .geometry import PageGeometry, StaleGeometryError
+from .text_extraction import candidates_from_pdf, extract_candidates, prompt_hint
+from .usage_ledger import BudgetExceeded, BudgetGuard, UsageLedger
+
+CACHE_MODEL = "models/gemini-2.5-flash-001"  # Use specific version for caching
+CACHE_DISPLAY_PREFIX = "UBE-1650-Schematic-"
+
+EXTRACTION_PROMPT_TEMPLATE = """
+Analyze page {page_num} of the schematic.
+
+Extract all components and connections visible on this page. Return as JSON:
+
+{{
+  "page": {page_num},
+  "title": "page title if visible",
+  "components": [
+    {{"id": "component_id", "type": "from_legend", "grid_position": "col-row"}}
+  ],
+  "wires": [
+    {{"wire_number": "XXXX", "from": "component", "to": "component", "grid_position": "col-row"}}
+  ],
+  "cross_references": [
+    {{"direction": "to/from", "page": N, "line": N, "grid_position": "col-row"}}
+  ]
+}}
+"""
+
+# Used when only the single-page slice is attached instead of the whole PDF.
+PAGE_PROMPT_TEMPLATE = (
+    "The attached PDF contains only page {page_num} of the schematic; "
+    "use the cached legend and reading instructions to interpret it.\n"
+    + EXTRACTION_PROMPT_TEMPLATE
+)
+
+# Used for targeted questions where only crops around some components are sent.
+REGION_PROMPT_TEMPLATE = """
+The attached images are crops of page {page_num} of the schematic, not the whole page;
+use the cached legend and reading instructions to interpret them.
+{regions}
+{question}
+Return as JSON with the same structure as a full-page extraction, listing only what is visible in the crops:
+
+{{
+  "page": {page_num},
+  "components": [
+    {{"id": "component_id", "type": "from_legend", "grid_position": "col-row"}}
+  ],
+  "wires": [
+    {{"wire_number": "XXXX", "from": "component", "to": "component", "grid_position": "col-row"}}
+  ],
+  "cross_references": [
+    {{"direction": "to/from", "page": N, "line": N, "grid_position": "col-row"}}
+  ]
+}}
+"""
+DEFAULT_REGION_QUESTION = (
+    "Identify the target components and every wire and cross reference that connects to them."
+)
+
+# Appended when an answer was cut off or not valid JSON.
+REPAIR_PROMPT = (
+    "\nYour previous answer for this page was incomplete or not valid JSON. "
+    "Answer again with the complete JSON object only."
+)
+# Extra requests per page after an unusable answer.
+MAX_REPAIR_REQUESTS = 1
+# Part of every result-cache key, so answers from another schema are not reused.
+SCHEMA_MARKER = f"\n[schema-v{SCHEMA_VERSION}]"
+
+
+def region_prompt(page_number: int, regions: List[dict], question: Optional[str] = None) -> str:
+    """Prompt for :meth:`GeminiExtractor.extract_regions`; ``regions`` come from a crop plan."""
+    lines = []
+    for index, region in enumerate(regions, start=1):
+        x0, top, x1, bottom = region["bbox"]
+        lines.append(f"Image {index}: page area x {x0:.0f}-{x1:.0f}, y {top:.0f}-{bottom:.0f} pt; "
+                     f"targets: {', '.join(region['targets']) or 'none'}")
+    return REGION_PROMPT_TEMPLATE.format(
+        page_num=page_number,
+        regions="\n".join(lines),
+        question=question or DEFAULT_REGION_QUESTION,
+    )
 
 
 @dataclass
@@ -28,6 +126,17 @@ class ExtractionStep:
     details: dict = field(default_factory=dict)
 
 
+def step_to_dict(step: ExtractionStep) -> dict:
+    return {
+        "step": step.step_number,
+        "name": step.name,
+        "status": step.status,
+        "message": step.message,
+        "duration_ms": round(step.duration_ms, 2) if step.duration_ms else None,
+        "details": step.details
+    }
+
+
 class StepLogger:
     """Logs extraction steps and can notify callbacks."""
     
@@ -35,8 +144,16 @@ class StepLogger:
         self.steps: List[ExtractionStep] = []
         self.callback = callback
         self.step_counter = 0
+        self._lock = threading.Lock()
     
     def log(self, name: str, status: str, message: str = "", **details) -> ExtractionStep:
+        with self._lock:
+            step = self._record(name, status, message, details)
+        if self.callback:
+            self.callback(step)
+        return step
+    
+    def _record(self, name: str, status: str, message: str, details: dict) -> ExtractionStep:
         self.step_counter += 1
         step = ExtractionStep(
             step_number=self.step_counter,
@@ -49,46 +166,238 @@ class StepLogger:
             step.started_at = time.time()
         elif status in ("completed", "failed"):
             step.completed_at = time.time()
-            # Find matching running step to calculate duration
+            # Find matching running step to calculate duration; page steps run
+            # concurrently in batch mode, so match on the page as well.
+            page_number = details.get("page_number")
             for prev in reversed(self.steps):
-                if prev.name == name and prev.status == "running":
+                if (prev.name == name and prev.status == "running"
+                        and prev.details.get("page_number") == page_number):
                     step.started_at = prev.started_at
                     step.duration_ms = (step.completed_at - prev.started_at) * 1000
                     break
         
         self.steps.append(step)
-        if self.callback:
-            self.callback(step)
         return step
     
     def get_all_steps(self) -> List[dict]:
-        return [
-            {
-                "step": s.step_number,
-                "name": s.name,
-                "status": s.status,
-                "message": s.message,
-                "duration_ms": round(s.duration_ms, 2) if s.duration_ms else None,
-                "details": s.details
-            }
-            for s in self.steps
-        ]
+        with self._lock:
+            steps = list(self.steps)
+        return [step_to_dict(s) for s in steps]
 
 
 class GeminiExtractor:
     """Handles Gemini API interactions for schematic extraction."""
     
-    def __init__(self, logger: Optional[StepLogger] = None):
+    def __init__(self,
+                 logger: Optional[StepLogger] = None,
+                 client: Optional[genai.Client] = None,
+                 result_cache: Optional[ExtractionCache] = None,
+                 registry: Optional[GeminiResourceRegistry] = None,
+                 page_slicer: Optional[PageSlicer] = None,
+                 text_prepass: bool = False,
+                 usage_ledger: Optional[UsageLedger] = None,
+                 usage_context: Optional[dict] = None,
+                 on_record: Optional[Callable[[int, str, dict, int], None]] = None,
+                 on_reset: Optional[Callable[[int, int], None]] = None,
+                 work_dir: Optional[Path] = None):
         self.logger = logger or StepLogger()
-        self.client: Optional[genai.Client] = None
+        self.result_cache = result_cache
+        # Shared across extractors so uploads and caches outlive one request.
+        self.registry = registry or get_registry()
+        # A pre-built client (e.g. a local fake in tests) skips API key lookup.
+        self.client: Optional[genai.Client] = client
         self.cache: Optional[types.CachedContent] = None
         self.uploaded_files: dict = {}
+        # With a slicer, each request carries just its page instead of the whole PDF.
+        self.page_slicer = page_slicer
+        self.schematic_path: Optional[Path] = None
+        self.doc_sha256: Optional[str] = None
+        # Sent inline when the reference context is too small to cache.
+        self.reference_files: List[types.File] = []
+        self.system_instructions: Optional[str] = None
+        # Read designators and wire numbers from the PDF text layer first; they
+        # are passed to the model as hints and kept as a fallback on failure.
+        self.text_prepass = text_prepass
+        self._text_candidates: dict = {}
+        self._text_candidates_lock = threading.Lock()
+        self._text_candidate_page_locks: Dict[int, threading.Lock] = {}
+        # The document's pipeline output directory; its stored candidates and
+        # geometry are used instead of re-reading the PDF.
+        self.work_dir = work_dir
+        # Every model call (and result-cache hit) is written to the ledger,
+        # tagged with ``usage_context`` (machine_id, doc_id, job_id).
+        self.usage_ledger = usage_ledger
+        self.usage_context = usage_context or {}
+        # Called as ``on_record(page, field, item, attempt)`` for each list item
+        # as it streams in, before the page's response is complete. A page that
+        # is asked again first calls ``on_reset(page, attempt)``; the finished
+        # result's ``attempt`` says whose records were kept.
+        self.on_record = on_record
+        self.on_reset = on_reset
+        # Set by run_batch_extraction when the usage budget stopped the batch.
+        self.budget_stopped = False
+    
+    @property
+    def prompt_template(self) -> str:
+        return PAGE_PROMPT_TEMPLATE if self.page_slicer else EXTRACTION_PROMPT_TEMPLATE
+    
+    def _read_text_candidates(self, page_number: int) -> dict:
+        if self.work_dir is not None and self.doc_sha256:
+            name = f"page_{page_number:03}"
+            stored = self.work_dir / "candidates" / self.doc_sha256 / f"{name}.json"
+            if stored.exists():
+                return json.loads(stored.read_text(encoding="utf-8"))
+            geometry = self.work_dir / "geometry" / self.doc_sha256 / f"{name}.npz"
+            if geometry.exists():
+                try:
+                    return extract_candidates(PageGeometry.open(geometry), document=self.doc_sha256)
+                except StaleGeometryError:
+                    pass
+        return candidates_from_pdf(self.schematic_path, page_number, self.doc_sha256)
+    
+    def text_candidates(self, page_number: int) -> Optional[dict]:
+        """Text-layer candidates for ``page_number``, or None if unavailable.
+        
+        Prefers the pipeline's stored candidates, then its stored geometry,
+        and reads the PDF only for pages the pipeline has not processed.
+        """
+        if not self.text_prepass or self.schematic_path is None:
+            return None
+        # Batch workers ask concurrently; each page is read once, and only
+        # workers asking for the same page wait on each other.
+        with self._text_candidates_lock:
+            page_lock = self._text_candidate_page_locks.setdefault(page_number, threading.Lock())
+        with page_lock:
+            if page_number not in self._text_candidates:
+                try:
+                    self._text_candidates[page_number] = self._read_text_candidates(page_number)
+                except Exception as e:
+                    self._log("Text Prepass", "failed", str(e), page_number=page_number)
+                    self._text_candidates[page_number] = None
+            return self._text_candidates[page_number]
+    
+    def page_prompt(self, page_number: int) -> str:
+        prompt = self.prompt_template.format(page_num=page_number)
+        candidates = self.text_candidates(page_number)
+        if candidates:
+            prompt += prompt_hint(candidates)
+        return prompt
+    
+    def _model(self, use_cache: bool = True) -> str:
+        if use_cache and self.cache:
+            return self.cache.model
+        return CACHE_MODEL if self.reference_files else "gemini-2.5-pro"
+    
+    def page_file(self, page_number: int) -> types.File:
+        """Upload (or reuse) the single-page slice for ``page_number``."""
+        path = self.page_slicer.page_pdf(self.schematic_path, page_number, self.doc_sha256)
+        uploaded, _ = self.registry.get_file(self.client, path, f"page_{page_number:03}.pdf")
+        return uploaded
     
     def _log(self, name: str, status: str, message: str = "", **details):
         return self.logger.log(name, status, message, **details)
     
+    def _record_usage(self, entries: List[dict]) -> None:
+        if self.usage_ledger is None or not entries:
+            return
+        try:
+            self.usage_ledger.record_many(
+                {**self.usage_context, "doc_sha256": self.doc_sha256, **entry} for entry in entries
+            )
+        except Exception as e:
+            # Accounting must never fail an extraction.
+            self._log("Usage Ledger", "failed", str(e))
+    
+    def _record_cache_hits(self, pages: Iterable[int], kind: str) -> None:
+        self._record_usage([
+            {"page": page, "kind": kind, "model": CACHE_MODEL, "cache_hit": True} for page in pages
+        ])
+    
+    def _page_emitter(self, page_number: int, attempt: int) -> Optional[Callable[[str, dict], None]]:
+        """``on_record`` bound to one request for a page."""
+        if self.on_record is None:
+            return None
+        return lambda field, item: self.on_record(page_number, field, item, attempt)
+    
+    def _call_model(self, page_number: int, kind: str, model: str, contents, config,
+                    on_item: Optional[Callable[[str, dict], None]] = None) -> dict:
+        """One streamed model call, parsed as it arrives, timed and written to the usage ledger."""
+        started = time.perf_counter()
+        entry = {"page": page_number, "kind": kind, "model": model}
+        stream = ExtractionStream(on_item)
+        usage_metadata = None
+        try:
+            for chunk in self.client.models.generate_content_stream(model=model, contents=contents, config=config):
+                # Usage arrives with the final chunk.
+                usage_metadata = chunk.usage_metadata or usage_metadata
+                if chunk.text:
+                    stream.feed(chunk.text)
+        except Exception as e:
+            self._record_usage([{**entry, "status": "error", "error": str(e)[:500],
+                                 "latency_ms": (time.perf_counter() - started) * 1000}])
+            raise
+        result = self._parse_response(page_number, stream, usage_metadata)
+        self._record_usage([{**entry, **result["usage"], "latency_ms": (time.perf_counter() - started) * 1000}])
+        return result
+    
+    def _call_with_repair(self,
+                          page_number: int,
+                          kind: str,
+                          call: Callable[[str, Optional[Callable[[str, dict], None]]], dict],
+                          prompt: str,
+                          limiter=None,
+                          budget: Optional[BudgetGuard] = None,
+                          on_retry=None) -> dict:
+        """``call(prompt, on_item)`` with retries; re-request once more if the answer cannot be parsed.
+        
+        Every model call, repairs included, takes its own rate-limiter token
+        and budget reservation, and only the failing call is retried. If a
+        repair request fails or is refused, the first answer is kept;
+        otherwise the better answer wins, with token usage summed. Each call
+        streams its records under its own attempt number, and the result's
+        ``attempt`` names the call whose answer was kept.
+        """
+        attempts = 0
+        
+        def guarded(text: str) -> dict:
+            def attempt() -> dict:
+                nonlocal attempts
+                attempts += 1
+                number = attempts
+                if number > 1 and self.on_reset is not None:
+                    self.on_reset(page_number, number)
+                with budget.reserve(kind, self._model()) if budget else nullcontext():
+                    if limiter is not None:
+                        limiter.acquire()
+                    return {**call(text, self._page_emitter(page_number, number)), "attempt": number}
+            return call_with_retry(attempt, on_retry=on_retry)
+        
+        result = guarded(prompt)
+        for _ in range(MAX_REPAIR_REQUESTS):
+            if result["parse_status"] in COMPLETE_STATUSES:
+                break
+            self._log("Repair Request", "running",
+                     f"Page {page_number}: answer was {result['parse_status']}; asking again",
+                     page_number=page_number, invalid_fragments=len(result.get("invalid_fragments", [])))
+            try:
+                retry = guarded(prompt + REPAIR_PROMPT)
+            except Exception as e:
+                self._log("Repair Request", "failed", f"Page {page_number}: {e}; keeping the first answer",
+                         page_number=page_number)
+                break
+            usage = {name: (result["usage"][name] or 0) + (retry["usage"][name] or 0) for name in result["usage"]}
+            better = (STATUS_RANK[retry["parse_status"]], retry["record_count"]) >= \
+                (STATUS_RANK[result["parse_status"]], result["record_count"])
+            result = {**(retry if better else result), "usage": usage,
+                      "repair_requests": result.get("repair_requests", 0) + 1}
+        return result
+    
     def initialize_client(self) -> bool:
         """Initialize the Gemini client with API key."""
+        if self.client is not None:
+            self._log("Initialize Client", "completed", "Using provided client")
+            return True
+        
         self._log("Initialize Client", "running", "Loading API key from environment...")
         
         api_key = get_gemini_api_key()
@@ -111,13 +420,10 @@ class GeminiExtractor:
                  file_path=str(file_path), size_bytes=file_path.stat().st_size)
         
         try:
-            uploaded = self.client.files.upload(
-                file=str(file_path),
-                config={"display_name": display_name}
-            )
+            uploaded, reused = self.registry.get_file(self.client, file_path, display_name)
             self.uploaded_files[display_name] = uploaded
             self._log("Upload File", "completed", 
-                     f"Uploaded: {uploaded.name}",
+                     f"{'Reused' if reused else 'Uploaded'}: {uploaded.name}",
                      file_name=uploaded.name,
                      uri=uploaded.uri if hasattr(uploaded, 'uri') else None)
             return uploaded
@@ -137,17 +443,16 @@ class GeminiExtractor:
                  model=model, ttl_seconds=ttl_seconds)
         
         try:
-            self.cache = self.client.caches.create(
+            self.cache, reused = self.registry.get_cache(
+                self.client,
                 model=model,
-                config=types.CreateCachedContentConfig(
-                    display_name=display_name,
-                    system_instruction=system_instruction,
-                    contents=files,
-                    ttl=f"{ttl_seconds}s",
-                )
+                display_name=display_name,
+                system_instruction=system_instruction,
+                files=files,
+                ttl_seconds=ttl_seconds,
             )
             self._log("Create Cache", "completed",
-                     f"Cache created: {self.cache.name}",
+                     f"Cache {'reused' if reused else 'created'}: {self.cache.name}",
                      cache_name=self.cache.name,
                      expire_time=str(self.cache.expire_time) if hasattr(self.cache, 'expire_time') else None)
             return self.cache
@@ -155,6 +460,64 @@ class GeminiExtractor:
             self._log("Create Cache", "failed", str(e))
             return None
     
+    def _generate_page(self, page_number: int, prompt: str, use_cache: bool = True,
+                       on_item: Optional[Callable[[str, dict], None]] = None) -> dict:
+        """Call the model for one page; raises on API errors."""
+        config = {}
+        contents = [prompt]
+        if use_cache and self.cache:
+            config["cached_content"] = self.cache.name
+        elif self.reference_files:
+            config["system_instruction"] = self.system_instructions
+        
+        if self.page_slicer:
+            contents = [self.page_file(page_number), prompt]
+            if "cached_content" not in config:
+                contents = [*self.reference_files, *contents]
+        
+        # Request structured JSON output in the extraction schema
+        config["response_mime_type"] = "application/json"
+        config["response_schema"] = EXTRACTION_SCHEMA
+        
+        return self._call_model(page_number, "page", self._model(use_cache), contents,
+                                types.GenerateContentConfig(**config), on_item)
+    
+    def _generate_regions(self, page_number: int, images: List[bytes], prompt: str,
+                          use_cache: bool = True,
+                          on_item: Optional[Callable[[str, dict], None]] = None) -> dict:
+        """Call the model with cropped PNGs instead of the page; raises on API errors."""
+        config = {"response_mime_type": "application/json", "response_schema": EXTRACTION_SCHEMA}
+        parts = [types.Part.from_bytes(data=image, mime_type="image/png") for image in images]
+        if use_cache and self.cache:
+            config["cached_content"] = self.cache.name
+            contents = [*parts, prompt]
+        else:
+            if self.reference_files:
+                config["system_instruction"] = self.system_instructions
+            contents = [*self.reference_files, *parts, prompt]
+        return self._call_model(page_number, "region", self._model(use_cache), contents,
+                                types.GenerateContentConfig(**config), on_item)
+    
+    @staticmethod
+    def _parse_response(page_number: int, stream: ExtractionStream, usage_metadata) -> dict:
+        parsed, status = stream.finish(page_number)
+        result = {
+            "page": page_number,
+            "raw_response": stream.text,
+            "usage": {
+                "prompt_tokens": usage_metadata.prompt_token_count if usage_metadata else None,
+                "response_tokens": usage_metadata.candidates_token_count if usage_metadata else None,
+                "cached_tokens": usage_metadata.cached_content_token_count if usage_metadata else None,
+            },
+            "parsed": parsed,
+            # ok, repaired, partial or invalid; see ExtractionStream.finish.
+            "parse_status": status,
+            "record_count": sum(len(parsed[field]) for field in LIST_FIELDS) if parsed else 0,
+        }
+        if stream.invalid:
+            result["invalid_fragments"] = stream.invalid
+        return result
+    
     def extract_page(self, 
                     page_number: int,
                     prompt: str,
@@ -165,79 +528,110 @@ class GeminiExtractor:
                  page_number=page_number, use_cache=use_cache)
         
         try:
-            config = {}
-            if use_cache and self.cache:
-                config["cached_content"] = self.cache.name
-            
-            # Request structured JSON output
-            config["response_mime_type"] = "application/json"
-            
-            response = self.client.models.generate_content(
-                model="gemini-2.5-pro" if not use_cache else self.cache.model,
-                contents=prompt,
-                config=types.GenerateContentConfig(**config) if config else None
-            )
-            
-            # Parse response
-            result = {
-                "page": page_number,
-                "raw_response": response.text,
-                "usage": {
-                    "prompt_tokens": response.usage_metadata.prompt_token_count if response.usage_metadata else None,
-                    "response_tokens": response.usage_metadata.candidates_token_count if response.usage_metadata else None,
-                    "cached_tokens": response.usage_metadata.cached_content_token_count if response.usage_metadata else None,
-                }
-            }
-            
-            # Try to parse JSON from response
-            try:
-                result["parsed"] = json.loads(response.text)
-            except json.JSONDecodeError:
-                result["parsed"] = None
-            
+            result = self._call_with_repair(
+                page_number, "page", lambda text, emit: self._generate_page(page_number, text, use_cache, emit),
+                prompt)
             self._log("Extract Page", "completed",
                      f"Page {page_number} extracted ({result['usage']['response_tokens']} tokens)",
-                     **result["usage"])
+                     page_number=page_number, **result["usage"])
             return result
             
         except Exception as e:
-            self._log("Extract Page", "failed", str(e))
+            self._log("Extract Page", "failed", str(e), page_number=page_number)
             return None
     
-    def run_sample_extraction(self, 
-                             schematic_path: Path,
-                             legend_path: Path,
-                             reading_instructions_path: Path,
-                             system_instructions_path: Path,
-                             num_pages: int = 2,
-                             total_pages: int = 129) -> dict:
-        """Run a complete sample extraction workflow with logging."""
+    def extract_regions(self,
+                        schematic_path: Path,
+                        legend_path: Path,
+                        reading_instructions_path: Path,
+                        system_instructions_path: Path,
+                        page_number: int,
+                        images: List[bytes],
+                        prompt: str,
+                        doc_sha256: Optional[str] = None,
+                        budget: Optional[BudgetGuard] = None) -> dict:
+        """Ask about crops of one page; results are cached by document, page and prompt.
         
-        start_time = time.time()
-        results = {
-            "success": False,
-            "steps": [],
-            "extractions": [],
-            "total_duration_ms": 0
-        }
+        The prompt (see :func:`region_prompt`) carries the crop boxes and the
+        key also covers a hash of the crop images, so a different plan or
+        render (e.g. another dpi) for the same page is a different entry. Returns
+        the extraction result, or ``{"page": n, "error": "..."}``; a call the
+        ``budget`` refuses also carries ``"budget_exceeded": True``.
+        """
+        self.doc_sha256 = doc_sha256 or self.doc_sha256 or sha256_file(schematic_path)
+        key = None
+        if self.result_cache is not None:
+            images_hash = hashlib.sha256(b"".join(hashlib.sha256(image).digest() for image in images)).hexdigest()
+            prompt_hash = prompt_fingerprint(f"{prompt}{SCHEMA_MARKER}\n[images:{images_hash}]",
+                                             system_instructions_path.read_text(encoding="utf-8"))
+            key = make_cache_key(self.doc_sha256, page_number, prompt_hash, CACHE_MODEL)
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                self._log("Result Cache", "completed", f"Region answer for page {page_number} served from cache")
+                self._record_cache_hits([page_number], "region")
+                return {**cached, "cache_hit": True}
         
-        # Step 1: Initialize client
-        self._log("Workflow Start", "running", "Starting extraction workflow...")
+        if not self.prepare_context(schematic_path, legend_path,
+                                    reading_instructions_path, system_instructions_path):
+            return {"page": page_number, "error": "Could not prepare extraction context."}
+        
+        self._log("Extract Regions", "running",
+                 f"Sending {len(images)} crop(s) of page {page_number}...",
+                 page_number=page_number, images=len(images),
+                 image_bytes=sum(len(image) for image in images))
+        limiter = get_rate_limiter(self._model(), get_gemini_requests_per_minute())
         
+        try:
+            result = self._call_with_repair(
+                page_number, "region", lambda text, emit: self._generate_regions(page_number, images, text, on_item=emit),
+                prompt, limiter=limiter, budget=budget)
+        except BudgetExceeded as e:
+            self._log("Extract Regions", "failed", str(e), page_number=page_number)
+            return {"page": page_number, "error": str(e), "budget_exceeded": True}
+        except Exception as e:
+            self._log("Extract Regions", "failed", str(e), page_number=page_number)
+            return {"page": page_number, "error": str(e)}
+        self._log("Extract Regions", "completed",
+                 f"Page {page_number} regions extracted ({result['usage']['response_tokens']} tokens)",
+                 page_number=page_number, **result["usage"])
+        if key and result.get("parse_status") in COMPLETE_STATUSES:
+            self.result_cache.put(key, result)
+        return result
+    
+    def prepare_context(self,
+                        schematic_path: Path,
+                        legend_path: Path,
+                        reading_instructions_path: Path,
+                        system_instructions_path: Path) -> bool:
+        """Initialize the client, upload reference files and create the context cache."""
+        # Step 1: Initialize client
         if not self.initialize_client():
-            results["steps"] = self.logger.get_all_steps()
-            return results
+            return False
+        
+        try:
+            deleted = self.registry.cleanup_orphans(self.client, CACHE_DISPLAY_PREFIX,
+                                                    max_age_seconds=get_orphan_cache_max_age(),
+                                                    min_interval_seconds=3600)
+            if deleted:
+                self._log("Cleanup Caches", "completed",
+                         f"Deleted {len(deleted)} orphaned caches", cache_names=deleted)
+        except Exception as e:
+            self._log("Cleanup Caches", "failed", str(e))
+        
+        self.schematic_path = schematic_path
+        self.doc_sha256 = self.doc_sha256 or sha256_file(schematic_path)
         
         # Step 2: Upload files
         self._log("Upload Files", "running", "Uploading reference documents...")
         
         legend_file = self.upload_file(legend_path, "legend.png")
         reading_file = self.upload_file(reading_instructions_path, "reading_instructions.png")
-        schematic_file = self.upload_file(schematic_path, "schematic.pdf")
+        files = [legend_file, reading_file]
+        if not self.page_slicer:
+            files.append(self.upload_file(schematic_path, "schematic.pdf"))
         
-        if not all([legend_file, reading_file, schematic_file]):
-            results["steps"] = self.logger.get_all_steps()
-            return results
+        if not all(files):
+            return False
         
         self._log("Upload Files", "completed", "All files uploaded successfully")
         
@@ -249,18 +643,78 @@ class GeminiExtractor:
         
         # Step 4: Create cache
         cache = self.create_cache(
-            model="models/gemini-2.5-flash-001",  # Use specific version for caching
-            display_name=f"UBE-1650-Schematic-{datetime.now().strftime('%Y%m%d%H%M%S')}",
+            model=CACHE_MODEL,
+            display_name=f"{CACHE_DISPLAY_PREFIX}{datetime.now().strftime('%Y%m%d%H%M%S')}",
             system_instruction=system_instructions,
-            files=[legend_file, reading_file, schematic_file],
+            files=files,
             ttl_seconds=1800  # 30 minutes
         )
+        if cache is None and self.page_slicer:
+            # Legend + instructions alone can fall under the minimum cacheable
+            # size; send them with each page instead.
+            self.reference_files = files
+            self.system_instructions = system_instructions
+            self._log("Inline Context", "completed",
+                     "Sending legend and reading instructions with each page")
+            return True
+        return cache is not None
+    
+    def lookup_cached_pages(self,
+                            schematic_path: Path,
+                            system_instructions_path: Path,
+                            pages: List[int],
+                            doc_sha256: Optional[str] = None) -> tuple[dict, dict]:
+        """Split ``pages`` into cached results and cache keys for the rest.
         
-        if not cache:
-            results["steps"] = self.logger.get_all_steps()
-            return results
+        Returns ``(hits, keys)``: ``hits`` maps page -> stored result and
+        ``keys`` maps every page to its cache key for storing new results.
+        """
+        self.doc_sha256 = doc_sha256 or self.doc_sha256 or sha256_file(schematic_path)
+        if self.result_cache is None:
+            return {}, {}
+        template = self.prompt_template + ("\n[text-prepass]" if self.text_prepass else "") + SCHEMA_MARKER
+        prompt_hash = prompt_fingerprint(template,
+                                         system_instructions_path.read_text(encoding="utf-8"))
+        keys = {page: make_cache_key(self.doc_sha256, page, prompt_hash, CACHE_MODEL) for page in pages}
+        hits = {}
+        for page, key in keys.items():
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                hits[page] = {**cached, "cache_hit": True}
+        if hits:
+            self._log("Result Cache", "completed",
+                     f"{len(hits)}/{len(pages)} pages served from cache",
+                     cached_pages=sorted(hits))
+            self._record_cache_hits(sorted(hits), "page")
+        return hits, keys
+    
+    def _store_result(self, keys: dict, result: dict) -> None:
+        key = keys.get(result.get("page"))
+        # Partial answers are kept by the caller but asked for again next time.
+        if key and self.result_cache is not None and result.get("parse_status") in COMPLETE_STATUSES:
+            self.result_cache.put(key, result)
+    
+    def run_sample_extraction(self, 
+                             schematic_path: Path,
+                             legend_path: Path,
+                             reading_instructions_path: Path,
+                             system_instructions_path: Path,
+                             num_pages: int = 2,
+                             total_pages: int = 129,
+                             doc_sha256: Optional[str] = None) -> dict:
+        """Run a complete sample extraction workflow with logging."""
         
-        # Step 5: Random page selection
+        start_time = time.time()
+        results = {
+            "success": False,
+            "steps": [],
+            "extractions": [],
+            "total_duration_ms": 0
+        }
+        
+        self._log("Workflow Start", "running", "Starting extraction workflow...")
+        
+        # Random page selection
         self._log("Select Pages", "running", f"Selecting {num_pages} random pages...")
         
         # Skip first 5 pages (TOC, legend, reading instructions)
@@ -271,31 +725,25 @@ class GeminiExtractor:
                  f"Selected pages: {selected_pages}",
                  selected_pages=selected_pages)
         
-        # Step 6: Extract each page
-        extraction_prompt_template = """
-Analyze page {page_num} of the schematic.
-
-Extract all components and connections visible on this page. Return as JSON:
-
-{{
-  "page": {page_num},
-  "title": "page title if visible",
-  "components": [
-    {{"id": "component_id", "type": "from_legend", "grid_position": "col-row"}}
-  ],
-  "wires": [
-    {{"wire_number": "XXXX", "from": "component", "to": "component"}}
-  ],
-  "cross_references": [
-    {{"direction": "to/from", "page": N, "line": N}}
-  ]
-}}
-"""
+        hits, keys = self.lookup_cached_pages(schematic_path, system_instructions_path,
+                                              selected_pages, doc_sha256)
+        missing = [page for page in selected_pages if page not in hits]
         
+        # Only pay for uploads and cache creation if something is not cached
+        if missing and not self.prepare_context(schematic_path, legend_path,
+                                                reading_instructions_path, system_instructions_path):
+            results["steps"] = self.logger.get_all_steps()
+            return results
+        
+        # Extract each page
         for page_num in selected_pages:
-            prompt = extraction_prompt_template.format(page_num=page_num)
+            if page_num in hits:
+                results["extractions"].append(hits[page_num])
+                continue
+            prompt = self.page_prompt(page_num)
             extraction = self.extract_page(page_num, prompt, use_cache=True)
             if extraction:
+                self._store_result(keys, extraction)
                 results["extractions"].append(extraction)
         
         # Finalize
@@ -309,6 +757,117 @@ Extract all components and connections visible on this page. Return as JSON:
         results["total_duration_ms"] = round(total_duration, 2)
         
         return results
+    
+    def extract_page_with_retry(self, page_number: int, prompt: str,
+                                requests_per_minute: Optional[float] = None,
+                                budget: Optional[BudgetGuard] = None) -> dict:
+        """Rate-limited, retrying page extraction for batch workers; raises on failure.
+        
+        Raises :class:`BudgetExceeded` if ``budget`` refuses the first call.
+        """
+        limiter = get_rate_limiter(self._model(),
+                                   requests_per_minute or get_gemini_requests_per_minute())
+        
+        def on_retry(attempt_number: int, exc: BaseException, delay: float) -> None:
+            self._log("Retry Page", "running",
+                     f"Page {page_number}: retry {attempt_number} in {delay:.1f}s ({exc})",
+                     page_number=page_number, attempt=attempt_number)
+        
+        self._log("Extract Page", "running", f"Extracting page {page_number}...",
+                 page_number=page_number, use_cache=True)
+        try:
+            result = self._call_with_repair(
+                page_number, "page",
+                lambda text, emit: self._generate_page(page_number, text, use_cache=True, on_item=emit),
+                prompt, limiter=limiter, budget=budget, on_retry=on_retry)
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            self._log("Extract Page", "failed", str(e), page_number=page_number)
+            raise
+        self._log("Extract Page", "completed",
+                 f"Page {page_number} extracted ({result['usage']['response_tokens']} tokens)",
+                 page_number=page_number, **result["usage"])
+        return result
+    
+    def run_batch_extraction(self,
+                             schematic_path: Path,
+                             legend_path: Path,
+                             reading_instructions_path: Path,
+                             system_instructions_path: Path,
+                             pages: Optional[Iterable[int]] = None,
+                             max_workers: int = 4,
+                             requests_per_minute: Optional[float] = None,
+                             doc_sha256: Optional[str] = None,
+                             cancel_event: Optional[threading.Event] = None,
+                             budget: Optional[BudgetGuard] = None) -> Iterator[dict]:
+        """Extract many pages concurrently, yielding each result as it completes.
+        
+        ``pages`` defaults to every page of the schematic. Failed pages are
+        yielded as ``{"page": n, "error": "..."}`` so one bad page never
+        aborts the batch; with ``text_prepass`` they, and pages whose answer
+        could not be parsed, also carry the text-layer candidates as
+        ``parsed``. Pages already in the result cache are yielded first and
+        never reach the model. Setting ``cancel_event`` stops new pages
+        from starting; pages already in flight are allowed to finish. With a
+        ``budget``, each page must fit under it before it starts; once a page
+        is refused no further pages start, in-flight pages still complete and
+        the refused ones are not yielded at all; ``budget_stopped`` is then
+        set. Raises ``RuntimeError`` if the extraction context cannot be
+        prepared.
+        """
+        self.budget_stopped = False
+        self._log("Batch Start", "running", "Starting batch extraction...")
+        if pages is None:
+            from pypdf import PdfReader
+            pages = range(1, len(PdfReader(str(schematic_path)).pages) + 1)
+        pages = list(pages)
+        
+        hits, keys = self.lookup_cached_pages(schematic_path, system_instructions_path,
+                                              pages, doc_sha256)
+        for page_num in pages:
+            if page_num in hits:
+                yield hits[page_num]
+        missing = [page for page in pages if page not in hits]
+        if not missing:
+            self._log("Batch Start", "completed", "All pages served from cache")
+            return
+        
+        if not self.prepare_context(schematic_path, legend_path,
+                                    reading_instructions_path, system_instructions_path):
+            self._log("Batch Start", "failed", "Could not prepare extraction context")
+            raise RuntimeError("Could not prepare extraction context.")
+        self._log("Batch Start", "completed",
+                 f"Extracting {len(missing)} pages with {max_workers} workers",
+                 page_count=len(missing), max_workers=max_workers)
+        
+        budget_stop = threading.Event()
+        
+        def work(page_num: int) -> dict:
+            if budget_stop.is_set():
+                raise BudgetExceeded("Batch stopped by the usage budget.")
+            prompt = self.page_prompt(page_num)
+            result = self.extract_page_with_retry(page_num, prompt, requests_per_minute, budget)
+            self._store_result(keys, result)
+            return result
+        
+        for page_num, result, error in run_bounded(work, missing, max_workers=max_workers):
+            if isinstance(error, BudgetExceeded):
+                if not budget_stop.is_set():
+                    budget_stop.set()
+                    self.budget_stopped = True
+                    self._log("Batch Stopped", "completed", str(error), page_number=page_num)
+                continue
+            if error is not None:
+                result = {"page": page_num, "error": str(error)}
+            if result.get("parsed") is None:
+                fallback = self.text_candidates(page_num)
+                if fallback:
+                    result.update(parsed=fallback, source="text")
+            yield result
+            if cancel_event is not None and cancel_event.is_set():
+                self._log("Batch Cancelled", "completed", "Cancellation requested; stopping")
+                return
 
 
 def run_test_extraction() -> dict:
@@ -0,0 +1,294 @@
+"""Columnar storage and memory-mapped readers for page geometry extracted with pdfplumber."""
+from __future__ import annotations
+
+import gc
+import json
+import os
+import re
+import struct
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+# Bump when the stored columns change; older .npz files are rebuilt, not read.
+FORMAT_VERSION = 2
+DIRECTIONS = ("ltr", "rtl", "ttb", "btt")
+PAGE_FILE_RE = re.compile(r"^page_\d+\.(json|npz)$")
+
+WORD_COLUMNS = ("x0", "x1", "top", "bottom", "doctop")
+RECT_COLUMNS = ("x0", "top", "x1", "bottom", "linewidth")
+CURVE_COLUMNS = ("x0", "top", "x1", "bottom")
+
+
+def encode_strings(values: Sequence[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Intern ``values`` into a UTF-8 string table.
+
+    Returns ``(data, offsets, ids)``: string ``i`` of the table is
+    ``data[offsets[i]:offsets[i + 1]]`` and ``ids`` maps each input value to
+    its table entry, so repeated labels are stored once.
+    """
+    table: Dict[str, int] = {}
+    ids = np.empty(len(values), dtype=np.int32)
+    for index, value in enumerate(values):
+        ids[index] = table.setdefault(value, len(table))
+    encoded = [s.encode("utf-8") for s in table]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return data, offsets, ids
+
+
+def decode_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    raw = data.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+
+def _column(items: List[dict], key: str, dtype=np.float32) -> np.ndarray:
+    return np.fromiter((item[key] for item in items), dtype=dtype, count=len(items))
+
+
+def page_record(page, page_number: int) -> dict:
+    """Words, lines, rects and curves of a pdfplumber page, as written by ``extract_ladder.py``."""
+    return {
+        "page": page_number,
+        "width": page.width,
+        "height": page.height,
+        "words": page.extract_words(keep_blank_chars=False, use_text_flow=True),
+        "lines": page.lines,
+        "rects": page.rects,
+        "curves": page.curves,
+    }
+
+
+def page_columns(page_rec: dict) -> Dict[str, np.ndarray]:
+    """Convert a page record from ``extract_ladder.py`` into named columns.
+
+    Words keep their box, text, orientation and direction; lines keep their
+    endpoints and stroke width; rects keep their box, stroke width and
+    stroke/fill flags; curves (junction dots, arcs) keep their box and
+    stroke/fill flags. Colours, marked-content tags and raw path operators
+    are not carried over; use the JSON format when those are needed.
+    """
+    words = page_rec.get("words", [])
+    lines = page_rec.get("lines", [])
+    rects = page_rec.get("rects", [])
+    curves = page_rec.get("curves", [])
+
+    str_data, str_offsets, text_ids = encode_strings([w["text"] for w in words])
+    columns: Dict[str, np.ndarray] = {
+        "format_version": np.array(FORMAT_VERSION, dtype=np.int32),
+        "page": np.array(page_rec["page"], dtype=np.int32),
+        "size": np.array([page_rec["width"], page_rec["height"]], dtype=np.float32),
+        "str_data": str_data,
+        "str_offsets": str_offsets,
+        "word_text": text_ids,
+        "word_upright": _column(words, "upright", np.bool_),
+        "word_direction": np.fromiter(
+            (DIRECTIONS.index(w.get("direction", "ltr")) for w in words), dtype=np.uint8, count=len(words)
+        ),
+    }
+    for key in WORD_COLUMNS:
+        columns[f"word_{key}"] = _column(words, key)
+
+    # Endpoints in top-based page coordinates, in drawing order.
+    columns["line_x0"] = np.fromiter((ln["pts"][0][0] for ln in lines), dtype=np.float32, count=len(lines))
+    columns["line_y0"] = np.fromiter((ln["pts"][0][1] for ln in lines), dtype=np.float32, count=len(lines))
+    columns["line_x1"] = np.fromiter((ln["pts"][-1][0] for ln in lines), dtype=np.float32, count=len(lines))
+    columns["line_y1"] = np.fromiter((ln["pts"][-1][1] for ln in lines), dtype=np.float32, count=len(lines))
+    columns["line_linewidth"] = _column(lines, "linewidth")
+
+    for key in RECT_COLUMNS:
+        columns[f"rect_{key}"] = _column(rects, key)
+    columns["rect_stroke"] = _column(rects, "stroke", np.bool_)
+    columns["rect_fill"] = _column(rects, "fill", np.bool_)
+
+    for key in CURVE_COLUMNS:
+        columns[f"curve_{key}"] = _column(curves, key)
+    columns["curve_stroke"] = _column(curves, "stroke", np.bool_)
+    columns["curve_fill"] = _column(curves, "fill", np.bool_)
+    return columns
+
+
+def replace_mapped(tmp_path: Path, path: Path, attempts: int = 5) -> None:
+    """``os.replace`` onto a file that readers may hold memory-mapped.
+
+    Windows refuses to replace a mapped file. Callers drop their own cached
+    maps first; this collects garbage (releasing maps kept alive only by
+    reference cycles) and retries briefly while other readers let go.
+    """
+    for attempt in range(attempts):
+        try:
+            os.replace(tmp_path, path)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            gc.collect()
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def write_page_npz(path: Path, page_rec: dict) -> Path:
+    """Write ``page_rec`` as an uncompressed ``.npz``.
+
+    Members are stored, not deflated, so readers can memory-map each column
+    straight out of the archive.
+    """
+    tmp_path = path.with_name(f".{path.name}.{uuid4().hex}")
+    try:
+        with tmp_path.open("wb") as out:
+            np.savez(out, **page_columns(page_rec))
+        replace_mapped(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return path
+
+
+class StaleGeometryError(ValueError):
+    """A stored page geometry file predates the current :data:`FORMAT_VERSION`."""
+
+
+def format_version(path: Path) -> int:
+    """Format version of a stored ``page_NNN.npz``; files from before versioning count as 1."""
+    with np.load(path) as archive:
+        return int(archive["format_version"]) if "format_version" in archive.files else 1
+
+
+def map_npz(path: Path) -> Dict[str, np.ndarray]:
+    """Map every member of an uncompressed ``.npz`` as a read-only array view.
+
+    The archive is memory-mapped once and each ``.npy`` member becomes a
+    zero-copy view at its offset, so untouched columns are never read.
+    """
+    buffer = np.memmap(path, dtype=np.uint8, mode="r")
+    members: Dict[str, np.ndarray] = {}
+    with zipfile.ZipFile(path) as archive, path.open("rb") as fh:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{path} member {info.filename} is compressed and cannot be memory-mapped.")
+            # Local file header: 30 fixed bytes, then name and extra field.
+            fh.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack("<HH", fh.read(4))
+            fh.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(fh)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(fh)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(fh)
+            count = int(np.prod(shape)) if shape else 1
+            array = np.frombuffer(buffer, dtype=dtype, count=count, offset=fh.tell())
+            members[info.filename[:-4]] = array.reshape(shape, order="F" if fortran else "C")
+    return members
+
+
+class Columns:
+    """Lazy column view over one kind of page element (words, lines, rects or curves).
+
+    Columns are attributes (``words.x0``, ``lines.y1``); each is a NumPy
+    array shared with the underlying file, never copied into dicts.
+    """
+
+    def __init__(self, members: Dict[str, np.ndarray], prefix: str):
+        self._columns = {
+            name[len(prefix):]: array for name, array in members.items() if name.startswith(prefix)
+        }
+
+    def __getattr__(self, name: str) -> np.ndarray:
+        try:
+            return self.__dict__["_columns"][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __len__(self) -> int:
+        first = next(iter(self._columns.values()), None)
+        return 0 if first is None else len(first)
+
+    @property
+    def names(self) -> List[str]:
+        return sorted(self._columns)
+
+
+class WordColumns(Columns):
+    def __init__(self, members: Dict[str, np.ndarray]):
+        super().__init__(members, "word_")
+        self._data = members["str_data"]
+        self._offsets = members["str_offsets"]
+        self._strings: Optional[List[str]] = None
+
+    @property
+    def strings(self) -> List[str]:
+        """The page's distinct word texts; ``word_text`` indexes into this list."""
+        if self._strings is None:
+            self._strings = decode_strings(self._data, self._offsets)
+        return self._strings
+
+    def text_at(self, index: int) -> str:
+        string_id = int(self._columns["text"][index])
+        return self._data[self._offsets[string_id]:self._offsets[string_id + 1]].tobytes().decode("utf-8")
+
+    def texts(self) -> List[str]:
+        strings = self.strings
+        return [strings[i] for i in self._columns["text"]]
+
+    @property
+    def width(self) -> np.ndarray:
+        return self.x1 - self.x0
+
+    @property
+    def height(self) -> np.ndarray:
+        return self.bottom - self.top
+
+
+class PageGeometry:
+    """Words, lines, rects and curves of one processed page as columnar views.
+
+    ``page_NNN.npz`` files are memory-mapped; ``page_NNN.json`` files from the
+    older format are converted to the same columns on load. ``.npz`` files
+    from an older :data:`FORMAT_VERSION` raise :class:`StaleGeometryError`;
+    the pipeline's geometry stage rebuilds them.
+    """
+
+    def __init__(self, members: Dict[str, np.ndarray], path: Optional[Path] = None):
+        self.path = path
+        self._members = members
+        self.page = int(members["page"])
+        self.width, self.height = (float(v) for v in members["size"])
+        self.words = WordColumns(members)
+        self.lines = Columns(members, "line_")
+        self.rects = Columns(members, "rect_")
+        self.curves = Columns(members, "curve_")
+
+    @classmethod
+    def open(cls, path: Path) -> "PageGeometry":
+        path = Path(path)
+        if path.suffix == ".npz":
+            members = map_npz(path)
+            version = int(members["format_version"]) if "format_version" in members else 1
+            if version != FORMAT_VERSION:
+                raise StaleGeometryError(f"{path} has geometry format {version}, expected {FORMAT_VERSION}.")
+            return cls(members, path)
+        page_rec = json.loads(path.read_text(encoding="utf-8"))
+        return cls(page_columns(page_rec), path)
+
+    def __repr__(self) -> str:
+        return (f"PageGeometry(page={self.page}, words={len(self.words)}, "
+                f"lines={len(self.lines)}, rects={len(self.rects)})")
+
+
+def page_files(directory: Path) -> List[Path]:
+    """Processed page files in page order, preferring ``.npz`` over ``.json``."""
+    by_stem: Dict[str, Path] = {}
+    for suffix in (".json", ".npz"):
+        for path in Path(directory).glob(f"page_*{suffix}"):
+            if PAGE_FILE_RE.match(path.name):
+                by_stem[path.stem] = path
+    return [by_stem[stem] for stem in sorted(by_stem)]
+
+
+def iter_pages(directory: Path) -> Iterator[PageGeometry]:
+    """Open every processed page under ``directory`` one at a time."""
+    for path in page_files(directory):
+        yield PageGeometry.open(path)
@@ -0,0 +1,163 @@
+"""Map page coordinates to the schematic's ``col-row`` grid references."""
+from __future__ import annotations
+
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+
+from .geometry import PageGeometry
+
+# Border bands searched for grid labels, as fractions of the page size.
+HEADER_BAND = 0.05
+MARGIN_BAND = 0.08
+# Right edges of line numbers in one column agree to within this many points.
+EDGE_TOLERANCE = 2.0
+# A cached template fits a page whose header labels sit within this share
+# of the column spacing of the template's centres.
+MATCH_TOLERANCE = 0.25
+
+
+def _edges(centres: np.ndarray) -> np.ndarray:
+    """Boundaries halfway between neighbouring label centres."""
+    return (centres[:-1] + centres[1:]) / 2
+
+
+@dataclass(frozen=True, eq=False)
+class GridTemplate:
+    """Column and row labels of one drawing border, with their centres."""
+    column_labels: Tuple[str, ...]
+    column_centres: np.ndarray
+    row_labels: Tuple[int, ...]
+    row_centres: np.ndarray
+
+    def __post_init__(self):
+        # Cached on the frozen instance; points are bucketed with searchsorted.
+        object.__setattr__(self, "_column_edges", _edges(self.column_centres))
+        object.__setattr__(self, "_row_edges", _edges(self.row_centres))
+        object.__setattr__(self, "_column_names", np.array(self.column_labels))
+        object.__setattr__(self, "_row_names", np.array([str(r) for r in self.row_labels]))
+
+    def column_index(self, x) -> np.ndarray:
+        return np.searchsorted(self._column_edges, np.asarray(x, dtype=np.float32))
+
+    def row_index(self, y) -> np.ndarray:
+        return np.searchsorted(self._row_edges, np.asarray(y, dtype=np.float32))
+
+    def resolve(self, x, y) -> np.ndarray:
+        """``col-row`` labels for arrays of points; points off the grid snap to the nearest cell."""
+        columns = self._column_names[self.column_index(x)]
+        rows = self._row_names[self.row_index(y)]
+        return np.char.add(np.char.add(columns, "-"), rows)
+
+    def resolve_boxes(self, boxes) -> np.ndarray:
+        """``col-row`` of the centre of each ``x0, top, x1, bottom`` box."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        return self.resolve((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2)
+
+    def position(self, x: float, y: float) -> str:
+        return str(self.resolve([x], [y])[0])
+
+    def matches(self, page: PageGeometry) -> bool:
+        """Whether the page's own header band shows this template's column labels."""
+        columns = header_columns(page)
+        spacing = float(np.diff(self.column_centres).min()) if len(self.column_centres) > 1 else page.width
+        return all(
+            label in columns and abs(columns[label] - centre) <= spacing * MATCH_TOLERANCE
+            for label, centre in zip(self.column_labels, self.column_centres.tolist())
+        )
+
+
+def header_columns(page: PageGeometry) -> Dict[str, float]:
+    """Single letters in the top border band, mapped to their first centre x."""
+    words = page.words
+    cy = (words.top + words.bottom) / 2
+    columns: Dict[str, float] = {}
+    for i in np.nonzero(cy < page.height * HEADER_BAND)[0]:
+        text = unicodedata.normalize("NFKC", words.text_at(i)).strip().upper()
+        if len(text) == 1 and "A" <= text <= "Z":
+            columns.setdefault(text, float((words.x0[i] + words.x1[i]) / 2))
+    return columns
+
+
+def detect_grid(page: PageGeometry) -> Optional[GridTemplate]:
+    """Find the column letters along the top border and line numbers down a side.
+
+    Labels are matched after NFKC folding, so full-width ``Ａ`` and ``１２``
+    count. Returns None when the page has no recognizable grid (covers, TOC).
+    """
+    words = page.words
+    cx = (words.x0 + words.x1) / 2
+    cy = (words.top + words.bottom) / 2
+    margin = np.nonzero((cx < page.width * MARGIN_BAND) | (cx > page.width * (1 - MARGIN_BAND)))[0]
+    columns = header_columns(page)
+    # Line numbers are right-aligned in one column; clustering by right edge
+    # keeps stray digits (vertical drawing numbers in the margin) out.
+    numbers = sorted(
+        (float(words.x1[i]), int(text), float(cy[i]))
+        for i in margin
+        for text in [unicodedata.normalize("NFKC", words.text_at(i)).strip()]
+        if text.isdigit() and cy[i] > page.height * HEADER_BAND
+    )
+    clusters: list = []
+    for x1, label, y in numbers:
+        if not clusters or x1 - clusters[-1][0] > EDGE_TOLERANCE:
+            clusters.append([x1, {}])
+        clusters[-1][0] = x1
+        clusters[-1][1].setdefault(label, y)
+    rows = max((labels for _, labels in clusters), key=len, default={})
+    if len(columns) < 2 or len(rows) < 2:
+        return None
+
+    column_labels = tuple(sorted(columns, key=columns.get))
+    row_labels = tuple(sorted(rows, key=rows.get))
+    return GridTemplate(
+        column_labels=column_labels,
+        column_centres=np.array([columns[c] for c in column_labels], dtype=np.float32),
+        row_labels=row_labels,
+        row_centres=np.array([rows[r] for r in row_labels], dtype=np.float32),
+    )
+
+
+class GridResolver:
+    """Detect a drawing's grid once per document and page size, and reuse it.
+
+    A cached template is only reused after the page's header band is found
+    to carry the same column labels, so covers and index pages of the same
+    size get no grid. Pages without a grid are not cached and are retried
+    on the next call.
+    """
+
+    def __init__(self):
+        self._templates: Dict[Hashable, GridTemplate] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def template_key(page: PageGeometry, document: Optional[str] = None) -> Hashable:
+        return (document, round(page.width, 1), round(page.height, 1))
+
+    def for_page(self, page: PageGeometry, document: Optional[str] = None) -> Optional[GridTemplate]:
+        """The grid of ``page``; ``document`` (its SHA-256) scopes the cached templates."""
+        key = self.template_key(page, document)
+        with self._lock:
+            template = self._templates.get(key)
+        if template is not None and template.matches(page):
+            return template
+        template = detect_grid(page)
+        if template is not None:
+            with self._lock:
+                self._templates[key] = template
+        return template
+
+    def clear(self) -> None:
+        with self._lock:
+            self._templates.clear()
+
+
+_resolver = GridResolver()
+
+
+def get_grid_resolver() -> GridResolver:
+    return _resolver
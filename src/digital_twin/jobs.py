@@ -0,0 +1,212 @@
+"""In-process background job queue with a persistent job table and event log."""
+from __future__ import annotations
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from uuid import uuid4
+
+from .record_store import RecordStore
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobCancelled(Exception):
+    """Raised inside a job runner once cancellation has been requested."""
+
+
+class JobContext:
+    """Handle passed to a job runner for reporting progress and checking cancellation."""
+
+    def __init__(self, manager: "JobManager", job_id: str):
+        self.manager = manager
+        self.job_id = job_id
+        self.cancel_event = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled()
+
+    def emit(self, event: str, data: dict) -> None:
+        self.manager.emit(self.job_id, event, data)
+
+    def update(self, **fields) -> None:
+        self.manager.store.update(self.job_id, **fields)
+
+
+JobRunner = Callable[[JobContext], Optional[dict]]
+
+
+class _EventLog:
+    """Events of one running job, kept in memory and appended to its log file.
+
+    Each log has its own lock and keeps its file open until the job
+    finishes, so busy jobs do not contend with each other on emit.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.events: List[dict] = []
+        self._lock = threading.Lock()
+        self._out = path.open("a", encoding="utf-8")
+
+    def append(self, event: str, data: dict) -> None:
+        with self._lock:
+            if self._out.closed:
+                return
+            entry = {"seq": len(self.events) + 1, "event": event, "data": data, "at": _now()}
+            self.events.append(entry)
+            self._out.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            # Flushed per event so readers of the file see everything emitted.
+            self._out.flush()
+
+    def since(self, after: int) -> List[dict]:
+        with self._lock:
+            return self.events[after:]
+
+    def close(self) -> None:
+        with self._lock:
+            self._out.close()
+
+
+class JobManager:
+    """Run jobs on a bounded worker pool, independent of any HTTP request.
+
+    Job records live in a :class:`RecordStore`; each job's events are
+    appended to ``<events_dir>/<job_id>.jsonl`` so progress can be replayed
+    after a client reconnects or the process restarts. Only unfinished jobs
+    keep their events in memory; finished jobs are served from the log file.
+    Jobs that were still queued or running when the process stopped are
+    marked ``interrupted``.
+    """
+
+    def __init__(self, store: RecordStore, events_dir: Path, max_workers: int = 2):
+        self.store = store
+        self.events_dir = events_dir
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._contexts: Dict[str, JobContext] = {}
+        self._logs: Dict[str, _EventLog] = {}
+        self._lock = threading.Lock()
+        self._recovered = False
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+            if not self._recovered:
+                self._recovered = True
+                for status in ACTIVE_STATUSES:
+                    for job in self.store.find(status=status):
+                        self.store.update(job["id"], status="interrupted", finished_at=_now())
+
+    def _events_path(self, job_id: str) -> Path:
+        return self.events_dir / f"{job_id}.jsonl"
+
+    def submit(self, kind: str, runner: JobRunner, **fields) -> dict:
+        """Queue ``runner`` and return the new job record."""
+        self._ensure_started()
+        job = self.store.put({
+            "id": str(uuid4()),
+            "kind": kind,
+            "status": "queued",
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+            "error": None,
+            "result": None,
+            **fields,
+        })
+        context = JobContext(self, job["id"])
+        with self._lock:
+            self._contexts[job["id"]] = context
+            self._logs[job["id"]] = _EventLog(self._events_path(job["id"]))
+        self.emit(job["id"], "status", {"status": "queued"})
+        self._pool.submit(self._run, context, runner)
+        return job
+
+    def _run(self, context: JobContext, runner: JobRunner) -> None:
+        job_id = context.job_id
+        try:
+            if context.cancelled:
+                raise JobCancelled()
+            self.store.update(job_id, status="running", started_at=_now())
+            self.emit(job_id, "status", {"status": "running"})
+            result = runner(context)
+            status = "cancelled" if context.cancelled else "completed"
+            # Emit before updating the record so event streams drain fully.
+            self.emit(job_id, "status", {"status": status, "result": result})
+            self.store.update(job_id, status=status, result=result, finished_at=_now())
+        except JobCancelled:
+            self.emit(job_id, "status", {"status": "cancelled"})
+            self.store.update(job_id, status="cancelled", finished_at=_now())
+        except Exception as exc:
+            self.emit(job_id, "status", {"status": "failed", "error": str(exc)})
+            self.store.update(job_id, status="failed", error=str(exc), finished_at=_now())
+        finally:
+            with self._lock:
+                self._contexts.pop(job_id, None)
+                log = self._logs.pop(job_id, None)
+            if log is not None:
+                log.close()
+
+    def emit(self, job_id: str, event: str, data: dict) -> None:
+        """Record an event for an unfinished job; events for finished jobs are dropped."""
+        with self._lock:
+            log = self._logs.get(job_id)
+        if log is not None:
+            log.append(event, data)
+
+    def events_since(self, job_id: str, after: int = 0) -> List[dict]:
+        """Events with ``seq > after``; finished jobs are read from their log file."""
+        with self._lock:
+            log = self._logs.get(job_id)
+        if log is not None:
+            return log.since(after)
+        path = self._events_path(job_id)
+        if not path.exists():
+            return []
+        events = []
+        with path.open("r", encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line torn by a crash mid-write.
+                    continue
+                if entry["seq"] > after:
+                    events.append(entry)
+        return events
+
+    def get(self, job_id: str) -> Optional[dict]:
+        self._ensure_started()
+        return self.store.get(job_id)
+
+    def list(self, **criteria) -> List[dict]:
+        self._ensure_started()
+        return self.store.find(**criteria)
+
+    def is_active(self, job_id: str) -> bool:
+        job = self.store.get(job_id)
+        return job is not None and job["status"] in ACTIVE_STATUSES
+
+    def cancel(self, job_id: str) -> bool:
+        """Request cancellation; running jobs stop at their next checkpoint."""
+        with self._lock:
+            context = self._contexts.get(job_id)
+        if context is None:
+            return False
+        context.cancel_event.set()
+        self.emit(job_id, "status", {"status": "cancelling"})
+        return True
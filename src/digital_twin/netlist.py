@@ -0,0 +1,275 @@
+"""Machine-wide netlist graph merged from per-page extraction results."""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from .geometry import decode_strings, encode_strings, map_npz, replace_mapped
+from .text_extraction import COMPONENT_RE, COMPONENT_TYPES
+
+NODE_KINDS = ("component", "wire", "line", "page")
+# wire: component <-> wire number; located: item <-> the line it sits on;
+# xref: "to page N line M" between two line (or page) anchors.
+EDGE_KINDS = ("wire", "located", "xref")
+
+GRID_ROW_RE = re.compile(r"-(\d+)$")
+PAGE_FILE_RE = re.compile(r"^page_(\d+)\.json$")
+
+
+def normalize_designator(value) -> Optional[str]:
+    """Canonical component ID: NFKC, upper case, legend prefix joined to its number."""
+    if value is None:
+        return None
+    text = unicodedata.normalize("NFKC", str(value)).strip().upper().replace(" ", "")
+    if not text:
+        return None
+    match = COMPONENT_RE.match(text)
+    if match and match["prefix"] in COMPONENT_TYPES:
+        return f"{match['prefix']}{match['number']}"
+    return text
+
+
+def _grid_row(grid_position) -> Optional[int]:
+    match = GRID_ROW_RE.search(str(grid_position or ""))
+    return int(match.group(1)) if match else None
+
+
+def _int(value) -> Optional[int]:
+    try:
+        return int(unicodedata.normalize("NFKC", str(value)).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_page_results(extraction_dir: Path) -> Iterator[Tuple[int, dict]]:
+    """``(page, parsed)`` for each stored ``page_NNN.json`` with a parsed result."""
+    for path in sorted(extraction_dir.glob("page_*.json")):
+        match = PAGE_FILE_RE.match(path.name)
+        if not match:
+            continue
+        try:
+            result = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            continue
+        parsed = result.get("parsed")
+        if isinstance(parsed, dict):
+            yield int(match.group(1)), parsed
+
+
+def source_version(extraction_dirs: Iterable[Path]) -> str:
+    """Digest of the page files a netlist is built from; changes when any page does."""
+    hasher = hashlib.sha256()
+    for directory in sorted(extraction_dirs):
+        for path in sorted(directory.glob("page_*.json")):
+            stat = path.stat()
+            hasher.update(f"{directory.name}/{path.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return hasher.hexdigest()[:16]
+
+
+class NetlistBuilder:
+    """Accumulate page results and emit a :class:`NetlistGraph`.
+
+    Components and wire numbers are machine-wide nodes, so the same
+    designator on several pages becomes one node. Each page line that
+    something sits on gets an anchor node (``line:<doc>:<page>:<row>``);
+    cross references join the referring line to the target line. A
+    reference without a row is anchored to the whole page
+    (``page:<doc>:<page>``), which is linked to every line anchor of that
+    page so it stays reachable in traversal.
+    """
+
+    def __init__(self):
+        self._nodes: Dict[str, int] = {}
+        self._kinds: List[int] = []
+        self._edges: set = set()
+        self.docs: List[str] = []
+
+    def _node(self, kind: str, key: str) -> int:
+        full_key = f"{kind}:{key}"
+        node = self._nodes.get(full_key)
+        if node is None:
+            node = self._nodes[full_key] = len(self._kinds)
+            self._kinds.append(NODE_KINDS.index(kind))
+        return node
+
+    def _edge(self, u: int, v: int, kind: str, page: int, doc: int) -> None:
+        if u != v:
+            self._edges.add((min(u, v), max(u, v), EDGE_KINDS.index(kind), page, doc))
+
+    def _anchor(self, doc_key: str, page: int, row: Optional[int]) -> int:
+        if row is None:
+            return self._node("page", f"{doc_key}:{page}")
+        return self._node("line", f"{doc_key}:{page}:{row}")
+
+    def add_page(self, doc_sha256: str, page: int, parsed: dict) -> None:
+        if doc_sha256 not in self.docs:
+            self.docs.append(doc_sha256)
+        doc = self.docs.index(doc_sha256)
+        doc_key = doc_sha256[:12]
+
+        for component in parsed.get("components") or []:
+            designator = normalize_designator(component.get("id"))
+            if not designator:
+                continue
+            node = self._node("component", designator)
+            row = _grid_row(component.get("grid_position"))
+            if row is not None:
+                self._edge(node, self._anchor(doc_key, page, row), "located", page, doc)
+
+        for wire in parsed.get("wires") or []:
+            number = normalize_designator(wire.get("wire_number"))
+            if not number:
+                continue
+            node = self._node("wire", number)
+            for end in (wire.get("from"), wire.get("to")):
+                designator = normalize_designator(end)
+                if designator:
+                    self._edge(node, self._node("component", designator), "wire", page, doc)
+            row = _grid_row(wire.get("grid_position"))
+            if row is not None:
+                self._edge(node, self._anchor(doc_key, page, row), "located", page, doc)
+
+        for ref in parsed.get("cross_references") or []:
+            target_page, target_line = _int(ref.get("page")), _int(ref.get("line"))
+            if target_page is None:
+                continue
+            source = self._anchor(doc_key, page, _grid_row(ref.get("grid_position")))
+            self._edge(source, self._anchor(doc_key, target_page, target_line), "xref", page, doc)
+
+    def add_directory(self, doc_sha256: str, extraction_dir: Path) -> None:
+        for page, parsed in iter_page_results(extraction_dir):
+            self.add_page(doc_sha256, page, parsed)
+
+    def _link_page_anchors(self) -> None:
+        pages = {key[len("page:"):]: node for key, node in self._nodes.items() if key.startswith("page:")}
+        if not pages:
+            return
+        docs = {doc_sha256[:12]: doc for doc, doc_sha256 in enumerate(self.docs)}
+        for key, node in list(self._nodes.items()):
+            if not key.startswith("line:"):
+                continue
+            doc_key, page, _ = key[len("line:"):].split(":")
+            page_node = pages.get(f"{doc_key}:{page}")
+            if page_node is not None:
+                self._edge(page_node, node, "located", int(page), docs[doc_key])
+
+    def build(self, version: str = "") -> "NetlistGraph":
+        self._link_page_anchors()
+        keys = [None] * len(self._nodes)
+        for key, node in self._nodes.items():
+            keys[node] = key
+        edges = np.array(sorted(self._edges), dtype=np.int64).reshape(-1, 5)
+        # Store both directions so neighbours are one CSR slice.
+        src = np.concatenate([edges[:, 0], edges[:, 1]])
+        dst = np.concatenate([edges[:, 1], edges[:, 0]])
+        order = np.argsort(src, kind="stable")
+        indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=len(keys)), out=indptr[1:])
+        key_data, key_offsets, _ = encode_strings(keys)
+        doc_data, doc_offsets, _ = encode_strings(self.docs)
+        return NetlistGraph({
+            "node_kind": np.array(self._kinds, dtype=np.uint8),
+            "key_data": key_data,
+            "key_offsets": key_offsets,
+            "indptr": indptr,
+            "indices": dst[order].astype(np.int32),
+            "edge_kind": np.tile(edges[:, 2], 2)[order].astype(np.uint8),
+            "edge_page": np.tile(edges[:, 3], 2)[order].astype(np.int32),
+            "edge_doc": np.tile(edges[:, 4], 2)[order].astype(np.int32),
+            "doc_data": doc_data,
+            "doc_offsets": doc_offsets,
+            "version": np.frombuffer(version.encode("utf-8"), dtype=np.uint8),
+        })
+
+
+class NetlistGraph:
+    """Undirected netlist in CSR form: node ``n``'s edges are ``indptr[n]:indptr[n + 1]``.
+
+    Each edge slot carries its kind and the page/document it was read from.
+    Saved graphs are memory-mapped on load, so opening one is cheap.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.arrays = arrays
+        self.node_kind = arrays["node_kind"]
+        self.indptr = arrays["indptr"]
+        self.indices = arrays["indices"]
+        self.edge_kind = arrays["edge_kind"]
+        self.edge_page = arrays["edge_page"]
+        self.edge_doc = arrays["edge_doc"]
+        self.version = arrays["version"].tobytes().decode("utf-8")
+        self.docs = decode_strings(arrays["doc_data"], arrays["doc_offsets"])
+        self._keys: Optional[List[str]] = None
+        self._lookup: Optional[Dict[str, int]] = None
+
+    @property
+    def keys(self) -> List[str]:
+        if self._keys is None:
+            self._keys = decode_strings(self.arrays["key_data"], self.arrays["key_offsets"])
+        return self._keys
+
+    def __len__(self) -> int:
+        return len(self.node_kind)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices) // 2
+
+    def node(self, key: str) -> Optional[int]:
+        """Node number for a key such as ``component:CR150`` or ``wire:1520``."""
+        if self._lookup is None:
+            self._lookup = {k: i for i, k in enumerate(self.keys)}
+        return self._lookup.get(key)
+
+    def find_component(self, designator: str) -> Optional[int]:
+        return self.node(f"component:{normalize_designator(designator)}")
+
+    def neighbors(self, node: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """``(nodes, edge kinds, pages)`` adjacent to ``node``."""
+        start, end = self.indptr[node], self.indptr[node + 1]
+        return self.indices[start:end], self.edge_kind[start:end], self.edge_page[start:end]
+
+    def describe(self, node: int) -> dict:
+        kind, _, key = self.keys[node].partition(":")
+        return {"node": int(node), "kind": kind, "key": key}
+
+    def stats(self) -> dict:
+        counts = np.bincount(self.node_kind, minlength=len(NODE_KINDS))
+        edge_counts = np.bincount(self.edge_kind, minlength=len(EDGE_KINDS)) // 2
+        return {
+            "version": self.version,
+            "documents": len(self.docs),
+            "nodes": {kind: int(n) for kind, n in zip(NODE_KINDS, counts)},
+            "edges": {kind: int(n) for kind, n in zip(EDGE_KINDS, edge_counts)},
+        }
+
+    def save(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{uuid4().hex}")
+        try:
+            with tmp_path.open("wb") as out:
+                np.savez(out, **self.arrays)
+            replace_mapped(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "NetlistGraph":
+        return cls(map_npz(path))
+
+
+def build_netlist(sources: Iterable[Tuple[str, Path]]) -> NetlistGraph:
+    """Merge the ``(doc_sha256, extraction_dir)`` sources of one machine."""
+    sources = list(sources)
+    builder = NetlistBuilder()
+    for doc_sha256, extraction_dir in sources:
+        builder.add_directory(doc_sha256, extraction_dir)
+    return builder.build(version=source_version(path for _, path in sources))
@@ -0,0 +1,102 @@
+"""Single-page PDF and raster slices of source documents, cached by (doc hash, page)."""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+from uuid import uuid4
+
+from pypdf import PdfReader, PdfWriter
+
+from .blob_store import sha256_file
+
+
+class PageSlicer:
+    """Emit one page of a document on demand and keep it on disk.
+
+    Slices live under ``<root>/<doc_sha256>/`` so every machine importing the
+    same manual shares them. Parsed readers are kept for the most recently
+    used documents, which makes slicing a whole schematic a single parse.
+    """
+
+    def __init__(self, root: Path, max_open_documents: int = 4):
+        self.root = root
+        self.max_open_documents = max_open_documents
+        self._readers: "OrderedDict[str, tuple[PdfReader, threading.Lock]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _reader(self, pdf_path: Path, doc_sha256: str) -> tuple[PdfReader, threading.Lock]:
+        with self._lock:
+            entry = self._readers.get(doc_sha256)
+            if entry is None:
+                entry = (PdfReader(str(pdf_path)), threading.Lock())
+                self._readers[doc_sha256] = entry
+                while len(self._readers) > self.max_open_documents:
+                    self._readers.popitem(last=False)
+            else:
+                self._readers.move_to_end(doc_sha256)
+            return entry
+
+    def _slice_dir(self, doc_sha256: str) -> Path:
+        path = self.root / doc_sha256
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    @staticmethod
+    def _write_atomic(target: Path, write) -> None:
+        tmp_path = target.with_name(f".{target.name}.{uuid4().hex}")
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, target)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+
+    def page_count(self, pdf_path: Path, doc_sha256: Optional[str] = None) -> int:
+        reader, lock = self._reader(pdf_path, doc_sha256 or sha256_file(pdf_path))
+        with lock:
+            return len(reader.pages)
+
+    def page_pdf(self, pdf_path: Path, page: int, doc_sha256: Optional[str] = None) -> Path:
+        """Path to a PDF holding only ``page`` (1-based) of ``pdf_path``."""
+        doc_sha256 = doc_sha256 or sha256_file(pdf_path)
+        target = self._slice_dir(doc_sha256) / f"page_{page:03}.pdf"
+        if target.exists():
+            return target
+
+        reader, lock = self._reader(pdf_path, doc_sha256)
+        with lock:
+            if not 1 <= page <= len(reader.pages):
+                raise ValueError(f"Page {page} out of range (1-{len(reader.pages)}).")
+            writer = PdfWriter()
+            writer.add_page(reader.pages[page - 1])
+
+            def write(path: Path) -> None:
+                with path.open("wb") as out:
+                    writer.write(out)
+
+            self._write_atomic(target, write)
+        return target
+
+    def page_png(self, pdf_path: Path, page: int, dpi: int = 150, doc_sha256: Optional[str] = None) -> Path:
+        """Path to a PNG rendering of ``page`` at ``dpi``.
+
+        Rendering uses pypdfium2, which pdfplumber already installs.
+        """
+        import pypdfium2 as pdfium
+
+        doc_sha256 = doc_sha256 or sha256_file(pdf_path)
+        target = self._slice_dir(doc_sha256) / f"page_{page:03}_dpi{dpi}.png"
+        if target.exists():
+            return target
+
+        document = pdfium.PdfDocument(str(pdf_path))
+        try:
+            if not 1 <= page <= len(document):
+                raise ValueError(f"Page {page} out of range (1-{len(document)}).")
+            image = document[page - 1].render(scale=dpi / 72).to_pil()
+        finally:
+            document.close()
+        self._write_atomic(target, lambda path: image.save(path, "PNG"))
+        return target
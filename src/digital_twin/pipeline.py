@@ -0,0 +1,342 @@
+"""Dependency-tracked processing pipeline with a per-machine manifest."""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+from .geometry import (
+    FORMAT_VERSION,
+    PageGeometry,
+    format_version,
+    page_columns,
+    page_files,
+    page_record,
+    write_page_npz,
+)
+from .spatial_index import SpatialIndex, index_path
+from .text_extraction import extract_candidates
+from .wires import reconstruct_wires
+
+SCOPES = ("document", "machine")
+MANIFEST_VERSION = 1
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _write_json(path: Path, data) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{uuid4().hex}")
+    try:
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+@dataclass(frozen=True)
+class PipelineDocument:
+    """A raw document of the machine; per-document outputs go under ``<work_dir>/<stage>/<sha256>``."""
+    sha256: str
+    pdf_path: Path
+    work_dir: Path
+
+    def stage_dir(self, stage: str) -> Path:
+        return self.work_dir / stage / self.sha256
+
+
+@dataclass
+class StageContext:
+    """What one stage run works on.
+
+    ``resume`` is set when an earlier run with identical inputs recorded
+    outputs that have since gone missing; stages may then keep the outputs
+    that are still present and only redo the rest.
+    """
+    machine_id: str
+    out_dir: Path
+    document: Optional[PipelineDocument] = None
+    documents: Sequence[PipelineDocument] = ()
+    previous: Optional[dict] = None
+    resume: bool = False
+
+
+@dataclass(frozen=True)
+class Stage:
+    """One derivation step; bump ``version`` whenever its output changes for the same input."""
+    name: str
+    version: int
+    run: Callable[[StageContext], List[Path]]
+    depends: Tuple[str, ...] = ()
+    scope: str = "document"
+    # Inputs the manifest does not track itself, e.g. extraction results written by jobs.
+    fingerprint: Optional[Callable[[StageContext], str]] = None
+
+
+class PipelineManifest:
+    """JSON record of which outputs were derived from which inputs, by which stage version.
+
+    Layout: ``{"documents": {sha256: {stage: entry}}, "machine": {stage: entry}}``
+    where an entry holds the stage version, its input key, the output paths
+    and when it completed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.data = {"manifest_version": MANIFEST_VERSION, "documents": {}, "machine": {}}
+        if path.exists():
+            try:
+                loaded = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, json.JSONDecodeError):
+                loaded = None
+            if isinstance(loaded, dict) and loaded.get("manifest_version") == MANIFEST_VERSION:
+                self.data = loaded
+
+    def entry(self, stage: str, sha256: Optional[str] = None) -> Optional[dict]:
+        if sha256 is None:
+            return self.data["machine"].get(stage)
+        return self.data["documents"].get(sha256, {}).get(stage)
+
+    def record(self, stage: str, sha256: Optional[str], entry: dict) -> None:
+        if sha256 is None:
+            self.data["machine"][stage] = entry
+        else:
+            self.data["documents"].setdefault(sha256, {})[stage] = entry
+
+    def prune(self, sha256s: Iterable[str]) -> None:
+        """Forget documents that are no longer part of the machine."""
+        keep = set(sha256s)
+        self.data["documents"] = {sha: stages for sha, stages in self.data["documents"].items() if sha in keep}
+
+    def save(self) -> None:
+        _write_json(self.path, self.data)
+
+
+class Pipeline:
+    """Run stages in dependency order, skipping those whose manifest entry is current.
+
+    A stage's input key hashes its name and version, the document's SHA-256
+    (for document stages), the keys of the stages it depends on and its
+    optional fingerprint. Re-uploading an unchanged document therefore
+    changes nothing, and bumping one stage's version re-runs that stage and
+    its dependents only.
+    """
+
+    def __init__(self, stages: Sequence[Stage], root: Path):
+        self.stages = list(stages)
+        self.root = root
+        seen = set()
+        for stage in self.stages:
+            if stage.scope not in SCOPES:
+                raise ValueError(f"Stage {stage.name}: unknown scope {stage.scope!r}.")
+            missing = [d for d in stage.depends if d not in seen]
+            if missing:
+                raise ValueError(f"Stage {stage.name} depends on {missing}, which must come before it.")
+            if stage.scope == "document" and any(self.stage(d).scope == "machine" for d in stage.depends):
+                raise ValueError(f"Document stage {stage.name} cannot depend on a machine stage.")
+            seen.add(stage.name)
+
+    def stage(self, name: str) -> Stage:
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+    def _selected(self, names: Optional[Iterable[str]]) -> List[Stage]:
+        if names is None:
+            return self.stages
+        wanted = set()
+        pending = list(names)
+        while pending:
+            stage = self.stage(pending.pop())
+            if stage.name not in wanted:
+                wanted.add(stage.name)
+                pending.extend(stage.depends)
+        return [stage for stage in self.stages if stage.name in wanted]
+
+    def _relative(self, path: Path) -> str:
+        path = Path(path)
+        return str(path.relative_to(self.root)) if path.is_relative_to(self.root) else str(path)
+
+    def _missing_outputs(self, entry: dict) -> bool:
+        return any(not (self.root / output).exists() for output in entry.get("outputs", []))
+
+    def plan(self,
+             manifest: PipelineManifest,
+             machine_id: str,
+             machine_dir: Path,
+             documents: Sequence[PipelineDocument],
+             stages: Optional[Iterable[str]] = None) -> List[dict]:
+        """Every (stage, document) unit with its input key, status and reason if stale."""
+        keys: Dict[Tuple[str, Optional[str]], str] = {}
+        units = []
+        for stage in self._selected(stages):
+            targets = documents if stage.scope == "document" else [None]
+            for document in targets:
+                sha256 = document.sha256 if document else None
+                ctx = StageContext(
+                    machine_id=machine_id,
+                    out_dir=document.stage_dir(stage.name) if document else machine_dir / stage.name,
+                    document=document,
+                    documents=documents,
+                    previous=manifest.entry(stage.name, sha256),
+                )
+                hasher = hashlib.sha256(f"{stage.name}:{stage.version}:{sha256 or machine_id}\n".encode("utf-8"))
+                for dependency in stage.depends:
+                    dependency_shas = [sha256] if document else sorted(d.sha256 for d in documents)
+                    if self.stage(dependency).scope == "machine":
+                        dependency_shas = [None]
+                    for dependency_sha in dependency_shas:
+                        hasher.update(f"{dependency}={keys[(dependency, dependency_sha)]}\n".encode("utf-8"))
+                if stage.fingerprint is not None:
+                    hasher.update(f"fingerprint={stage.fingerprint(ctx)}\n".encode("utf-8"))
+                key = keys[(stage.name, sha256)] = hasher.hexdigest()[:16]
+
+                previous = ctx.previous
+                if previous is None:
+                    reason = "new"
+                elif previous.get("version") != stage.version:
+                    reason = "version"
+                elif previous.get("key") != key:
+                    reason = "inputs"
+                elif self._missing_outputs(previous):
+                    reason = "outputs"
+                else:
+                    reason = None
+                ctx.resume = reason == "outputs"
+                units.append({"stage": stage, "context": ctx, "key": key, "reason": reason})
+        return units
+
+    @staticmethod
+    def describe(units: List[dict]) -> List[dict]:
+        return [
+            {
+                "stage": unit["stage"].name,
+                "sha256": unit["context"].document.sha256 if unit["context"].document else None,
+                "key": unit["key"],
+                "status": "stale" if unit["reason"] else "current",
+                "reason": unit["reason"],
+            }
+            for unit in units
+        ]
+
+    def run(self,
+            manifest: PipelineManifest,
+            machine_id: str,
+            machine_dir: Path,
+            documents: Sequence[PipelineDocument],
+            stages: Optional[Iterable[str]] = None,
+            on_event: Optional[Callable[[dict], None]] = None) -> dict:
+        """Run every stale unit and record it in the manifest as soon as it finishes.
+
+        A failed unit blocks its dependents for that document (or, for
+        machine stages, everywhere) but not unrelated work. ``on_event`` is
+        called before and after each unit and may raise to stop the run.
+        """
+        manifest.prune(d.sha256 for d in documents)
+        units = self.plan(manifest, machine_id, machine_dir, documents, stages)
+        emit = on_event or (lambda event: None)
+        failed: set = set()
+        counts = {"ran": 0, "skipped": 0, "failed": 0, "blocked": 0}
+        for unit in units:
+            stage, ctx = unit["stage"], unit["context"]
+            sha256 = ctx.document.sha256 if ctx.document else None
+            info = {"stage": stage.name, "sha256": sha256}
+            if unit["reason"] is None:
+                counts["skipped"] += 1
+                continue
+            if ctx.document is not None:
+                blocked = any((d, sha256) in failed for d in stage.depends)
+            else:
+                blocked = any(name in stage.depends for name, _ in failed)
+            if blocked:
+                failed.add((stage.name, sha256))
+                counts["blocked"] += 1
+                emit({**info, "status": "blocked"})
+                continue
+
+            emit({**info, "status": "running", "reason": unit["reason"]})
+            started = time.perf_counter()
+            try:
+                outputs = stage.run(ctx)
+            except Exception as exc:
+                failed.add((stage.name, sha256))
+                counts["failed"] += 1
+                emit({**info, "status": "failed", "error": str(exc)})
+                continue
+            entry = {
+                "version": stage.version,
+                "key": unit["key"],
+                "outputs": sorted(self._relative(path) for path in outputs),
+                "completed_at": _now(),
+                "elapsed_s": round(time.perf_counter() - started, 3),
+            }
+            manifest.record(stage.name, sha256, entry)
+            manifest.save()
+            counts["ran"] += 1
+            emit({**info, "status": "completed", "outputs": len(entry["outputs"]), "elapsed_s": entry["elapsed_s"]})
+        manifest.save()
+        return counts
+
+
+def run_geometry(ctx: StageContext) -> List[Path]:
+    """Columnar page geometry and a spatial index for every page of the document."""
+    import pdfplumber
+
+    ctx.out_dir.mkdir(parents=True, exist_ok=True)
+    outputs = []
+    with pdfplumber.open(ctx.document.pdf_path) as pdf:
+        for number, page in enumerate(pdf.pages, start=1):
+            page_path = ctx.out_dir / f"page_{number:03}.npz"
+            if not (ctx.resume and page_path.exists() and index_path(page_path).exists()
+                    and format_version(page_path) == FORMAT_VERSION):
+                page_rec = page_record(page, number)
+                write_page_npz(page_path, page_rec)
+                SpatialIndex.build(PageGeometry(page_columns(page_rec))).save(index_path(page_path))
+            page.close()
+            outputs.extend([page_path, index_path(page_path)])
+    return outputs
+
+
+def run_candidates(ctx: StageContext) -> List[Path]:
+    """Text-layer components, wire numbers and cross references per page, from stored geometry."""
+    ctx.out_dir.mkdir(parents=True, exist_ok=True)
+    outputs = []
+    for geometry_path in page_files(ctx.document.stage_dir("geometry")):
+        out_path = ctx.out_dir / f"{geometry_path.stem}.json"
+        if not (ctx.resume and out_path.exists()):
+            _write_json(out_path, extract_candidates(PageGeometry.open(geometry_path),
+                                                     document=ctx.document.sha256))
+        outputs.append(out_path)
+    return outputs
+
+
+def run_wires(ctx: StageContext) -> List[Path]:
+    """Wire nets rebuilt from each page's line work, labelled with the stored candidates."""
+    ctx.out_dir.mkdir(parents=True, exist_ok=True)
+    candidates_dir = ctx.document.stage_dir("candidates")
+    outputs = []
+    for geometry_path in page_files(ctx.document.stage_dir("geometry")):
+        out_path = ctx.out_dir / f"{geometry_path.stem}.json"
+        if not (ctx.resume and out_path.exists()):
+            candidates_path = candidates_dir / f"{geometry_path.stem}.json"
+            candidates = json.loads(candidates_path.read_text(encoding="utf-8")) if candidates_path.exists() else None
+            graph = reconstruct_wires(PageGeometry.open(geometry_path), candidates, document=ctx.document.sha256)
+            _write_json(out_path, graph.to_dict())
+        outputs.append(out_path)
+    return outputs
+
+
+# The stage version follows the file format, so a format bump rebuilds stored
+# geometry (format 2 stores curves, i.e. junction dots).
+GEOMETRY_STAGE = Stage("geometry", version=FORMAT_VERSION, run=run_geometry)
+CANDIDATES_STAGE = Stage("candidates", version=1, run=run_candidates, depends=("geometry",))
+WIRES_STAGE = Stage("wires", version=1, run=run_wires, depends=("geometry", "candidates"))
@@ -0,0 +1,250 @@
+"""Append-only JSONL record store with in-memory secondary indexes."""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+
+class RecordStore:
+    """Persist dict records keyed by ``id`` as an append-only JSONL log.
+
+    Every write appends a single line, so ingest cost does not grow with the
+    number of stored records. The latest version of each record is kept in
+    memory together with secondary indexes on ``index_fields``; reads never
+    touch the disk. Once superseded lines outnumber live records the log is
+    compacted in place.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        index_fields: Sequence[str] = (),
+        legacy_json_path: Optional[Path] = None,
+        min_compact_lines: int = 1000,
+    ):
+        self.path = path
+        self.index_fields = tuple(index_fields)
+        self.legacy_json_path = legacy_json_path
+        self.min_compact_lines = min_compact_lines
+        self._lock = threading.RLock()
+        self._records: Dict[str, dict] = {}
+        self._indexes: Dict[str, Dict[object, Dict[str, None]]] = {f: {} for f in self.index_fields}
+        # Where each live record sits in ``_records``; index buckets are
+        # re-ordered by updates, so ``find`` sorts its matches by this.
+        self._positions: Dict[str, int] = {}
+        self._next_position = 0
+        self._log_lines = 0
+        self._handle = None
+        self._loaded = False
+
+    # ------------------------------------------------------------------ loading
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self._truncate_torn_tail()
+            with self.path.open("r", encoding="utf-8") as fh:
+                for line in fh:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    self._log_lines += 1
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A corrupt complete line; skipped now and gone after the next rewrite.
+                        continue
+                    self._apply(entry)
+        elif self.legacy_json_path and self.legacy_json_path.exists():
+            self._import_legacy()
+        self._handle = self.path.open("a", encoding="utf-8")
+        self._loaded = True
+
+    def _truncate_torn_tail(self) -> None:
+        """Cut a crash-torn last line (no trailing newline) so new appends start on a fresh line."""
+        with self.path.open("rb+") as fh:
+            end = fh.seek(0, os.SEEK_END)
+            position = end
+            while position > 0:
+                start = max(0, position - 65536)
+                fh.seek(start)
+                newline = fh.read(position - start).rfind(b"\n")
+                if newline >= 0:
+                    position = start + newline + 1
+                    break
+                position = start
+            if position < end:
+                fh.truncate(position)
+
+    def _import_legacy(self) -> None:
+        """Seed the log from a whole-file JSON array written by older versions."""
+        try:
+            legacy = json.loads(self.legacy_json_path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"{self.legacy_json_path} is not valid JSON.") from exc
+        for record in legacy:
+            if isinstance(record, dict) and record.get("id"):
+                self._apply(record)
+        self._rewrite()
+
+    # ------------------------------------------------------------------ indexing
+
+    def _apply(self, entry: dict) -> None:
+        record_id = entry.get("id")
+        if not record_id:
+            return
+        previous = self._records.get(record_id)
+        if previous is not None:
+            self._unindex(previous)
+        if entry.get("_deleted"):
+            self._records.pop(record_id, None)
+            self._positions.pop(record_id, None)
+            return
+        if previous is None:
+            self._positions[record_id] = self._next_position
+            self._next_position += 1
+        # A copy, so callers mutating their dict cannot change the stored record.
+        entry = dict(entry)
+        self._records[record_id] = entry
+        self._index(entry)
+
+    def _index(self, record: dict) -> None:
+        for field_name in self.index_fields:
+            value = record.get(field_name)
+            if value is not None:
+                self._indexes[field_name].setdefault(value, {})[record["id"]] = None
+
+    def _unindex(self, record: dict) -> None:
+        for field_name in self.index_fields:
+            bucket = self._indexes[field_name].get(record.get(field_name))
+            if bucket is not None:
+                bucket.pop(record["id"], None)
+                if not bucket:
+                    del self._indexes[field_name][record.get(field_name)]
+
+    # ------------------------------------------------------------------ writing
+
+    def _append(self, entry: dict) -> None:
+        self._handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._handle.flush()
+        self._log_lines += 1
+        self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        stale = self._log_lines - len(self._records)
+        if self._log_lines >= self.min_compact_lines and stale > len(self._records):
+            self._rewrite()
+
+    def _rewrite(self) -> None:
+        """Rewrite the log so it holds exactly one line per live record."""
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with tmp_path.open("w", encoding="utf-8") as out:
+            for record in self._records.values():
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            os.fsync(out.fileno())
+        if self._handle is not None:
+            self._handle.close()
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(self._records)
+        if self._handle is not None:
+            self._handle = self.path.open("a", encoding="utf-8")
+
+    def put(self, record: dict) -> dict:
+        """Insert or replace a record (matched on ``id``)."""
+        if not record.get("id"):
+            raise ValueError("Records must carry an 'id'.")
+        with self._lock:
+            self._ensure_loaded()
+            self._apply(record)
+            self._append(record)
+        return record
+
+    def put_many(self, records: Iterable[dict]) -> List[dict]:
+        with self._lock:
+            return [self.put(record) for record in records]
+
+    def update(self, record_id: str, **fields) -> Optional[dict]:
+        """Merge ``fields`` into an existing record; returns None if unknown."""
+        with self._lock:
+            self._ensure_loaded()
+            current = self._records.get(record_id)
+            if current is None:
+                return None
+            return self.put({**current, **fields})
+
+    def delete(self, record_id: str) -> bool:
+        with self._lock:
+            self._ensure_loaded()
+            if record_id not in self._records:
+                return False
+            tombstone = {"id": record_id, "_deleted": True}
+            self._apply(tombstone)
+            self._append(tombstone)
+            return True
+
+    def compact(self) -> None:
+        with self._lock:
+            self._ensure_loaded()
+            self._rewrite()
+
+    # ------------------------------------------------------------------ reading
+
+    def get(self, record_id: str) -> Optional[dict]:
+        with self._lock:
+            self._ensure_loaded()
+            record = self._records.get(record_id)
+            return dict(record) if record is not None else None
+
+    def all(self) -> List[dict]:
+        with self._lock:
+            self._ensure_loaded()
+            return [dict(r) for r in self._records.values()]
+
+    def find(self, **criteria) -> List[dict]:
+        """Return records whose fields equal ``criteria``, in insertion order.
+
+        Indexed fields are resolved through their index (smallest bucket
+        first); any remaining criteria are checked against the candidates.
+        Results follow the order of :meth:`all`: updates keep a record's
+        place, and a deleted record that is put again goes last.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            criteria = {k: v for k, v in criteria.items() if v is not None}
+            if not criteria:
+                return [dict(r) for r in self._records.values()]
+
+            if "id" in criteria:
+                record = self._records.get(criteria.pop("id"))
+                candidates: Iterable[str] = [record["id"]] if record else []
+            else:
+                indexed = [k for k in criteria if k in self._indexes]
+                if indexed:
+                    buckets = [self._indexes[k].get(criteria[k], {}) for k in indexed]
+                    candidates = sorted(min(buckets, key=len), key=self._positions.__getitem__)
+                else:
+                    candidates = self._records.keys()
+
+            matches = []
+            for record_id in candidates:
+                record = self._records[record_id]
+                if all(record.get(k) == v for k, v in criteria.items()):
+                    matches.append(dict(record))
+            return matches
+
+    def values(self, field_name: str) -> List[object]:
+        """Distinct values of an indexed field."""
+        with self._lock:
+            self._ensure_loaded()
+            return list(self._indexes[field_name].keys())
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._records)
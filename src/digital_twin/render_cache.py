@@ -0,0 +1,272 @@
+"""Tiled, multi-resolution page rasters cached by (doc hash, page, dpi)."""
+from __future__ import annotations
+
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence
+from uuid import uuid4
+
+DEFAULT_DPI = 200
+DPI_RANGE = (36, 600)
+TILE_SIZE = 512
+POINTS_PER_INCH = 72
+
+# pdfium is not thread-safe; in-process renders take turns.
+_pdfium_lock = threading.Lock()
+
+
+def write_pyramid(image, target: Path, page: int, dpi: int, tile_size: int = TILE_SIZE) -> dict:
+    """Cut ``image`` into tiles at full size and each halving down to one tile.
+
+    Tiles are ``<target>/<level>/<col>_<row>.png``; ``meta.json`` is written
+    last and the directory is moved into place whole, so a page directory
+    that exists is always complete.
+    """
+    tmp_dir = target.with_name(f".{target.name}.{uuid4().hex}")
+    tmp_dir.mkdir(parents=True)
+    levels = []
+    level = 0
+    while True:
+        width, height = image.size
+        columns, rows = math.ceil(width / tile_size), math.ceil(height / tile_size)
+        level_dir = tmp_dir / str(level)
+        level_dir.mkdir()
+        for row in range(rows):
+            for column in range(columns):
+                box = (column * tile_size, row * tile_size,
+                       min(width, (column + 1) * tile_size), min(height, (row + 1) * tile_size))
+                image.crop(box).save(level_dir / f"{column}_{row}.png", "PNG", compress_level=3)
+        levels.append({
+            "level": level,
+            "scale": dpi / POINTS_PER_INCH / 2 ** level,
+            "width": width,
+            "height": height,
+            "columns": columns,
+            "rows": rows,
+        })
+        if columns == 1 and rows == 1:
+            break
+        image = image.reduce(2)
+        level += 1
+    meta = {"page": page, "dpi": dpi, "tile_size": tile_size, "levels": levels}
+    (tmp_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    try:
+        os.rename(tmp_dir, target)
+    except OSError:
+        # Another renderer finished the same page first; keep theirs.
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return meta
+
+
+def _render(document, page: int, dpi: int, tile_size: int, target: Path) -> dict:
+    image = document[page - 1].render(scale=dpi / POINTS_PER_INCH).to_pil()
+    return write_pyramid(image, target, page, dpi, tile_size)
+
+
+# Documents each pool worker keeps open, oldest closed first.
+WORKER_OPEN_DOCUMENTS = 4
+_worker_documents: Dict[str, object] = {}
+
+
+def _worker_document(pdf_path: str):
+    # Jobs share the pool, so a worker opens each PDF once and reuses it for later pages.
+    document = _worker_documents.get(pdf_path)
+    if document is None:
+        import pypdfium2 as pdfium
+
+        while len(_worker_documents) >= WORKER_OPEN_DOCUMENTS:
+            _worker_documents.pop(next(iter(_worker_documents))).close()
+        document = _worker_documents[pdf_path] = pdfium.PdfDocument(pdf_path)
+    return document
+
+
+def _render_in_worker(pdf_path: str, page: int, dpi: int, tile_size: int, target: Path) -> dict:
+    return _render(_worker_document(pdf_path), page, dpi, tile_size, target)
+
+
+class RenderCache:
+    """Rasterize each (document, page, dpi) once and serve tiles and crops from disk.
+
+    Pages live under ``<root>/<doc_sha256>/page_NNN/dpi<D>/`` so every
+    machine importing the same manual shares them. Single pages render in
+    process on first use; :meth:`render_pages` fans a batch out over one
+    process pool of ``workers`` processes, created on first use and shared
+    by every batch until :meth:`close`.
+    """
+
+    def __init__(self, root: Path, tile_size: int = TILE_SIZE, workers: int = 1):
+        self.root = root
+        self.tile_size = tile_size
+        self.workers = workers
+        self._meta: Dict[tuple, dict] = {}
+        self._page_counts: Dict[str, int] = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawned, not forked: the server process has threads that may hold pdfium.
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def close(self) -> None:
+        """Shut the render pool down; a later batch starts a new one."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def check_dpi(dpi: int) -> int:
+        low, high = DPI_RANGE
+        if not low <= dpi <= high:
+            raise ValueError(f"dpi must be between {low} and {high}.")
+        return dpi
+
+    def page_dir(self, doc_sha256: str, page: int, dpi: int) -> Path:
+        return self.root / doc_sha256 / f"page_{page:03}" / f"dpi{dpi}"
+
+    def page_count(self, pdf_path: Path, doc_sha256: str) -> int:
+        count = self._page_counts.get(doc_sha256)
+        if count is None:
+            import pypdfium2 as pdfium
+
+            with _pdfium_lock:
+                document = pdfium.PdfDocument(str(pdf_path))
+                try:
+                    count = len(document)
+                finally:
+                    document.close()
+            self._page_counts[doc_sha256] = count
+        return count
+
+    def _check_page(self, pdf_path: Path, doc_sha256: str, page: int) -> None:
+        count = self.page_count(pdf_path, doc_sha256)
+        if not 1 <= page <= count:
+            raise ValueError(f"Page {page} out of range (1-{count}).")
+
+    def cached_meta(self, doc_sha256: str, page: int, dpi: int) -> Optional[dict]:
+        key = (doc_sha256, page, dpi)
+        meta = self._meta.get(key)
+        if meta is None:
+            path = self.page_dir(doc_sha256, page, dpi) / "meta.json"
+            if not path.exists():
+                return None
+            meta = self._meta[key] = json.loads(path.read_text(encoding="utf-8"))
+        return meta
+
+    def ensure(self, pdf_path: Path, doc_sha256: str, page: int, dpi: int = DEFAULT_DPI) -> dict:
+        """Tile metadata for the page, rendering it first if needed."""
+        self.check_dpi(dpi)
+        meta = self.cached_meta(doc_sha256, page, dpi)
+        if meta is not None:
+            return meta
+        self._check_page(pdf_path, doc_sha256, page)
+        import pypdfium2 as pdfium
+
+        target = self.page_dir(doc_sha256, page, dpi)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with _pdfium_lock:
+            if not target.exists():
+                document = pdfium.PdfDocument(str(pdf_path))
+                try:
+                    _render(document, page, dpi, self.tile_size, target)
+                finally:
+                    document.close()
+        return self.cached_meta(doc_sha256, page, dpi)
+
+    def render_pages(self,
+                     pdf_path: Path,
+                     doc_sha256: str,
+                     pages: Optional[Iterable[int]] = None,
+                     dpi: int = DEFAULT_DPI,
+                     on_page=None) -> dict:
+        """Render every missing page of ``pages`` (default: all) on the shared pool."""
+        self.check_dpi(dpi)
+        count = self.page_count(pdf_path, doc_sha256)
+        pages = sorted(set(pages)) if pages is not None else list(range(1, count + 1))
+        for page in pages:
+            self._check_page(pdf_path, doc_sha256, page)
+        missing = [p for p in pages if self.cached_meta(doc_sha256, p, dpi) is None]
+        for page in missing:
+            self.page_dir(doc_sha256, page, dpi).parent.mkdir(parents=True, exist_ok=True)
+
+        if self.workers <= 1 or len(missing) <= 1:
+            for page in missing:
+                self.ensure(pdf_path, doc_sha256, page, dpi)
+                if on_page:
+                    on_page(page)
+        else:
+            pool = self._process_pool()
+            futures = {
+                pool.submit(_render_in_worker, str(pdf_path), page, dpi, self.tile_size,
+                            self.page_dir(doc_sha256, page, dpi)): page
+                for page in missing
+            }
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    if on_page:
+                        on_page(futures[future])
+            finally:
+                for future in futures:
+                    future.cancel()
+        return {"pages": len(pages), "rendered": len(missing), "cached": len(pages) - len(missing), "dpi": dpi}
+
+    def tile_path(self,
+                  pdf_path: Path,
+                  doc_sha256: str,
+                  page: int,
+                  level: int,
+                  column: int,
+                  row: int,
+                  dpi: int = DEFAULT_DPI) -> Path:
+        meta = self.ensure(pdf_path, doc_sha256, page, dpi)
+        if not 0 <= level < len(meta["levels"]):
+            raise ValueError(f"Level {level} out of range (0-{len(meta['levels']) - 1}).")
+        info = meta["levels"][level]
+        if not (0 <= column < info["columns"] and 0 <= row < info["rows"]):
+            raise ValueError(f"Tile {column},{row} out of range for level {level}.")
+        return self.page_dir(doc_sha256, page, dpi) / str(level) / f"{column}_{row}.png"
+
+    def crop(self,
+             pdf_path: Path,
+             doc_sha256: str,
+             page: int,
+             bbox: Sequence[float],
+             dpi: int = DEFAULT_DPI,
+             level: int = 0):
+        """PIL image of ``bbox`` (``x0, top, x1, bottom`` in PDF points), stitched from tiles."""
+        from PIL import Image
+
+        meta = self.ensure(pdf_path, doc_sha256, page, dpi)
+        level = min(max(level, 0), len(meta["levels"]) - 1)
+        info = meta["levels"][level]
+        size = meta["tile_size"]
+        x0, top, x1, bottom = (v * info["scale"] for v in bbox)
+        x0, top = max(0, int(math.floor(x0))), max(0, int(math.floor(top)))
+        x1, bottom = min(info["width"], int(math.ceil(x1))), min(info["height"], int(math.ceil(bottom)))
+        if x1 <= x0 or bottom <= top:
+            raise ValueError("Crop box is empty or outside the page.")
+        out = Image.new("RGB", (x1 - x0, bottom - top), "white")
+        level_dir = self.page_dir(doc_sha256, page, dpi) / str(level)
+        for row in range(top // size, (bottom - 1) // size + 1):
+            for column in range(x0 // size, (x1 - 1) // size + 1):
+                with Image.open(level_dir / f"{column}_{row}.png") as tile:
+                    out.paste(tile.convert("RGB"), (column * size - x0, row * size - top))
+        return out
+
+    def page_image(self, pdf_path: Path, doc_sha256: str, page: int, dpi: int = DEFAULT_DPI, level: int = 0):
+        """The whole page at one pyramid level."""
+        meta = self.ensure(pdf_path, doc_sha256, page, dpi)
+        scale = meta["levels"][0]["scale"]
+        return self.crop(pdf_path, doc_sha256, page,
+                         (0, 0, meta["levels"][0]["width"] / scale, meta["levels"][0]["height"] / scale), dpi, level)
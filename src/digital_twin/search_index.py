@@ -0,0 +1,226 @@
+"""Full-text page search over uploaded manuals (SQLite FTS5, BM25-ranked)."""
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import closing
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+# Han, Hiragana, Katakana (incl. half-width after NFKC) and the prolonged sound mark.
+CJK_CLASS = r"々぀-ヿ㐀-䶿一-鿿豈-﫿"
+TOKEN_RE = re.compile(rf"[{CJK_CLASS}]+|[^\W{CJK_CLASS}]+", re.UNICODE)
+CJK_RUN_RE = re.compile(rf"^[{CJK_CLASS}]+$")
+SNIPPET_RADIUS = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    sha256 TEXT PRIMARY KEY,
+    page_count INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    UNIQUE (sha256, page)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS page_terms USING fts5(
+    terms,
+    tokenize = "unicode61 remove_diacritics 0"
+);
+"""
+
+
+def normalize_text(text: str) -> str:
+    """NFKC-fold (full-width to ASCII, half-width kana to full-width) and lower-case."""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def _run_terms(run: str) -> List[str]:
+    # Japanese has no word breaks; overlapping bigrams match any substring of two or more characters.
+    if CJK_RUN_RE.match(run):
+        if len(run) == 1:
+            return [run]
+        return [run[i:i + 2] for i in range(len(run) - 1)]
+    return [run]
+
+
+def tokenize(text: str) -> List[str]:
+    """Terms for indexing: Latin/digit words as-is, CJK runs as overlapping bigrams.
+
+    Longer CJK runs are followed by their single characters too, so a
+    one-character query (盤, 線) matches; they come after the run's bigrams,
+    which therefore stay adjacent for phrase queries.
+    """
+    terms: List[str] = []
+    for run in TOKEN_RE.findall(normalize_text(text)):
+        terms.extend(_run_terms(run))
+        if len(run) > 1 and CJK_RUN_RE.match(run):
+            terms.extend(run)
+    return terms
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """FTS5 MATCH expression requiring every query word; CJK words become bigram phrases."""
+    phrases = []
+    for run in TOKEN_RE.findall(normalize_text(query)):
+        terms = _run_terms(run)
+        phrases.append('"' + " ".join(t.replace('"', '""') for t in terms) + '"')
+    return " AND ".join(phrases) if phrases else None
+
+
+def make_snippet(text: str, query: str, radius: int = SNIPPET_RADIUS) -> dict:
+    """Excerpt around the first query hit, with ``[start, end)`` highlight offsets into it."""
+    display = unicodedata.normalize("NFKC", text or "")
+    words = {w for w in TOKEN_RE.findall(normalize_text(query))}
+    hits = sorted(
+        (match.start(), match.end())
+        for word in words
+        for match in re.finditer(re.escape(word), display, re.IGNORECASE)
+    )
+    if not hits:
+        return {"text": re.sub(r"\s+", " ", display[:2 * radius]).strip(), "highlights": []}
+    start = max(0, hits[0][0] - radius)
+    end = min(len(display), hits[0][1] + radius)
+    prefix = "…" if start > 0 else ""
+    # Collapse whitespace; position[i] is where window[i] lands in the output.
+    position, out = [], []
+    for ch in display[start:end]:
+        if ch.isspace():
+            if out and out[-1] == " ":
+                position.append(len(out) - 1)
+                continue
+            ch = " "
+        position.append(len(out))
+        out.append(ch)
+    position.append(len(out))
+    shift = len(prefix)
+    return {
+        "text": prefix + "".join(out) + ("…" if end < len(display) else ""),
+        "highlights": [
+            [position[s - start] + shift, position[e - start] + shift]
+            for s, e in hits
+            if s >= start and e <= end
+        ],
+    }
+
+
+def extract_page_texts(pdf_path: Path) -> List[str]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(str(pdf_path))
+    texts = []
+    for page in reader.pages:
+        try:
+            texts.append(page.extract_text() or "")
+        except Exception:
+            texts.append("")
+    return texts
+
+
+class SearchIndex:
+    """Page-level inverted index shared by every machine.
+
+    Documents are indexed once per SHA-256, so the same manual uploaded for
+    several machines costs one extraction. Text is pre-tokenized in Python
+    (CJK bigrams plus single characters, NFKC folding) and stored
+    space-separated in an FTS5 table; ranking is FTS5's BM25.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+    def has_document(self, sha256: str) -> bool:
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT 1 FROM documents WHERE sha256 = ?", (sha256,)).fetchone() is not None
+
+    def add_document(self, sha256: str, page_texts: Iterable[str]) -> int:
+        """Index ``page_texts`` (page 1 first) under ``sha256``; replaces any earlier copy."""
+        page_texts = list(page_texts)
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            self._delete(conn, sha256)
+            for number, text in enumerate(page_texts, start=1):
+                cursor = conn.execute(
+                    "INSERT INTO pages (sha256, page, text) VALUES (?, ?, ?)", (sha256, number, text)
+                )
+                conn.execute(
+                    "INSERT INTO page_terms (rowid, terms) VALUES (?, ?)",
+                    (cursor.lastrowid, " ".join(tokenize(text))),
+                )
+            conn.execute(
+                "INSERT INTO documents (sha256, page_count, indexed_at) VALUES (?, ?, ?)",
+                (sha256, len(page_texts), time.time()),
+            )
+        return len(page_texts)
+
+    def index_pdf(self, sha256: str, pdf_path: Path, replace: bool = False) -> bool:
+        """Extract and index ``pdf_path`` unless its SHA-256 is already indexed (or ``replace``)."""
+        if not replace and self.has_document(sha256):
+            return False
+        self.add_document(sha256, extract_page_texts(pdf_path))
+        return True
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, sha256: str) -> None:
+        conn.execute("DELETE FROM page_terms WHERE rowid IN (SELECT id FROM pages WHERE sha256 = ?)", (sha256,))
+        conn.execute("DELETE FROM pages WHERE sha256 = ?", (sha256,))
+        conn.execute("DELETE FROM documents WHERE sha256 = ?", (sha256,))
+
+    def remove_document(self, sha256: str) -> None:
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            self._delete(conn, sha256)
+
+    def search(self,
+               query: str,
+               limit: int = 20,
+               sha256s: Optional[Iterable[str]] = None) -> List[dict]:
+        """Best-matching pages as ``{sha256, page, score, snippet}``; lower BM25 is better."""
+        match = build_match_query(query)
+        if match is None:
+            return []
+        sql = (
+            "SELECT p.sha256, p.page, p.text, bm25(page_terms) AS score "
+            "FROM page_terms JOIN pages p ON p.id = page_terms.rowid "
+            "WHERE page_terms MATCH ?"
+        )
+        params: list = [match]
+        if sha256s is not None:
+            sha256s = list(sha256s)
+            if not sha256s:
+                return []
+            sql += f" AND p.sha256 IN ({','.join('?' * len(sha256s))})"
+            params.extend(sha256s)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        with closing(self._connect()) as conn:
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError:
+                return []
+        return [
+            {"sha256": sha, "page": page, "score": round(score, 4), "snippet": make_snippet(text, query)}
+            for sha, page, text, score in rows
+        ]
+
+    def stats(self) -> dict:
+        with closing(self._connect()) as conn:
+            documents, pages = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(page_count), 0) FROM documents"
+            ).fetchone()
+        return {"documents": documents, "pages": pages}
@@ -0,0 +1,275 @@
+"""Grid-bucket spatial index over the words, lines and rects of a page."""
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+from .geometry import PageGeometry, map_npz, replace_mapped
+
+KINDS = ("word", "line", "rect")
+
+
+def _kind_codes(kinds: Optional[Iterable[str]]) -> Optional[np.ndarray]:
+    if kinds is None:
+        return None
+    if isinstance(kinds, str):
+        kinds = (kinds,)
+    return np.array([KINDS.index(kind) for kind in kinds], dtype=np.uint8)
+
+
+class SpatialIndex:
+    """Uniform grid of buckets over element bounding boxes.
+
+    Every element is entered in each cell its box overlaps; buckets are
+    stored CSR-style (``cell_start`` offsets into ``cell_items``) so the whole
+    index is a handful of flat arrays that save to and memory-map from one
+    ``.npz``. Item ``i`` is element ``ids[i]`` of kind ``KINDS[kinds[i]]``
+    and is matched by its box; diagonal lines are treated as their bounding
+    box.
+    """
+
+    def __init__(self,
+                 boxes: np.ndarray,
+                 kinds: np.ndarray,
+                 ids: np.ndarray,
+                 origin: Tuple[float, float],
+                 cell_size: float,
+                 grid_shape: Tuple[int, int],
+                 cell_start: np.ndarray,
+                 cell_items: np.ndarray):
+        self.boxes = boxes
+        self.kinds = kinds
+        self.ids = ids
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.cell_size = float(cell_size)
+        self.grid_shape = (int(grid_shape[0]), int(grid_shape[1]))
+        self.cell_start = cell_start
+        self.cell_items = cell_items
+
+    # -- construction -----------------------------------------------------
+
+    @classmethod
+    def from_boxes(cls,
+                   boxes: np.ndarray,
+                   kinds: np.ndarray,
+                   ids: np.ndarray,
+                   cell_size: Optional[float] = None) -> "SpatialIndex":
+        """Build from ``(n, 4)`` boxes as ``x0, top, x1, bottom``."""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        count = len(boxes)
+        if count:
+            x_min, y_min = float(boxes[:, 0].min()), float(boxes[:, 1].min())
+            x_max, y_max = float(boxes[:, 2].max()), float(boxes[:, 3].max())
+        else:
+            x_min = y_min = x_max = y_max = 0.0
+        if cell_size is None:
+            # Aim for a few items per cell on average, never finer than 4pt.
+            area = max((x_max - x_min) * (y_max - y_min), 1.0)
+            cell_size = max(4.0, float(np.sqrt(area / max(count, 1))) * 2)
+        cols = max(1, int((x_max - x_min) // cell_size) + 1)
+        rows = max(1, int((y_max - y_min) // cell_size) + 1)
+
+        cx0 = ((boxes[:, 0] - x_min) // cell_size).astype(np.int64)
+        cx1 = ((boxes[:, 2] - x_min) // cell_size).astype(np.int64)
+        cy0 = ((boxes[:, 1] - y_min) // cell_size).astype(np.int64)
+        cy1 = ((boxes[:, 3] - y_min) // cell_size).astype(np.int64)
+        span_x = cx1 - cx0 + 1
+        per_item = span_x * (cy1 - cy0 + 1)
+
+        item = np.repeat(np.arange(count, dtype=np.int64), per_item)
+        local = np.arange(len(item), dtype=np.int64) - np.repeat(np.cumsum(per_item) - per_item, per_item)
+        cells = (cy0[item] + local // span_x[item]) * cols + cx0[item] + local % span_x[item]
+
+        order = np.argsort(cells, kind="stable")
+        cell_items = item[order].astype(np.int32)
+        cell_start = np.zeros(rows * cols + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=rows * cols), out=cell_start[1:])
+        return cls(boxes, np.asarray(kinds, dtype=np.uint8), np.asarray(ids, dtype=np.int32),
+                   (x_min, y_min), cell_size, (rows, cols), cell_start, cell_items)
+
+    @classmethod
+    def build(cls, page: PageGeometry, cell_size: Optional[float] = None) -> "SpatialIndex":
+        """Index every word, line and rect of ``page``."""
+        words, lines, rects = page.words, page.lines, page.rects
+        boxes = np.concatenate([
+            np.column_stack([words.x0, words.top, words.x1, words.bottom]),
+            np.column_stack([
+                np.minimum(lines.x0, lines.x1), np.minimum(lines.y0, lines.y1),
+                np.maximum(lines.x0, lines.x1), np.maximum(lines.y0, lines.y1),
+            ]),
+            np.column_stack([rects.x0, rects.top, rects.x1, rects.bottom]),
+        ]).astype(np.float32).reshape(-1, 4)
+        sizes = (len(words), len(lines), len(rects))
+        kinds = np.repeat(np.arange(len(KINDS), dtype=np.uint8), sizes)
+        ids = np.concatenate([np.arange(n, dtype=np.int32) for n in sizes])
+        return cls.from_boxes(boxes, kinds, ids, cell_size)
+
+    # -- persistence ------------------------------------------------------
+
+    def save(self, path: Path) -> Path:
+        tmp_path = path.with_name(f".{path.name}.{uuid4().hex}")
+        try:
+            with tmp_path.open("wb") as out:
+                np.savez(
+                    out,
+                    boxes=self.boxes,
+                    kinds=self.kinds,
+                    ids=self.ids,
+                    origin=np.array(self.origin, dtype=np.float64),
+                    cell_size=np.array(self.cell_size, dtype=np.float64),
+                    grid_shape=np.array(self.grid_shape, dtype=np.int64),
+                    cell_start=self.cell_start,
+                    cell_items=self.cell_items,
+                )
+            replace_mapped(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        return path
+
+    @classmethod
+    def load(cls, path: Path) -> "SpatialIndex":
+        m = map_npz(Path(path))
+        return cls(m["boxes"], m["kinds"], m["ids"], tuple(m["origin"]), float(m["cell_size"]),
+                   tuple(m["grid_shape"]), m["cell_start"], m["cell_items"])
+
+    # -- queries ----------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    def _cell_range(self, lo: float, hi: float, origin: float, limit: int) -> Tuple[int, int]:
+        first = int(np.floor((lo - origin) / self.cell_size))
+        last = int(np.floor((hi - origin) / self.cell_size))
+        return max(first, 0), min(last, limit - 1)
+
+    def _candidates(self, x0: float, top: float, x1: float, bottom: float) -> np.ndarray:
+        rows, cols = self.grid_shape
+        c0, c1 = self._cell_range(x0, x1, self.origin[0], cols)
+        r0, r1 = self._cell_range(top, bottom, self.origin[1], rows)
+        if c0 > c1 or r0 > r1:
+            return np.empty(0, dtype=np.int32)
+        chunks = []
+        for row in range(r0, r1 + 1):
+            # Cells of one row are contiguous, so each row is a single slice.
+            start = self.cell_start[row * cols + c0]
+            end = self.cell_start[row * cols + c1 + 1]
+            chunks.append(self.cell_items[start:end])
+        return np.unique(np.concatenate(chunks))
+
+    def _filter_kinds(self, items: np.ndarray, kinds: Optional[Iterable[str]]) -> np.ndarray:
+        codes = _kind_codes(kinds)
+        if codes is None or not len(items):
+            return items
+        return items[np.isin(self.kinds[items], codes)]
+
+    def query_box(self,
+                  x0: float,
+                  top: float,
+                  x1: float,
+                  bottom: float,
+                  kinds: Optional[Iterable[str]] = None,
+                  contained: bool = False) -> np.ndarray:
+        """Items whose box intersects (or with ``contained``, lies inside) the query box."""
+        items = self._filter_kinds(self._candidates(x0, top, x1, bottom), kinds)
+        b = self.boxes[items]
+        if contained:
+            mask = (b[:, 0] >= x0) & (b[:, 1] >= top) & (b[:, 2] <= x1) & (b[:, 3] <= bottom)
+        else:
+            mask = (b[:, 0] <= x1) & (b[:, 2] >= x0) & (b[:, 1] <= bottom) & (b[:, 3] >= top)
+        return items[mask]
+
+    def query_point(self,
+                    x: float,
+                    y: float,
+                    tolerance: float = 0.0,
+                    kinds: Optional[Iterable[str]] = None) -> np.ndarray:
+        """Items whose box lies within ``tolerance`` of ``(x, y)``."""
+        return self.query_box(x - tolerance, y - tolerance, x + tolerance, y + tolerance, kinds)
+
+    def distances(self, items: np.ndarray, x: float, y: float) -> np.ndarray:
+        """Euclidean distance from ``(x, y)`` to each item's box (0 inside)."""
+        b = self.boxes[items]
+        dx = np.maximum(np.maximum(b[:, 0] - x, x - b[:, 2]), 0)
+        dy = np.maximum(np.maximum(b[:, 1] - y, y - b[:, 3]), 0)
+        return np.hypot(dx, dy)
+
+    def nearest(self,
+                x: float,
+                y: float,
+                k: int = 1,
+                kinds: Optional[Iterable[str]] = None,
+                max_distance: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """The ``k`` items closest to ``(x, y)`` as ``(items, distances)``, nearest first.
+
+        Searches outward ring by ring; a hit is final once it is closer than
+        the part of the page already covered.
+        """
+        rows, cols = self.grid_shape
+        reach = self.cell_size
+        gx0, gy0 = self.origin
+        gx1, gy1 = gx0 + cols * self.cell_size, gy0 + rows * self.cell_size
+        full = float(np.hypot(max(abs(x - gx0), abs(x - gx1)), max(abs(y - gy0), abs(y - gy1))))
+        limit = full if max_distance is None else min(max_distance, full)
+        while True:
+            radius = min(reach, limit)
+            items = self._filter_kinds(self._candidates(x - radius, y - radius, x + radius, y + radius), kinds)
+            dist = self.distances(items, x, y)
+            keep = dist <= radius
+            items, dist = items[keep], dist[keep]
+            if len(items) >= k or radius >= limit:
+                order = np.argsort(dist, kind="stable")[:k]
+                return items[order], dist[order]
+            reach *= 2
+
+    def intersecting_pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Every pair ``(a, b)`` with ``a < b`` whose boxes intersect, edges included.
+
+        Only items sharing a bucket are compared, so the cost follows bucket
+        occupancy rather than the square of the item count.
+        """
+        counts = np.diff(self.cell_start)
+        entry_cell = np.repeat(np.arange(len(counts)), counts)
+        per_entry = counts[entry_cell]
+        first = np.repeat(np.arange(len(self.cell_items), dtype=np.int64), per_entry)
+        local = np.arange(len(first), dtype=np.int64) - np.repeat(np.cumsum(per_entry) - per_entry, per_entry)
+        second = self.cell_start[entry_cell[first]] + local
+        a, b = self.cell_items[first].astype(np.int64), self.cell_items[second].astype(np.int64)
+        keep = a < b
+        a, b = a[keep], b[keep]
+        ba, bb = self.boxes[a], self.boxes[b]
+        hit = (ba[:, 0] <= bb[:, 2]) & (bb[:, 0] <= ba[:, 2]) & (ba[:, 1] <= bb[:, 3]) & (bb[:, 1] <= ba[:, 3])
+        # Pairs spanning several cells turn up once per shared cell.
+        pairs = np.unique(a[hit] * len(self.boxes) + b[hit])
+        return pairs // len(self.boxes), pairs % len(self.boxes)
+
+    def resolve(self, items: Sequence[int]) -> List[Tuple[str, int]]:
+        """``(kind, element index)`` pairs for item numbers returned by a query."""
+        return [(KINDS[self.kinds[i]], int(self.ids[i])) for i in items]
+
+    def stats(self) -> Dict[str, float]:
+        rows, cols = self.grid_shape
+        return {
+            "items": len(self.boxes),
+            "cells": rows * cols,
+            "cell_size": self.cell_size,
+            "entries": len(self.cell_items),
+        }
+
+
+def index_path(page_path: Path) -> Path:
+    """Where the index for ``page_NNN.json``/``.npz`` is kept: ``page_NNN.sidx.npz``."""
+    return page_path.with_name(f"{page_path.stem}.sidx.npz")
+
+
+def load_or_build(page_path: Path, cell_size: Optional[float] = None) -> SpatialIndex:
+    """Load the saved index beside ``page_path``, rebuilding it if missing or stale."""
+    page_path = Path(page_path)
+    path = index_path(page_path)
+    if path.exists() and path.stat().st_mtime >= page_path.stat().st_mtime:
+        return SpatialIndex.load(path)
+    index = SpatialIndex.build(PageGeometry.open(page_path), cell_size)
+    index.save(path)
+    return index
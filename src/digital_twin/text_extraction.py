@@ -0,0 +1,198 @@
+"""Local component, wire-number and cross-reference extraction from the PDF text layer."""
+from __future__ import annotations
+
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .geometry import PageGeometry, page_columns
+from .grid import HEADER_BAND, MARGIN_BAND, GridResolver, get_grid_resolver
+from .spatial_index import SpatialIndex
+
+# Designator prefixes from the symbol legend, mapped to the legend's English names.
+COMPONENT_TYPES: Dict[str, str] = {
+    "MCB": "Molded Case Circuit Breaker",
+    "ELB": "Earth Leakage Breaker",
+    "CP": "Circuit Protector",
+    "F": "Fuse",
+    "TH": "Thermal Overload Relay",
+    "MC": "Magnetic Contactor",
+    "CR": "Auxiliary Relay",
+    "TR": "Timer",
+    "SS": "Selector Switch",
+    "CS": "Control Switch",
+    "PB": "Push Button Switch",
+    "PBL": "Illuminated Push Button Switch",
+    "ESPB": "Emergency Stop Push Button",
+    "KS": "Key Switch",
+    "SP": "Plug Switch",
+    "SLS": "Safety Switch",
+    "LS": "Limit Switch",
+    "PS": "Pressure Switch",
+    "FL": "Flow Switch",
+    "SOL": "Solenoid Valve",
+    "M": "Induction Motor",
+    "T": "Transformer",
+    "PL": "Pilot Lamp",
+    "LED": "LED Lamp",
+    "DS": "Disconnect Switch",
+    "CON": "Receptacle",
+}
+
+# Designator numbers run to three digits; four-digit labels are wire numbers (T1500).
+COMPONENT_RE = re.compile(r"^(?P<prefix>[A-Z]{1,4})-?(?P<number>\d{1,3}[A-Z]{0,2})$")
+# Four-digit wire numbers, optionally prefixed by a phase/bus letter group (R1510, PLED24).
+WIRE_RE = re.compile(r"^(?:[A-Z]{1,4})?\d{4}$|^[A-Z]{2,4}\d{2,3}$")
+DESIGNATOR_NUMBER_RE = re.compile(r"^\d{1,3}[A-Z]{0,2}$")
+NUMBER_RE = re.compile(r"^\d{1,3}$")
+
+# Everything below this fraction of the page height is title block.
+TITLE_BLOCK_BAND = 0.92
+
+
+def normalize(text: str) -> str:
+    """Fold full-width letters and digits to ASCII and upper-case them."""
+    return unicodedata.normalize("NFKC", text).strip().upper()
+
+
+def _box(words, index: int) -> List[float]:
+    return [round(float(words.x0[index]), 2), round(float(words.top[index]), 2),
+            round(float(words.x1[index]), 2), round(float(words.bottom[index]), 2)]
+
+
+def _stacked_below(index: SpatialIndex, words, i: int) -> np.ndarray:
+    """Words directly under word ``i`` (overlapping horizontally, within one line height)."""
+    height = float(words.bottom[i] - words.top[i])
+    hits = index.query_box(float(words.x0[i]), float(words.bottom[i]) - height * 0.25,
+                           float(words.x1[i]), float(words.bottom[i]) + height * 1.5)
+    hits = hits[hits != i]
+    return hits[np.argsort(words.top[hits])]
+
+
+def extract_candidates(page: PageGeometry,
+                       resolver: Optional[GridResolver] = None,
+                       document: Optional[str] = None) -> dict:
+    """Candidate components, wire numbers and cross references for one page.
+
+    The result mirrors the model's extraction schema, with a ``bbox`` on each
+    item and ``"source": "text"``. Designators split over two stacked words
+    (``CR`` above ``150``) are joined; cross references are stacked number
+    pairs read as page over line.
+    """
+    words = page.words
+    texts = [normalize(t) for t in words.texts()]
+    index = SpatialIndex.from_boxes(
+        np.column_stack([words.x0, words.top, words.x1, words.bottom]),
+        np.zeros(len(words), dtype=np.uint8),
+        np.arange(len(words), dtype=np.int32),
+    )
+    cx = (words.x0 + words.x1) / 2
+    cy = (words.top + words.bottom) / 2
+    in_body = ((cy > page.height * HEADER_BAND) & (cy < page.height * TITLE_BLOCK_BAND)
+               & (cx > page.width * MARGIN_BAND) & (cx < page.width * (1 - MARGIN_BAND)))
+
+    components: List[dict] = []
+    wires: List[dict] = []
+    cross_references: List[dict] = []
+    consumed = set()
+    seen: set[Tuple[str, float, float]] = set()
+
+    for i, text in enumerate(texts):
+        if i in consumed or not in_body[i]:
+            continue
+        key = (text, round(float(words.x0[i]), 1), round(float(words.top[i]), 1))
+        if key in seen:
+            continue  # The text layer sometimes repeats a word at the same spot.
+        seen.add(key)
+        box = _box(words, i)
+
+        if text in COMPONENT_TYPES or NUMBER_RE.match(text):
+            below = [j for j in _stacked_below(index, words, i) if j not in consumed]
+            lower = texts[below[0]] if below else ""
+            if text in COMPONENT_TYPES and DESIGNATOR_NUMBER_RE.match(lower):
+                j = below[0]
+                consumed.add(j)
+                lower_box = _box(words, j)
+                box = [min(box[0], lower_box[0]), box[1], max(box[2], lower_box[2]), lower_box[3]]
+                text = text + lower
+            elif NUMBER_RE.match(text) and NUMBER_RE.match(lower):
+                j = below[0]
+                consumed.add(j)
+                cross_references.append({
+                    "direction": None,
+                    "page": int(text),
+                    "line": int(lower),
+                    "bbox": box,
+                })
+                continue
+
+        match = COMPONENT_RE.match(text)
+        # One-letter prefixes with a single digit are phase labels (T1), not devices.
+        if match and match["prefix"] in COMPONENT_TYPES and len(match["prefix"] + match["number"]) > 2:
+            components.append({
+                "id": f"{match['prefix']}{match['number']}",
+                "type": COMPONENT_TYPES[match["prefix"]],
+                "bbox": box,
+            })
+        elif WIRE_RE.match(text):
+            wires.append({
+                "wire_number": text,
+                "bbox": box,
+            })
+
+    # Resolve every grid position in one vectorized pass.
+    items = components + wires + cross_references
+    template = (resolver or get_grid_resolver()).for_page(page, document)
+    positions = template.resolve_boxes([item["bbox"] for item in items]) if template and items else []
+    for item, position in zip(items, positions):
+        item["grid_position"] = str(position)
+    for item in items[len(positions):]:
+        item["grid_position"] = None
+
+    return {
+        "page": page.page,
+        "source": "text",
+        "components": components,
+        "wires": wires,
+        "cross_references": cross_references,
+    }
+
+
+def page_from_pdf(pdf_path: Path, page_number: int) -> PageGeometry:
+    """Read just the words of one PDF page into a :class:`PageGeometry`."""
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        if not 1 <= page_number <= len(pdf.pages):
+            raise ValueError(f"Page {page_number} out of range (1-{len(pdf.pages)}).")
+        page = pdf.pages[page_number - 1]
+        page_rec = {
+            "page": page_number,
+            "width": page.width,
+            "height": page.height,
+            "words": page.extract_words(keep_blank_chars=False, use_text_flow=True),
+        }
+    return PageGeometry(page_columns(page_rec))
+
+
+def candidates_from_pdf(pdf_path: Path, page_number: int, document: Optional[str] = None) -> dict:
+    return extract_candidates(page_from_pdf(pdf_path, page_number), document=document)
+
+
+def prompt_hint(candidates: dict) -> str:
+    """Summarize text-layer candidates for the extraction prompt."""
+    if not (candidates["components"] or candidates["wires"]):
+        return ""
+    components = sorted({f"{c['id']}@{c['grid_position']}" for c in candidates["components"]})
+    wires = sorted({w["wire_number"] for w in candidates["wires"]})
+    lines = [
+        "",
+        "The page's text layer contains these labels (designator@col-row). Use them",
+        "verbatim as IDs and wire numbers; add anything drawn but not listed.",
+        f"Components: {', '.join(components) or 'none'}",
+        f"Wire numbers: {', '.join(wires) or 'none'}",
+    ]
+    return "\n".join(lines)
@@ -0,0 +1,126 @@
+"""Depth-limited circuit tracing over a :class:`NetlistGraph`."""
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from .netlist import EDGE_KINDS, NODE_KINDS, NetlistGraph, normalize_designator
+
+# Only these node kinds are reported as trace endpoints; anchors appear inside paths.
+TARGET_KINDS = ("component", "wire")
+
+
+def _step(graph: NetlistGraph, node: int, via: Optional[str] = None, page: Optional[int] = None) -> dict:
+    kind, _, key = graph.keys[node].partition(":")
+    step = {"kind": kind, "key": key}
+    if kind in ("line", "page"):
+        parts = key.split(":")
+        step = {"kind": kind, "doc": parts[0], "page": int(parts[1])}
+        if kind == "line":
+            step["line"] = int(parts[2])
+    if via is not None:
+        step["via"] = via
+        step["evidence_page"] = page
+    return step
+
+
+def trace(graph: NetlistGraph,
+          start: Sequence[int],
+          max_depth: int = 3,
+          edge_kinds: Optional[Iterable[str]] = None,
+          max_nodes: int = 500) -> dict:
+    """Breadth-first trace from ``start``, returning a shortest path to every reached item.
+
+    ``max_depth`` counts edges, so line anchors and cross references use up
+    depth like any other hop. Each path step records the edge it was reached
+    by and the page that edge was read from. The search stops expanding once
+    ``max_nodes`` nodes have been visited and reports ``truncated``.
+    """
+    allowed = None
+    if edge_kinds is not None:
+        allowed = np.zeros(len(EDGE_KINDS), dtype=bool)
+        allowed[[EDGE_KINDS.index(kind) for kind in edge_kinds]] = True
+
+    depth: Dict[int, int] = {node: 0 for node in start}
+    parent: Dict[int, tuple] = {}
+    queue = deque(start)
+    truncated = False
+    while queue:
+        node = queue.popleft()
+        if depth[node] >= max_depth:
+            continue
+        neighbours, kinds, pages = graph.neighbors(node)
+        for target, kind, page in zip(neighbours.tolist(), kinds.tolist(), pages.tolist()):
+            if target in depth or (allowed is not None and not allowed[kind]):
+                continue
+            if len(depth) >= max_nodes:
+                truncated = True
+                queue.clear()
+                break
+            depth[target] = depth[node] + 1
+            parent[target] = (node, EDGE_KINDS[kind], page)
+            queue.append(target)
+
+    target_codes = {NODE_KINDS.index(kind) for kind in TARGET_KINDS}
+    reached = []
+    for node, hops in sorted(depth.items(), key=lambda item: (item[1], item[0])):
+        if hops == 0 or graph.node_kind[node] not in target_codes:
+            continue
+        path = []
+        current = node
+        while current in parent:
+            previous, via, page = parent[current]
+            path.append(_step(graph, current, via, page))
+            current = previous
+        path.append(_step(graph, current))
+        path.reverse()
+        reached.append({**_step(graph, node), "depth": hops, "path": path})
+
+    return {
+        "start": [_step(graph, node) for node in start],
+        "max_depth": max_depth,
+        "visited": len(depth),
+        "truncated": truncated,
+        "results": reached,
+    }
+
+
+class TraceCache:
+    """LRU of trace results; keys include the graph version, so rebuilds invalidate them."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+            return result
+
+    def put(self, key: Hashable, result: dict) -> None:
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def start_nodes(graph: NetlistGraph,
+                components: Sequence[str] = (),
+                wires: Sequence[str] = ()) -> tuple[List[int], List[str]]:
+    """Resolve designators and wire numbers to nodes; returns ``(nodes, missing)``."""
+    nodes, missing = [], []
+    for kind, values in (("component", components), ("wire", wires)):
+        for value in values:
+            node = graph.node(f"{kind}:{normalize_designator(value)}")
+            if node is None:
+                missing.append(value)
+            elif node not in nodes:
+                nodes.append(node)
+    return nodes, missing
@@ -0,0 +1,328 @@
+"""Persistent ledger of model calls: tokens, latency, cost and per-machine budgets."""
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+# USD per million tokens: (prompt, cached prompt, response). List prices for
+# prompts under 200k tokens; entries match by prefix of the bare model name.
+MODEL_PRICES: Dict[str, tuple] = {
+    "gemini-2.5-pro": (1.25, 0.31, 10.00),
+    "gemini-2.5-flash-lite": (0.10, 0.025, 0.40),
+    "gemini-2.5-flash": (0.30, 0.075, 2.50),
+}
+# Assumed size of a page call before the ledger has seen any.
+DEFAULT_CALL_TOKENS = 8000
+# Recent successful calls averaged for estimates.
+ESTIMATE_WINDOW = 200
+
+# Query parameter name -> column.
+GROUP_COLUMNS = {
+    "machine": "machine_id",
+    "day": "day",
+    "model": "model",
+    "document": "doc_id",
+    "kind": "kind",
+    "job": "job_id",
+}
+RECORD_FIELDS = (
+    "machine_id", "doc_id", "doc_sha256", "job_id", "page", "kind", "model", "status",
+    "cache_hit", "prompt_tokens", "response_tokens", "cached_tokens", "latency_ms", "error",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY,
+    at REAL NOT NULL,
+    day TEXT NOT NULL,
+    machine_id TEXT,
+    doc_id TEXT,
+    doc_sha256 TEXT,
+    job_id TEXT,
+    page INTEGER,
+    kind TEXT NOT NULL,
+    model TEXT NOT NULL,
+    status TEXT NOT NULL,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    response_tokens INTEGER NOT NULL DEFAULT 0,
+    cached_tokens INTEGER NOT NULL DEFAULT 0,
+    latency_ms REAL,
+    cost_usd REAL NOT NULL DEFAULT 0,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS calls_machine_day ON calls (machine_id, day);
+CREATE INDEX IF NOT EXISTS calls_day ON calls (day);
+"""
+
+
+def utc_day(timestamp: Optional[float] = None) -> str:
+    """Budget days run midnight to midnight UTC."""
+    return datetime.fromtimestamp(time.time() if timestamp is None else timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def model_prices(model: str, prices: Optional[Dict[str, tuple]] = None) -> Optional[tuple]:
+    prices = MODEL_PRICES if prices is None else prices
+    name = model.rsplit("/", 1)[-1]
+    # Longest prefix first, so "flash-lite" is not priced as "flash".
+    for prefix in sorted(prices, key=len, reverse=True):
+        if name.startswith(prefix):
+            return prices[prefix]
+    return None
+
+
+def estimate_cost(model: str,
+                  prompt_tokens: int,
+                  response_tokens: int,
+                  cached_tokens: int = 0,
+                  prices: Optional[Dict[str, tuple]] = None) -> float:
+    """USD for one call; ``prompt_tokens`` includes the cached ones. Unknown models cost 0."""
+    rates = model_prices(model, prices)
+    if rates is None:
+        return 0.0
+    prompt_rate, cached_rate, response_rate = rates
+    cached_tokens = min(cached_tokens, prompt_tokens)
+    return ((prompt_tokens - cached_tokens) * prompt_rate + cached_tokens * cached_rate
+            + response_tokens * response_rate) / 1_000_000
+
+
+class BudgetExceeded(Exception):
+    """A model call was refused because it would take a machine past its budget."""
+
+
+@dataclass(frozen=True)
+class UsageBudget:
+    """Daily per-machine limits; ``None`` means unlimited."""
+    daily_tokens: Optional[int] = None
+    daily_cost_usd: Optional[float] = None
+
+    @property
+    def limited(self) -> bool:
+        return self.daily_tokens is not None or self.daily_cost_usd is not None
+
+    def to_dict(self) -> dict:
+        return {"daily_tokens": self.daily_tokens, "daily_cost_usd": self.daily_cost_usd}
+
+
+class UsageLedger:
+    """Append-only SQLite table with one row per model call.
+
+    Rows are written as calls finish, including failed attempts (they are
+    still billed or rate-limited) and result-cache hits (zero tokens, so
+    hit rates show up next to spend). Cost is priced when the row is
+    written, so later price changes do not rewrite history.
+    """
+
+    def __init__(self, path: Path, prices: Optional[Dict[str, tuple]] = None):
+        self.path = path
+        self.prices = MODEL_PRICES if prices is None else prices
+        self._write_lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+    def _row(self, entry: dict) -> tuple:
+        at = entry.get("at") or time.time()
+        values = {name: entry.get(name) for name in RECORD_FIELDS}
+        for name in ("prompt_tokens", "response_tokens", "cached_tokens"):
+            values[name] = int(values[name] or 0)
+        values["cache_hit"] = int(bool(values["cache_hit"]))
+        values["kind"] = values["kind"] or "page"
+        values["status"] = values["status"] or "ok"
+        cost = estimate_cost(values["model"], values["prompt_tokens"], values["response_tokens"],
+                             values["cached_tokens"], self.prices)
+        return (at, utc_day(at), *(values[name] for name in RECORD_FIELDS), cost)
+
+    def record_many(self, entries: Iterable[dict]) -> int:
+        """Append calls; each entry needs ``model`` and may carry any of ``RECORD_FIELDS``."""
+        rows = [self._row(entry) for entry in entries]
+        if not rows:
+            return 0
+        columns = ("at", "day", *RECORD_FIELDS, "cost_usd")
+        sql = f"INSERT INTO calls ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        with self._write_lock, closing(self._connect()) as conn, conn:
+            conn.executemany(sql, rows)
+        return len(rows)
+
+    def record(self, **entry) -> None:
+        self.record_many([entry])
+
+    @staticmethod
+    def _where(machine_id: Optional[str] = None,
+               since: Optional[str] = None,
+               until: Optional[str] = None,
+               model: Optional[str] = None) -> tuple[str, list]:
+        clauses, params = [], []
+        for clause, value in (("machine_id = ?", machine_id), ("day >= ?", since),
+                              ("day <= ?", until), ("model = ?", model)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def summary(self,
+                group_by: Sequence[str] = ("machine", "day", "model"),
+                machine_id: Optional[str] = None,
+                since: Optional[str] = None,
+                until: Optional[str] = None,
+                model: Optional[str] = None) -> List[dict]:
+        """Totals per group; ``since``/``until`` are inclusive ``YYYY-MM-DD`` UTC days."""
+        unknown = [name for name in group_by if name not in GROUP_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown group(s) {unknown}; expected {sorted(GROUP_COLUMNS)}.")
+        columns = [GROUP_COLUMNS[name] for name in group_by]
+        where, params = self._where(machine_id, since, until, model)
+        select = "".join(f"{column} AS {name}, " for name, column in zip(group_by, columns))
+        sql = (
+            f"SELECT {select}"
+            "COUNT(*) AS calls, "
+            "SUM(cache_hit) AS cache_hits, "
+            "SUM(status = 'error') AS errors, "
+            "SUM(prompt_tokens) AS prompt_tokens, "
+            "SUM(response_tokens) AS response_tokens, "
+            "SUM(cached_tokens) AS cached_tokens, "
+            "SUM(prompt_tokens + response_tokens) AS total_tokens, "
+            "SUM(cost_usd) AS cost_usd, "
+            "AVG(CASE WHEN cache_hit = 0 THEN latency_ms END) AS avg_latency_ms, "
+            "MAX(latency_ms) AS max_latency_ms "
+            f"FROM calls{where}"
+        )
+        if columns:
+            sql += f" GROUP BY {', '.join(columns)} ORDER BY {', '.join(columns)}"
+        with closing(self._connect()) as conn:
+            rows = [dict(row) for row in conn.execute(sql, params)]
+        for row in rows:
+            row["cost_usd"] = round(row["cost_usd"] or 0.0, 6)
+            for name in ("avg_latency_ms", "max_latency_ms"):
+                if row[name] is not None:
+                    row[name] = round(row[name], 1)
+        # An ungrouped query over no rows still returns one row of NULL sums.
+        return [row for row in rows if row["calls"]]
+
+    def spent(self, machine_id: Optional[str], day: Optional[str] = None) -> dict:
+        """Tokens, cost and calls charged to ``machine_id`` on ``day`` (default today)."""
+        day = day or utc_day()
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(prompt_tokens + response_tokens), 0), COALESCE(SUM(cost_usd), 0) "
+                "FROM calls WHERE machine_id IS ? AND day = ? AND cache_hit = 0",
+                (machine_id, day),
+            ).fetchone()
+        return {"calls": row[0], "tokens": row[1], "cost_usd": round(row[2], 6)}
+
+    def typical_call(self, machine_id: Optional[str] = None, kind: str = "page",
+                     model: Optional[str] = None) -> dict:
+        """Average tokens and cost of recent successful model calls, for estimates.
+
+        Looks at calls to ``model`` on ``machine_id``, then on all machines.
+        Without history for that model, the token counts of calls to any
+        model are repriced at ``model``; without any history at all,
+        :data:`DEFAULT_CALL_TOKENS` is priced at ``model``.
+        """
+        machine_scopes = ((machine_id,) if machine_id is not None else ()) + (None,)
+        model_scopes = (model, None) if model is not None else (None,)
+        with closing(self._connect()) as conn:
+            for model_scope in model_scopes:
+                for scope in machine_scopes:
+                    row = conn.execute(
+                        "SELECT COUNT(*), AVG(prompt_tokens), AVG(response_tokens), AVG(cached_tokens), "
+                        "AVG(cost_usd) FROM ("
+                        "SELECT prompt_tokens, response_tokens, cached_tokens, cost_usd FROM calls "
+                        "WHERE kind = ? AND status = 'ok' AND cache_hit = 0 AND (? IS NULL OR machine_id = ?) "
+                        "AND (? IS NULL OR model = ?) ORDER BY id DESC LIMIT ?)",
+                        (kind, scope, scope, model_scope, model_scope, ESTIMATE_WINDOW),
+                    ).fetchone()
+                    if not row[0]:
+                        continue
+                    count, prompt, response, cached, cost = row
+                    if model is not None and model_scope is None:
+                        cost = estimate_cost(model, prompt, response, cached or 0, prices=self.prices)
+                    return {"tokens": int(round(prompt + response)), "cost_usd": round(cost, 6), "samples": count}
+        # Without history, assume a typical page prompt with a short answer.
+        response = DEFAULT_CALL_TOKENS // 8
+        cost = estimate_cost(model or "", DEFAULT_CALL_TOKENS - response, response, prices=self.prices)
+        return {"tokens": DEFAULT_CALL_TOKENS, "cost_usd": round(cost, 6), "samples": 0}
+
+    def budget_status(self,
+                      machine_id: Optional[str],
+                      budget: UsageBudget,
+                      planned_tokens: int = 0,
+                      planned_cost_usd: float = 0.0) -> dict:
+        """Today's spend against ``budget``, and whether ``planned`` work would cross it."""
+        spent = self.spent(machine_id)
+        remaining = {
+            "tokens": None if budget.daily_tokens is None else max(0, budget.daily_tokens - spent["tokens"]),
+            "cost_usd": None if budget.daily_cost_usd is None else round(max(0.0, budget.daily_cost_usd - spent["cost_usd"]), 6),
+        }
+        exhausted = remaining["tokens"] == 0 or remaining["cost_usd"] == 0
+        over = ((remaining["tokens"] is not None and planned_tokens > remaining["tokens"])
+                or (remaining["cost_usd"] is not None and planned_cost_usd > remaining["cost_usd"]))
+        return {
+            "machine_id": machine_id,
+            "day": utc_day(),
+            "limits": budget.to_dict(),
+            "spent": spent,
+            "remaining": remaining,
+            "planned": {"tokens": planned_tokens, "cost_usd": round(planned_cost_usd, 6)},
+            "exhausted": exhausted,
+            "would_exceed": exhausted or over,
+        }
+
+
+class BudgetGuard:
+    """Admit model calls only while today's spend plus calls in flight stays under budget.
+
+    Each call reserves the ledger's typical cost for its kind and model
+    before it starts and releases it when done, by which time the ledger
+    holds the real figure. Use one guard per machine (see
+    ``app.budget_guard``) so concurrent jobs and requests share the
+    reservations and cannot jointly slip past the limit.
+    """
+
+    def __init__(self, ledger: UsageLedger, machine_id: Optional[str], budget: UsageBudget):
+        self.ledger = ledger
+        self.machine_id = machine_id
+        self.budget = budget
+        self._reserved_tokens = 0
+        self._reserved_cost = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def reserve(self, kind: str = "page", model: Optional[str] = None) -> Iterator[None]:
+        """Hold one typical ``kind`` call to ``model`` against the budget; raises :class:`BudgetExceeded`."""
+        if not self.budget.limited:
+            yield
+            return
+        per_call = self.ledger.typical_call(self.machine_id, kind, model)
+        with self._lock:
+            status = self.ledger.budget_status(self.machine_id, self.budget,
+                                               planned_tokens=self._reserved_tokens + per_call["tokens"],
+                                               planned_cost_usd=self._reserved_cost + per_call["cost_usd"])
+            if status["would_exceed"]:
+                raise BudgetExceeded(
+                    f"Daily usage budget for machine {self.machine_id} reached "
+                    f"(spent {status['spent']['tokens']} tokens, ${status['spent']['cost_usd']:.4f}; "
+                    f"about {self._reserved_tokens} tokens, ${self._reserved_cost:.4f} in flight)."
+                )
+            self._reserved_tokens += per_call["tokens"]
+            self._reserved_cost += per_call["cost_usd"]
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._reserved_tokens -= per_call["tokens"]
+                self._reserved_cost -= per_call["cost_usd"]
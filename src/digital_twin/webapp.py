@@ -1,19 +1,28 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime
+import hashlib
 import json
 from pathlib import Path
 from typing import List
 
+import anyio
 from fastapi import FastAPI, File, HTTPException, Request, UploadFile
 from fastapi.responses import FileResponse, HTMLResponse, RedirectResponse
 from fastapi.templating import Jinja2Templates
 
+from .config import get_max_concurrent_uploads, get_upload_buffer_bytes
+
 BASE_DIR = Path(__file__).resolve().parents[2]
 UPLOAD_DIR = BASE_DIR / "uploaded_documents"
 METADATA_FILE = UPLOAD_DIR / "uploads.json"
 
+UPLOAD_BUFFER_BYTES = get_upload_buffer_bytes()
+
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# Requests beyond this wait for a slot instead of all buffering at once.
+upload_slots = asyncio.Semaphore(get_max_concurrent_uploads())
 
 app = FastAPI(title="Digital Twin Document Uploads")
 templates = Jinja2Templates(directory=str(Path(__file__).resolve().parent / "templates"))
@@ -33,7 +42,27 @@ def _save_metadata(records: List[dict]) -> None:
     METADATA_FILE.write_text(json.dumps(records, indent=2))
 
 
-def _record_upload(original_name: str, stored_name: str, content_type: str, size: int) -> dict:
+async def _stream_to_disk(upload_file: UploadFile, destination: Path) -> tuple[str, int]:
+    """Copy an upload to disk one bounded chunk at a time, hashing as it goes.
+
+    Each chunk is written before the next is read, so a request never holds
+    more than ``UPLOAD_BUFFER_BYTES`` and a slow disk throttles the reader.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async with await anyio.open_file(destination, "wb") as out:
+            while chunk := await upload_file.read(UPLOAD_BUFFER_BYTES):
+                hasher.update(chunk)
+                await out.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        destination.unlink(missing_ok=True)
+        raise
+    return hasher.hexdigest(), size
+
+
+def _record_upload(original_name: str, stored_name: str, content_type: str, size: int, sha256: str) -> dict:
     uploaded_at = datetime.utcnow().isoformat() + "Z"
     flagged_for_processing = _contains_schematic_keyword(original_name)
     return {
@@ -41,6 +70,7 @@ def _record_upload(original_name: str, stored_name: str, content_type: str, size
         "stored_name": stored_name,
         "content_type": content_type,
         "size": size,
+        "sha256": sha256,
         "uploaded_at": uploaded_at,
         "flagged_for_processing": flagged_for_processing,
     }
@@ -61,20 +91,21 @@ async def index(request: Request, message: str | None = None):
 
 @app.post("/upload")
 async def upload(files: List[UploadFile] = File(...)):
-    records = _load_metadata()
-    for upload_file in files:
-        stored_name = f"{datetime.utcnow().timestamp():.0f}_{upload_file.filename.replace(' ', '_')}"
-        destination = UPLOAD_DIR / stored_name
-        content = await upload_file.read()
-        destination.write_bytes(content)
-        record = _record_upload(
-            original_name=upload_file.filename,
-            stored_name=stored_name,
-            content_type=upload_file.content_type or "application/octet-stream",
-            size=len(content),
-        )
-        records.append(record)
-    _save_metadata(records)
+    new_records = []
+    async with upload_slots:
+        for upload_file in files:
+            stored_name = f"{datetime.utcnow().timestamp():.0f}_{upload_file.filename.replace(' ', '_')}"
+            destination = UPLOAD_DIR / stored_name
+            sha256, size = await _stream_to_disk(upload_file, destination)
+            record = _record_upload(
+                original_name=upload_file.filename,
+                stored_name=stored_name,
+                content_type=upload_file.content_type or "application/octet-stream",
+                size=size,
+                sha256=sha256,
+            )
+            new_records.append(record)
+    _save_metadata(_load_metadata() + new_records)
     return RedirectResponse(url="/?message=Upload%20complete", status_code=303)
 
 
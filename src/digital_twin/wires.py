@@ -0,0 +1,319 @@
+"""Wire connectivity rebuilt from a page's vector line work."""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .geometry import PageGeometry, page_columns, page_record
+from .grid import GridResolver, get_grid_resolver
+from .netlist import normalize_designator
+from .spatial_index import SpatialIndex
+from .text_extraction import extract_candidates
+
+# Endpoints closer than this (in points) touch; about twice the drawing's 0.59pt stroke.
+JOIN_TOLERANCE = 1.2
+# Segments shorter than this are symbol detail (ticks, arrow heads), not wire.
+MIN_SEGMENT_LENGTH = 1.5
+# Filled curves no larger than this are junction dots.
+DOT_MAX_SIZE = 4.5
+# How far a wire number may sit from its wire, and a terminal from a designator.
+LABEL_REACH = 10.0
+TERMINAL_REACH = 30.0
+
+JUNCTION_KINDS = ("corner", "tee", "dot")
+
+
+def _clusters(values: np.ndarray, tolerance: float) -> np.ndarray:
+    """Cluster ids for 1-D values: sorted neighbours within ``tolerance`` share an id."""
+    order = np.argsort(values, kind="stable")
+    breaks = np.concatenate([[0], (np.diff(values[order]) > tolerance).astype(np.int64)])
+    ids = np.empty(len(values), dtype=np.int64)
+    ids[order] = np.cumsum(breaks)
+    return ids
+
+
+def merge_collinear(across: np.ndarray, start: np.ndarray, end: np.ndarray,
+                    tolerance: float = JOIN_TOLERANCE) -> np.ndarray:
+    """Join axis-aligned segments that lie on one line and touch or overlap.
+
+    Each segment runs from ``start`` to ``end`` (``start <= end``) at offset
+    ``across``; returns the merged runs as ``(n, 3)`` rows of
+    ``across, start, end``. Runs are found in one pass: segments are sorted
+    by line then start, and a new run begins wherever a start lies beyond
+    the running maximum end of its line.
+    """
+    if not len(across):
+        return np.empty((0, 3), dtype=np.float32)
+    group = _clusters(across, tolerance)
+    order = np.lexsort((start, group))
+    group, across, start, end = group[order], across[order], start[order], end[order]
+    # Offsetting each line by more than the page keeps the running max inside its line.
+    offset = group * (float(end.max() - start.min()) + 4 * tolerance + 1)
+    reach = np.maximum.accumulate(end + offset)
+    new_run = np.ones(len(start), dtype=bool)
+    new_run[1:] = (start[1:] + offset[1:]) > reach[:-1] + tolerance
+    firsts = np.nonzero(new_run)[0]
+    counts = np.diff(np.append(firsts, len(start)))
+    return np.column_stack([
+        np.add.reduceat(across, firsts) / counts,
+        np.minimum.reduceat(start, firsts),
+        np.maximum.reduceat(end, firsts),
+    ]).astype(np.float32)
+
+
+def connected_labels(count: int, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Connected-component label (smallest member) of each of ``count`` nodes joined by ``a``–``b`` pairs."""
+    labels = np.arange(count, dtype=np.int64)
+    while True:
+        low = np.minimum(labels[a], labels[b])
+        updated = labels.copy()
+        np.minimum.at(updated, a, low)
+        np.minimum.at(updated, b, low)
+        updated = updated[updated]  # pointer jumping halves the remaining depth
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+@dataclass
+class WireGraph:
+    """Merged wire segments of one page and how they connect.
+
+    ``segments`` rows are ``x0, y0, x1, y1`` with horizontal runs first;
+    ``net`` gives each segment's net number. Junctions are ``x, y`` points
+    with a kind from :data:`JUNCTION_KINDS`; crossings without a dot are not
+    junctions.
+    """
+    page: int
+    segments: np.ndarray
+    net: np.ndarray
+    junctions: np.ndarray
+    junction_kind: np.ndarray
+    terminals: np.ndarray
+    terminal_net: np.ndarray
+    labels: List[dict]
+    terminal_components: List[Optional[str]]
+    grid_positions: List[Optional[str]]
+
+    @property
+    def net_count(self) -> int:
+        return int(self.net.max()) + 1 if len(self.net) else 0
+
+    def nets(self) -> List[dict]:
+        results = []
+        for number in range(self.net_count):
+            members = np.nonzero(self.net == number)[0]
+            box = self.segments[members]
+            ends = np.nonzero(self.terminal_net == number)[0]
+            results.append({
+                "net": number,
+                "wire_numbers": sorted({label["wire_number"] for label in self.labels if label["net"] == number}),
+                "segments": len(members),
+                "bbox": [round(float(v), 2) for v in (
+                    min(box[:, 0].min(), box[:, 2].min()), min(box[:, 1].min(), box[:, 3].min()),
+                    max(box[:, 0].max(), box[:, 2].max()), max(box[:, 1].max(), box[:, 3].max()),
+                )],
+                "components": sorted({self.terminal_components[i] for i in ends if self.terminal_components[i]}),
+                "grid_position": self.grid_positions[number],
+            })
+        return results
+
+    def wires(self) -> List[dict]:
+        """Labelled nets in the extraction schema's ``wires`` shape."""
+        results = []
+        for net in self.nets():
+            components = net["components"]
+            for number in net["wire_numbers"]:
+                results.append({
+                    "wire_number": number,
+                    "from": components[0] if components else None,
+                    "to": components[1] if len(components) > 1 else None,
+                    "components": components,
+                    "grid_position": net["grid_position"],
+                })
+        return results
+
+    def to_dict(self) -> dict:
+        counts = np.bincount(self.junction_kind, minlength=len(JUNCTION_KINDS)) if len(self.junction_kind) else [0] * 3
+        return {
+            "page": self.page,
+            "source": "vector",
+            "segments": len(self.segments),
+            "junctions": {kind: int(n) for kind, n in zip(JUNCTION_KINDS, counts)},
+            "nets": self.nets(),
+            "wires": self.wires(),
+        }
+
+
+def _meeting_pairs(h: np.ndarray, v: np.ndarray, tol: float) -> Tuple[np.ndarray, np.ndarray]:
+    """``(h indices, v indices)`` of horizontal ``(y, x0, x1)`` and vertical ``(x, y0, y1)`` runs that meet."""
+    if not len(h) or not len(v):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    boxes = np.concatenate([
+        np.column_stack([h[:, 1] - tol, h[:, 0], h[:, 2] + tol, h[:, 0]]),
+        np.column_stack([v[:, 0], v[:, 1] - tol, v[:, 0], v[:, 2] + tol]),
+    ])
+    kinds = np.repeat(np.array([0, 1], dtype=np.uint8), (len(h), len(v)))
+    index = SpatialIndex.from_boxes(boxes, kinds, np.arange(len(boxes), dtype=np.int32))
+    a, b = index.intersecting_pairs()
+    # Horizontal runs come first, so a cross pair always has a < len(h) <= b.
+    cross = (a < len(h)) & (b >= len(h))
+    hi, vi = a[cross], b[cross] - len(h)
+    order = np.lexsort((vi, hi))
+    return hi[order], vi[order]
+
+
+def reconstruct_wires(page: PageGeometry,
+                      candidates: Optional[dict] = None,
+                      resolver: Optional[GridResolver] = None,
+                      document: Optional[str] = None) -> WireGraph:
+    """Rebuild wire nets from the page's horizontal and vertical lines.
+
+    Collinear pieces are merged into runs; a horizontal and a vertical run
+    connect where they form a corner or a T-join, or where they cross at a
+    junction dot. Wire numbers attach to the nearest run within
+    :data:`LABEL_REACH`; free run ends (terminals) pick up the nearest
+    component designator within :data:`TERMINAL_REACH`. Diagonal lines
+    belong to symbols and are ignored.
+    """
+    if candidates is None:
+        candidates = extract_candidates(page, resolver, document)
+    lines = page.lines
+    x0, y0 = np.asarray(lines.x0, dtype=np.float32), np.asarray(lines.y0, dtype=np.float32)
+    x1, y1 = np.asarray(lines.x1, dtype=np.float32), np.asarray(lines.y1, dtype=np.float32)
+    dx, dy = np.abs(x1 - x0), np.abs(y1 - y0)
+    length = np.hypot(dx, dy)
+    horizontal = (dy <= JOIN_TOLERANCE / 2) & (length >= MIN_SEGMENT_LENGTH)
+    vertical = (dx <= JOIN_TOLERANCE / 2) & (length >= MIN_SEGMENT_LENGTH) & ~horizontal
+
+    h = merge_collinear((y0[horizontal] + y1[horizontal]) / 2,
+                        np.minimum(x0, x1)[horizontal], np.maximum(x0, x1)[horizontal])
+    v = merge_collinear((x0[vertical] + x1[vertical]) / 2,
+                        np.minimum(y0, y1)[vertical], np.maximum(y0, y1)[vertical])
+    segments = np.concatenate([
+        np.column_stack([h[:, 1], h[:, 0], h[:, 2], h[:, 0]]),
+        np.column_stack([v[:, 0], v[:, 1], v[:, 0], v[:, 2]]),
+    ]).astype(np.float32)
+
+    # Horizontal and vertical runs that meet, found through the grid buckets:
+    # each run's box is stretched by the tolerance along its own axis, so two
+    # boxes intersect exactly when the runs meet. Then, at whose ends?
+    tol = JOIN_TOLERANCE
+    hi, vi = _meeting_pairs(h, v, tol)
+    hy, hx0, hx1 = h[hi, 0], h[hi, 1], h[hi, 2]
+    vx, vy0, vy1 = v[vi, 0], v[vi, 1], v[vi, 2]
+    at_h_end = (np.abs(vx - hx0) <= tol) | (np.abs(vx - hx1) <= tol)
+    at_v_end = (np.abs(hy - vy0) <= tol) | (np.abs(hy - vy1) <= tol)
+    px, py = vx, hy
+
+    curves = page.curves
+    if len(curves):
+        size = np.maximum(curves.x1 - curves.x0, curves.bottom - curves.top)
+        dots = (curves.fill & (size <= DOT_MAX_SIZE) & (size > 0)).nonzero()[0]
+        dot_x = ((curves.x0 + curves.x1) / 2)[dots]
+        dot_y = ((curves.top + curves.bottom) / 2)[dots]
+    else:
+        dot_x = dot_y = np.empty(0, dtype=np.float32)
+    near_dot = np.zeros(len(hi), dtype=bool)
+    if len(dot_x) and len(hi):
+        near_dot = ((np.abs(px[:, None] - dot_x[None, :]) <= DOT_MAX_SIZE / 2 + tol)
+                    & (np.abs(py[:, None] - dot_y[None, :]) <= DOT_MAX_SIZE / 2 + tol)).any(axis=1)
+    # A crossing with no end at the meeting point is only a connection if dotted.
+    joined = at_h_end | at_v_end | near_dot
+    kind = np.where(near_dot, 2, np.where(at_h_end & at_v_end, 0, 1))[joined]
+
+    net = connected_labels(len(segments), hi[joined], len(h) + vi[joined])
+    _, net = np.unique(net, return_inverse=True)
+
+    # Free ends: segment endpoints not involved in any join.
+    ends = np.concatenate([segments[:, 0:2], segments[:, 2:4]])
+    end_segment = np.concatenate([np.arange(len(segments))] * 2)
+    joint_segment = np.concatenate([hi[joined], len(h) + vi[joined]])
+    joint_x, joint_y = np.tile(px[joined], 2), np.tile(py[joined], 2)
+    used = np.zeros(len(ends), dtype=bool)
+    for end in (joint_segment, joint_segment + len(segments)):
+        used[end[np.hypot(ends[end, 0] - joint_x, ends[end, 1] - joint_y) <= tol]] = True
+    terminals, terminal_net = ends[~used], net[end_segment[~used]]
+
+    index = SpatialIndex.from_boxes(
+        np.column_stack([np.minimum(segments[:, 0], segments[:, 2]), np.minimum(segments[:, 1], segments[:, 3]),
+                         np.maximum(segments[:, 0], segments[:, 2]), np.maximum(segments[:, 1], segments[:, 3])]),
+        np.ones(len(segments), dtype=np.uint8),
+        np.arange(len(segments), dtype=np.int32),
+    )
+    labels = []
+    for wire in candidates["wires"]:
+        bx0, btop, bx1, bbottom = wire["bbox"]
+        items, _ = index.nearest((bx0 + bx1) / 2, (btop + bbottom) / 2, k=1, max_distance=LABEL_REACH)
+        if len(items):
+            labels.append({"wire_number": normalize_designator(wire["wire_number"]), "net": int(net[items[0]])})
+
+    terminal_components: List[Optional[str]] = [None] * len(terminals)
+    if candidates["components"] and len(terminals):
+        boxes = np.array([c["bbox"] for c in candidates["components"]], dtype=np.float32)
+        ddx = np.maximum(np.maximum(boxes[None, :, 0] - terminals[:, None, 0], terminals[:, None, 0] - boxes[None, :, 2]), 0)
+        ddy = np.maximum(np.maximum(boxes[None, :, 1] - terminals[:, None, 1], terminals[:, None, 1] - boxes[None, :, 3]), 0)
+        distance = np.hypot(ddx, ddy)
+        nearest = distance.argmin(axis=1)
+        for i in np.nonzero(distance[np.arange(len(terminals)), nearest] <= TERMINAL_REACH)[0]:
+            terminal_components[i] = normalize_designator(candidates["components"][nearest[i]]["id"])
+
+    grid_positions: List[Optional[str]] = [None] * (int(net.max()) + 1 if len(net) else 0)
+    template = (resolver or get_grid_resolver()).for_page(page, document)
+    if template is not None and len(segments):
+        # A net is located by the midpoint of its longest run.
+        run_length = np.abs(segments[:, 2] - segments[:, 0]) + np.abs(segments[:, 3] - segments[:, 1])
+        order = np.lexsort((-run_length, net))
+        longest = order[np.unique(net[order], return_index=True)[1]]
+        mids = (segments[longest, 0:2] + segments[longest, 2:4]) / 2
+        grid_positions = [str(p) for p in template.resolve(mids[:, 0], mids[:, 1])]
+
+    return WireGraph(
+        page=page.page,
+        segments=segments,
+        net=net,
+        junctions=np.column_stack([px[joined], py[joined]]).astype(np.float32),
+        junction_kind=kind.astype(np.uint8),
+        terminals=terminals,
+        terminal_net=terminal_net,
+        labels=labels,
+        terminal_components=terminal_components,
+        grid_positions=grid_positions,
+    )
+
+
+def validate_wires(vector_wires: List[dict], parsed: Optional[dict]) -> dict:
+    """Compare extracted ``wires`` with :meth:`WireGraph.wires` output by wire number."""
+    vector: Dict[str, set] = {}
+    for wire in vector_wires:
+        vector.setdefault(wire["wire_number"], set()).update(wire["components"])
+    extracted: Dict[str, set] = {}
+    for wire in (parsed or {}).get("wires") or []:
+        number = normalize_designator(wire.get("wire_number"))
+        if number:
+            ends = {normalize_designator(wire.get(k)) for k in ("from", "to")}
+            extracted.setdefault(number, set()).update(e for e in ends if e)
+    disagreements = [
+        {"wire_number": number, "extracted": sorted(extracted[number]), "vector": sorted(vector[number])}
+        for number in sorted(set(vector) & set(extracted))
+        if extracted[number] and vector[number] and not extracted[number] & vector[number]
+    ]
+    return {
+        "confirmed": sorted(set(vector) & set(extracted)),
+        "only_vector": sorted(set(vector) - set(extracted)),
+        "only_extracted": sorted(set(extracted) - set(vector)),
+        "endpoint_disagreements": disagreements,
+    }
+
+
+def page_geometry_from_pdf(pdf_path: Path, page_number: int) -> PageGeometry:
+    """Words, lines, rects and curves of one PDF page."""
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        if not 1 <= page_number <= len(pdf.pages):
+            raise ValueError(f"Page {page_number} out of range (1-{len(pdf.pages)}).")
+        return PageGeometry(page_columns(page_record(pdf.pages[page_number - 1], page_number)))
@@ -0,0 +1,140 @@
+"""Batch extraction against a local fake of ``genai.Client``: retry, streaming and rate limiting."""
+import json
+import re
+import threading
+from types import SimpleNamespace
+
+from google.genai import errors
+from pypdf import PdfWriter
+
+from digital_twin import batch
+from digital_twin.batch import get_rate_limiter
+from digital_twin.gemini_registry import GeminiResourceRegistry
+from digital_twin.gemini_service import GeminiExtractor, StepLogger
+
+
+def page_answer(page: int) -> str:
+    return json.dumps({
+        "page": page,
+        "components": [{"id": f"CR{page}00", "grid_position": "3-12"}],
+        "wires": [{"wire_number": f"{page}042", "from": f"CR{page}00", "to": "SOL1B"}],
+        "cross_references": [],
+    })
+
+
+class FakeModels:
+    def __init__(self, fail_once=()):
+        self.fail_once = set(fail_once)
+        self.calls = []
+        self.configs = []
+        self._lock = threading.Lock()
+
+    def generate_content_stream(self, model, contents, config=None):
+        page = int(re.search(r"page (\d+)", str(contents[-1]), re.IGNORECASE).group(1))
+        with self._lock:
+            self.calls.append(page)
+            self.configs.append(config)
+            fail = page in self.fail_once
+            self.fail_once.discard(page)
+        if fail:
+            raise errors.APIError(429, {"error": {"message": "slow down", "status": "RESOURCE_EXHAUSTED"}})
+        text = page_answer(page)
+        # Small chunks, so items have to be stitched together across chunks.
+        for start in range(0, len(text), 7):
+            yield SimpleNamespace(text=text[start:start + 7], usage_metadata=None)
+        yield SimpleNamespace(text=None, usage_metadata=SimpleNamespace(
+            prompt_token_count=100, candidates_token_count=50, cached_content_token_count=80))
+
+
+class FakeFiles:
+    def __init__(self):
+        self.count = 0
+
+    def upload(self, file, config=None):
+        self.count += 1
+        return SimpleNamespace(name=f"files/{self.count}", uri=f"uri{self.count}", mime_type="application/pdf",
+                               expiration_time=None, sha256_hash=None, state="ACTIVE")
+
+    def get(self, name):
+        return SimpleNamespace(name=name, state="ACTIVE")
+
+
+class FakeCaches:
+    def __init__(self):
+        self.live = {}
+
+    def create(self, model, config):
+        cache = SimpleNamespace(name=f"cachedContents/{len(self.live) + 1}", model=model, expire_time=None,
+                                display_name=config.display_name)
+        self.live[cache.name] = cache
+        return cache
+
+    def update(self, name, config):
+        return self.live[name]
+
+    def delete(self, name):
+        self.live.pop(name, None)
+
+    def list(self):
+        return list(self.live.values())
+
+
+class FakeClient:
+    def __init__(self, fail_once=()):
+        self.models = FakeModels(fail_once)
+        self.files = FakeFiles()
+        self.caches = FakeCaches()
+
+
+def reference_files(tmp_path, page_count=3):
+    schematic = tmp_path / "schematic.pdf"
+    writer = PdfWriter()
+    for _ in range(page_count):
+        writer.add_blank_page(width=1190, height=842)
+    with open(schematic, "wb") as f:
+        writer.write(f)
+    legend = tmp_path / "legend.png"
+    legend.write_bytes(b"legend")
+    reading = tmp_path / "reading_instructions.png"
+    reading.write_bytes(b"reading")
+    system = tmp_path / "system_instructions.md"
+    system.write_text("Read the schematic.", encoding="utf-8")
+    return schematic, legend, reading, system
+
+
+def test_batch_retries_and_streams_records(tmp_path, monkeypatch):
+    # No backoff delay between attempts.
+    monkeypatch.setattr(batch.random, "uniform", lambda low, high: 0.0)
+    client = FakeClient(fail_once={2})
+    records = []
+    resets = []
+    extractor = GeminiExtractor(logger=StepLogger(), client=client, registry=GeminiResourceRegistry(),
+                                on_record=lambda page, field, item, attempt: records.append((page, field, attempt)),
+                                on_reset=lambda page, attempt: resets.append((page, attempt)))
+
+    results = list(extractor.run_batch_extraction(*reference_files(tmp_path), max_workers=2,
+                                                  requests_per_minute=6000))
+
+    assert sorted(result["page"] for result in results) == [1, 2, 3]
+    for result in results:
+        assert "error" not in result
+        assert result["parse_status"] == "ok"
+        assert result["parsed"] == json.loads(page_answer(result["page"]))
+    # Page 2 hit a 429 once and was retried; no page was asked twice otherwise.
+    assert sorted(client.models.calls) == [1, 2, 2, 3]
+    retries = [step for step in extractor.logger.steps if step.name == "Retry Page"]
+    assert [step.details["page_number"] for step in retries] == [2]
+    assert all(config.response_schema for config in client.models.configs)
+    # Every list item was handed out while streaming, tagged with its page and
+    # the attempt that sent it; page 2 announced its second attempt first.
+    assert resets == [(2, 2)]
+    assert sorted(records) == sorted(
+        (page, field, 2 if page == 2 else 1) for page in (1, 2, 3) for field in ("components", "wires"))
+    assert {result["page"]: result["attempt"] for result in results} == {1: 1, 2: 2, 3: 1}
+
+
+def test_rate_limiter_is_shared_when_rate_changes():
+    limiter = get_rate_limiter("test-model", 60)
+    same = get_rate_limiter("test-model", 120)
+    assert same is limiter
+    assert limiter.rate == 2.0